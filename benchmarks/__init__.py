@@ -0,0 +1,95 @@
+"""
+Benchmarks for S3File, which run offline against the test app.
+
+The benchmarks use the local S3 mock, the optimized storage backed by the
+local S3 mock, or a boto3 client with stubbed responses, so they require
+neither AWS credentials nor network access.
+"""
+
+import functools
+import json
+import os
+import platform
+import statistics
+
+BACKENDS = ["mock", "optimized", "boto3"]
+
+
+def setup(backend="mock"):
+    """Set up Django with the test app's settings and the given storage backend."""
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "tests.testapp.settings")
+    import django
+
+    django.setup()
+    from django.conf import settings
+    from django.test.utils import override_settings
+
+    # forms with 1000 files exceed Django's default limit of form fields
+    override_settings(DATA_UPLOAD_MAX_NUMBER_FIELDS=None).enable()
+    if backend == "boto3":
+        override_settings(
+            STORAGES={
+                **settings.STORAGES,
+                "default": {"BACKEND": "storages.backends.s3.S3Storage"},
+            }
+        ).enable()
+    elif backend == "optimized":
+        override_settings(
+            STORAGES={
+                **settings.STORAGES,
+                "default": {
+                    "BACKEND": "s3file.storages_optimized.S3OptimizedMockStorage"
+                },
+            }
+        ).enable()
+
+
+@functools.cache
+def stub_client(client):
+    """Return the activated botocore stubber of a client."""
+    from botocore.stub import Stubber
+
+    stubber = Stubber(client)
+    stubber.activate()
+    return stubber
+
+
+def percentile(values, percent):
+    """Return the percentile of a list of values, using linear interpolation."""
+    values = sorted(values)
+    if not values:
+        return None
+    index = (len(values) - 1) * percent / 100
+    lower = int(index)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (index - lower)
+
+
+def summarize(values):
+    """Return the statistics of a list of measurements."""
+    return {
+        "min": min(values),
+        "mean": statistics.fmean(values),
+        "median": statistics.median(values),
+        "stdev": statistics.stdev(values) if len(values) > 1 else 0.0,
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+    }
+
+
+def dump(results, output, **meta):
+    """Write results as JSON, including the environment they were measured in."""
+    import django
+
+    document = {
+        "meta": {
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "django": django.get_version(),
+            "machine": platform.machine(),
+            **meta,
+        },
+        "results": results,
+    }
+    json.dump(document, output, indent=2)
+    output.write("\n")
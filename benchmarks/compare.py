@@ -0,0 +1,64 @@
+"""
+Compare two benchmark results, e.g. of two commits.
+
+Usage::
+
+    python -m benchmarks.compare before.json after.json --threshold 1.2
+
+The command exits with status 1, if any median got slower by more than
+the threshold factor.
+"""
+
+import argparse
+import json
+import sys
+
+
+def load(file):
+    return {
+        (result["name"], json.dumps(result["params"], sort_keys=True)): result
+        for result in json.load(file)["results"]
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("before", type=argparse.FileType())
+    parser.add_argument("after", type=argparse.FileType())
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=None,
+        help="Fail if a median time increases by more than this factor.",
+    )
+    parser.add_argument(
+        "--metric",
+        default="median",
+        help="Time statistic to compare, e.g. median, p95 or mean.",
+    )
+    args = parser.parse_args(argv)
+    before, after = load(args.before), load(args.after)
+
+    regressions = []
+    print(f"{'benchmark':<50} {'before':>12} {'after':>12} {'ratio':>7}")
+    for key in [key for key in before if key in after]:
+        name, params = key
+        old = before[key]["time_ns"][args.metric]
+        new = after[key]["time_ns"][args.metric]
+        ratio = new / old if old else float("inf")
+        print(f"{name + ' ' + params:<50} {old:>12.0f} {new:>12.0f} {ratio:>6.2f}x")
+        if args.threshold is not None and ratio > args.threshold:
+            regressions.append(key)
+    for key in sorted(before.keys() ^ after.keys()):
+        print(f"{' '.join(key):<50} only in {'before' if key in before else 'after'}")
+
+    if regressions:
+        print(
+            f"{len(regressions)} benchmarks regressed by more than {args.threshold}x.",
+            file=sys.stderr,
+        )
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+"""
+Micro-benchmarks for S3File's per-render and per-request hot paths.
+
+Measure the latency and memory allocations per call of the widget's
+``build_attrs`` and ``get_conditions``, as well as the middleware's
+``__call__``, ``get_files_from_storage`` and ``sign_s3_key_prefix``, and
+saving the uploaded files::
+
+    python -m benchmarks.micro --output before.json
+    python -m benchmarks.micro --backend boto3 --output after.json
+    python -m benchmarks.compare before.json after.json
+"""
+
+import argparse
+import gc
+import pathlib
+import sys
+import time
+import tracemalloc
+
+import benchmarks
+
+WIDGETS = [1, 50, 500]
+KEYS = [1, 100, 1000]
+
+
+def measure(func, number=1, repeat=20, setup=None):
+    """
+    Return the time and memory statistics of a function call.
+
+    The optional setup is called before each repetition and its return value
+    is passed to the function, which is called ``number`` times per repetition.
+    """
+    times = []
+    for _ in range(repeat):
+        arg = setup() if setup else None
+        gc.disable()
+        try:
+            start = time.perf_counter_ns()
+            for _ in range(number):
+                func(arg)
+            times.append((time.perf_counter_ns() - start) / number)
+        finally:
+            gc.enable()
+
+    arg = setup() if setup else None
+    tracemalloc.start()
+    try:
+        func(arg)
+        retained, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "time_ns": benchmarks.summarize(times),
+        "peak_bytes": peak,
+        "retained_bytes": retained,
+        "number": number,
+        "repeat": repeat,
+    }
+
+
+class Uploads:
+    """Upload folder with files in the storage the middleware reads from."""
+
+    def __init__(self, backend, count):
+        from s3file.forms import S3FileInputMixin
+        from s3file.middleware import S3FileMiddleware
+        from s3file.storages import storage
+
+        self.backend = backend
+        self.folder = S3FileInputMixin().upload_folder
+        self.signature = S3FileMiddleware.sign_s3_key_prefix(self.folder)
+        self.keys = [f"{self.folder}/file_{i}.txt" for i in range(count)]
+        if backend != "boto3":
+            root = pathlib.Path(storage.base_location)
+            for key in self.keys:
+                path = root / key
+                path.parent.mkdir(parents=True, exist_ok=True)
+                path.write_bytes(b"s3file")
+        else:
+            self.stubber = benchmarks.stub_client(storage.connection.meta.client)
+
+    def stub(self):
+        """Queue a HEAD response for each key, when boto3 is stubbed."""
+        if self.backend == "boto3":
+            for _ in self.keys:
+                self.stubber.add_response(
+                    "head_object",
+                    {"ContentLength": 6, "ContentType": "text/plain", "ETag": '"0"'},
+                )
+
+    def request(self):
+        from django.test import RequestFactory
+
+        self.stub()
+        return RequestFactory().post(
+            "/",
+            data={
+                "s3file": "file",
+                "file": self.keys,
+                "file-s3f-signature": self.signature,
+            },
+        )
+
+
+def bench_sign_s3_key_prefix(backend):
+    from s3file.middleware import S3FileMiddleware
+
+    yield (
+        "sign_s3_key_prefix",
+        {},
+        measure(
+            lambda _: S3FileMiddleware.sign_s3_key_prefix("tmp/s3file/abc"),
+            number=1000,
+        ),
+    )
+    yield (
+        "sign_s3_key_prefix",
+        {"storage_alias": "eu"},
+        measure(
+            lambda _: S3FileMiddleware.sign_s3_key_prefix("tmp/s3file/abc", "eu"),
+            number=1000,
+        ),
+    )
+
+
+def bench_get_conditions(backend):
+    from django import forms
+
+    widget = forms.ClearableFileInput()
+    for accept in [None, "image/*", "image/png,image/jpeg"]:
+        yield (
+            "get_conditions",
+            {"accept": accept},
+            measure(lambda _: widget.get_conditions(accept), number=1000),
+        )
+
+
+def bench_build_attrs(backend):
+    from django import forms
+
+    def setup(count):
+        # new widgets, since the upload folder is cached per widget
+        return lambda: [forms.ClearableFileInput() for _ in range(count)]
+
+    def build_attrs(widgets):
+        for widget in widgets:
+            widget.build_attrs(widget.attrs)
+
+    for count in WIDGETS:
+        yield (
+            "build_attrs",
+            {"widgets": count},
+            measure(build_attrs, setup=setup(count), repeat=10),
+        )
+
+
+def bench_get_files_from_storage(backend):
+    from s3file.middleware import S3FileMiddleware
+
+    for count in KEYS:
+        uploads = Uploads(backend, count)
+
+        def get_files(_, uploads=uploads):
+            for file in S3FileMiddleware.get_files_from_storage(
+                uploads.keys, uploads.signature
+            ):
+                file.close()
+
+        yield (
+            "get_files_from_storage",
+            {"keys": count},
+            measure(get_files, setup=uploads.stub, repeat=10),
+        )
+
+
+def bench_middleware(backend):
+    from django.http import HttpResponse
+
+    from s3file.middleware import S3FileMiddleware
+
+    def get_response(request):
+        for file in request.FILES.getlist("file"):
+            file.close()
+        return HttpResponse()
+
+    middleware = S3FileMiddleware(get_response)
+    for count in KEYS:
+        uploads = Uploads(backend, count)
+        yield (
+            "middleware",
+            {"keys": count},
+            measure(middleware, setup=uploads.request, repeat=10),
+        )
+
+
+def bench_save(backend):
+    from django.core.files.storage import default_storage
+
+    from s3file.middleware import S3FileMiddleware
+
+    if backend == "boto3":
+        return
+    for count in KEYS[:2]:
+        uploads = Uploads(backend, count)
+
+        def save(_, uploads=uploads):
+            for file in S3FileMiddleware.get_files_from_storage(
+                uploads.keys, uploads.signature
+            ):
+                with file:
+                    default_storage.save(f"benchmarks/{file.name}", file)
+
+        yield "save", {"keys": count}, measure(save, repeat=5)
+
+
+BENCHMARKS = {
+    "sign_s3_key_prefix": bench_sign_s3_key_prefix,
+    "get_conditions": bench_get_conditions,
+    "build_attrs": bench_build_attrs,
+    "get_files_from_storage": bench_get_files_from_storage,
+    "middleware": bench_middleware,
+    "save": bench_save,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--backend", choices=benchmarks.BACKENDS, default="mock")
+    parser.add_argument(
+        "-k",
+        "--benchmark",
+        action="append",
+        choices=BENCHMARKS,
+        help="Benchmark to run, may be repeated. Defaults to all benchmarks.",
+    )
+    parser.add_argument(
+        "-o", "--output", type=argparse.FileType("w"), default=sys.stdout
+    )
+    args = parser.parse_args(argv)
+
+    benchmarks.setup(args.backend)
+    results = []
+    for name in args.benchmark or BENCHMARKS:
+        for benchmark, params, stats in BENCHMARKS[name](args.backend):
+            print(
+                f"{benchmark} {params}: {stats['time_ns']['median'] / 1000:.1f} µs,"
+                f" {stats['peak_bytes'] / 1024:.1f} KiB peak",
+                file=sys.stderr,
+            )
+            results.append({"name": benchmark, "params": params, **stats})
+    benchmarks.dump(results, args.output, backend=args.backend)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Multi-threaded stress test of the widget's ``build_attrs`` and the middleware.
+
+Each thread repeatedly renders new widgets or passes requests through the
+middleware, while all threads share the storage, the signer and the settings.
+Every result is checked for correctness, and the throughput is reported per
+thread count, to show how S3File scales on free-threaded Python builds::
+
+    python -m benchmarks.stress --threads 1 2 4 8 --output stress.json
+"""
+
+import argparse
+import concurrent.futures
+import sys
+import sysconfig
+import threading
+import time
+
+import benchmarks
+from benchmarks.micro import Uploads
+
+
+def stress_build_attrs(iterations):
+    from django import forms
+
+    from s3file.middleware import S3FileMiddleware
+
+    # set up the storage and its client before measuring
+    forms.ClearableFileInput().build_attrs({})
+
+    def run():
+        for _ in range(iterations):
+            start = time.perf_counter_ns()
+            widget = forms.ClearableFileInput()
+            attrs = widget.build_attrs({})
+            yield time.perf_counter_ns() - start
+            if attrs["data-s3f-signature"] != S3FileMiddleware.sign_s3_key_prefix(
+                widget.upload_folder
+            ):
+                raise AssertionError(f"Signature mismatch for {widget.upload_folder}")
+
+    return run
+
+
+def stress_middleware(iterations, keys=10):
+    from django.http import HttpResponse
+
+    from s3file.middleware import S3FileMiddleware
+
+    uploads = Uploads("mock", keys)
+
+    def get_response(request):
+        for file in request.FILES.getlist("file"):
+            with file:
+                if file.read() != b"s3file":
+                    raise AssertionError(f"Unexpected content of {file.name}")
+        return HttpResponse()
+
+    middleware = S3FileMiddleware(get_response)
+
+    def run():
+        for _ in range(iterations):
+            request = uploads.request()
+            start = time.perf_counter_ns()
+            middleware(request)
+            yield time.perf_counter_ns() - start
+            if len(request.FILES.getlist("file")) != keys:
+                raise AssertionError("Files missing from request.")
+
+    return run
+
+
+STRESS = {
+    "build_attrs": stress_build_attrs,
+    "middleware": stress_middleware,
+}
+
+
+def stress(run, threads):
+    """Run the generator function in many threads and return all timings."""
+    barrier = threading.Barrier(threads)
+
+    def worker():
+        barrier.wait()
+        return list(run())
+
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(threads) as executor:
+        futures = [executor.submit(worker) for _ in range(threads)]
+        timings = [t for future in futures for t in future.result()]
+    return timings, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--backend", choices=["mock", "optimized"], default="mock")
+    parser.add_argument(
+        "--threads",
+        type=int,
+        nargs="+",
+        default=[1, 2, 4, 8],
+        help="Thread counts to measure.",
+    )
+    parser.add_argument("--iterations", type=int, default=200, help="Calls per thread.")
+    parser.add_argument(
+        "-k",
+        "--benchmark",
+        action="append",
+        choices=STRESS,
+        help="Benchmark to run, may be repeated. Defaults to all benchmarks.",
+    )
+    parser.add_argument(
+        "-o", "--output", type=argparse.FileType("w"), default=sys.stdout
+    )
+    args = parser.parse_args(argv)
+
+    benchmarks.setup(args.backend)
+    results = []
+    for name in args.benchmark or STRESS:
+        run = STRESS[name](args.iterations)
+        baseline = None
+        for threads in args.threads:
+            timings, duration = stress(run, threads)
+            stats = benchmarks.summarize(timings)
+            ops = len(timings) / duration
+            baseline = baseline or ops
+            print(
+                f"{name} threads={threads}: {ops:.0f} ops/s, {ops / baseline:.2f}x,"
+                f" p50 {stats['median'] / 1000:.1f} µs",
+                file=sys.stderr,
+            )
+            results.append({
+                "name": name,
+                "params": {"threads": threads},
+                "time_ns": stats,
+                "ops_per_second": ops,
+                "speedup": ops / baseline,
+            })
+    benchmarks.dump(
+        results,
+        args.output,
+        backend=args.backend,
+        gil_disabled=bool(sysconfig.get_config_var("Py_GIL_DISABLED")),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""
+End-to-end upload throughput with concurrent clients against the local S3 mock.
+
+Each simulated client repeatedly walks through the whole upload flow:
+
+1. render: GET the form with the S3 file inputs,
+2. upload: POST each file to the S3 mock, like the browser does,
+3. submit: POST the S3 keys to the view through the middleware,
+4. save: the view saves the files through the default storage.
+
+The test app is served on the loopback interface, no other network is used::
+
+    python -m benchmarks.throughput --clients 8 --files 3 --size 1048576
+"""
+
+import argparse
+import collections
+import concurrent.futures
+import html
+import html.parser
+import http.client
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+
+import benchmarks
+
+PHASES = ["render", "upload", "submit", "save"]
+
+
+class InputParser(html.parser.HTMLParser):
+    """Collect the attributes of the S3 file inputs of a form."""
+
+    def __init__(self):
+        super().__init__()
+        self.inputs = {}
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == "input" and "data-s3f-signature" in attrs:
+            self.inputs[attrs["name"]] = attrs
+
+
+class Client:
+    """Simulated browser that uploads files through the S3 mock."""
+
+    def __init__(self, address, files, size):
+        self.address = address
+        self.files = files
+        self.content = os.urandom(size)
+        self.timings = collections.defaultdict(list)
+
+    def request(self, method, url, body=None, headers=None):
+        connection = http.client.HTTPConnection(*self.address)
+        try:
+            connection.request(method, url, body, headers or {})
+            response = connection.getresponse()
+            content = response.read()
+        finally:
+            connection.close()
+        if response.status >= 400:
+            raise RuntimeError(f"{method} {url}: {response.status} {content[:200]!r}")
+        return response, content
+
+    def post(self, url, data):
+        from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+
+        return self.request(
+            "POST",
+            url,
+            encode_multipart(BOUNDARY, data),
+            {"Content-Type": MULTIPART_CONTENT},
+        )
+
+    def timed(self, phase, func, *args):
+        start = time.perf_counter_ns()
+        result = func(*args)
+        self.timings[phase].append(time.perf_counter_ns() - start)
+        return result
+
+    def run(self):
+        _, content = self.timed("render", self.request, "GET", "/save/")
+        parser = InputParser()
+        parser.feed(content.decode())
+        attrs = parser.inputs["file"]
+        fields = {
+            name.removeprefix("data-fields-"): value
+            for name, value in attrs.items()
+            if name.startswith("data-fields-")
+        }
+
+        keys = []
+        for _ in range(self.files):
+            file = SimpleFile(f"{uuid.uuid4().hex}.bin", self.content)
+            _, content = self.timed(
+                "upload",
+                self.post,
+                attrs["data-url"],
+                {
+                    **fields,
+                    "success_action_status": "201",
+                    "Content-Type": "application/octet-stream",
+                    "file": file,
+                },
+            )
+            keys.append(
+                html.unescape(re.search(r"<Key>(.*)</Key>", content.decode())[1])
+            )
+
+        response, _ = self.timed(
+            "submit",
+            self.post,
+            "/save/",
+            {
+                "s3file": "file",
+                "file": keys,
+                "file-s3f-signature": attrs["data-s3f-signature"],
+            },
+        )
+        save = re.search(r"save;dur=([\d.]+)", response.getheader("Server-Timing"))
+        self.timings["save"].append(float(save[1]) * 1e6)
+
+
+class SimpleFile:
+    """File-like object that Django's multipart encoder accepts."""
+
+    def __init__(self, name, content):
+        self.name = name
+        self.content = content
+
+    def read(self):
+        return self.content
+
+
+def serve():
+    """Serve the test app in a background thread and return its address."""
+    from django.core.handlers.wsgi import WSGIHandler
+    from django.core.servers.basehttp import ThreadedWSGIServer
+    from django.test.testcases import QuietWSGIRequestHandler
+
+    server = ThreadedWSGIServer(("127.0.0.1", 0), QuietWSGIRequestHandler)
+    server.daemon_threads = True
+    server.set_app(WSGIHandler())
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--clients", type=int, default=4, help="Concurrent clients.")
+    parser.add_argument(
+        "--iterations", type=int, default=10, help="Forms submitted per client."
+    )
+    parser.add_argument("--files", type=int, default=1, help="Files per form.")
+    parser.add_argument(
+        "--size", type=int, default=2**20, help="Size of each file in bytes."
+    )
+    parser.add_argument(
+        "--backend",
+        choices=["mock", "optimized"],
+        default="mock",
+        help="Save the files with the S3 mock or the optimized storage's copy.",
+    )
+    parser.add_argument(
+        "--read-mode",
+        choices=["range", "stream"],
+        help="S3FILE_READ_MODE used by the middleware.",
+    )
+    parser.add_argument(
+        "-o", "--output", type=argparse.FileType("w"), default=sys.stdout
+    )
+    args = parser.parse_args(argv)
+
+    benchmarks.setup(args.backend)
+    from django.test.utils import override_settings
+
+    override_settings(
+        ROOT_URLCONF="benchmarks.urls", S3FILE_READ_MODE=args.read_mode
+    ).enable()
+    server = serve()
+    clients = [
+        Client(server.server_address, args.files, args.size)
+        for _ in range(args.clients)
+    ]
+
+    def run(client):
+        for _ in range(args.iterations):
+            client.run()
+
+    start = time.perf_counter()
+    try:
+        with concurrent.futures.ThreadPoolExecutor(args.clients) as executor:
+            for future in [executor.submit(run, client) for client in clients]:
+                future.result()
+    finally:
+        server.shutdown()
+        server.server_close()
+    duration = time.perf_counter() - start
+
+    params = {
+        "clients": args.clients,
+        "files": args.files,
+        "size": args.size,
+        "read_mode": args.read_mode,
+    }
+    results = []
+    for phase in PHASES:
+        stats = benchmarks.summarize([t for c in clients for t in c.timings[phase]])
+        print(
+            f"{phase:<8} p50 {stats['median'] / 1e6:8.1f} ms"
+            f"  p95 {stats['p95'] / 1e6:8.1f} ms  p99 {stats['p99'] / 1e6:8.1f} ms",
+            file=sys.stderr,
+        )
+        results.append({"name": phase, "params": params, "time_ns": stats})
+
+    uploads = args.clients * args.iterations * args.files
+    throughput = uploads * args.size / duration
+    print(
+        f"{uploads} uploads in {duration:.1f}s, {throughput / 2**20:.1f} MiB/s",
+        file=sys.stderr,
+    )
+    benchmarks.dump(
+        results,
+        args.output,
+        backend=args.backend,
+        uploads=uploads,
+        duration_s=duration,
+        bytes_per_second=throughput,
+    )
+
+
+if __name__ == "__main__":
+    main()
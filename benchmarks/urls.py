@@ -0,0 +1,30 @@
+import time
+
+from django.core.files.storage import default_storage
+from django.http import JsonResponse
+from django.urls import include, path
+
+from tests.testapp.views import MultiExampleFormView
+
+
+class SaveView(MultiExampleFormView):
+    """Save the uploaded files and report the time it took via Server-Timing."""
+
+    def form_valid(self, form):
+        start = time.perf_counter_ns()
+        names = [
+            default_storage.save(f"benchmarks/{file.name}", file)
+            for file in self.request.FILES.getlist("file")
+        ]
+        duration = (time.perf_counter_ns() - start) / 1e6
+        return JsonResponse(
+            {"files": names},
+            status=201,
+            headers={"Server-Timing": f"save;dur={duration:.3f}"},
+        )
+
+
+urlpatterns = [
+    path("save/", SaveView.as_view()),
+    path("", include("tests.testapp.urls")),
+]
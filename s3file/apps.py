@@ -1,7 +1,21 @@
+import threading
+
 from django.apps import AppConfig
 from django.core import checks
 
-from .checks import storage_check
+from .checks import (
+    expires_check,
+    memory_check,
+    middleware_check,
+    optimized_storage_check,
+    pool_check,
+    prefetch_check,
+    resolution_cache_check,
+    storage_check,
+)
+
+# serializes the patching of the ClearableFileInput class across threads
+_bases_lock = threading.Lock()
 
 
 class S3FileConfig(AppConfig):
@@ -10,24 +24,30 @@ class S3FileConfig(AppConfig):
 
     def ready(self):
         from django import forms
-        from django.core.files.storage import FileSystemStorage, default_storage
-        from storages.backends.s3boto3 import S3Boto3Storage
+        from django.core.files.storage import FileSystemStorage, storages
+        from django.utils.module_loading import import_string
 
         from .forms import S3FileInputMixin
-
-        if (
-            isinstance(default_storage, (S3Boto3Storage, FileSystemStorage))
-            and S3FileInputMixin not in forms.ClearableFileInput.__bases__
-        ):
-            forms.ClearableFileInput.__bases__ = (
-                S3FileInputMixin,
-            ) + forms.ClearableFileInput.__bases__
-
-        elif S3FileInputMixin in forms.ClearableFileInput.__bases__:
-            forms.ClearableFileInput.__bases__ = tuple(
-                cls
-                for cls in forms.ClearableFileInput.__bases__
-                if cls is not S3FileInputMixin
-            )
+        from .storages import is_s3_storage_class
+
+        storage_class = import_string(storages.backends["default"]["BACKEND"])
+        enabled = issubclass(storage_class, FileSystemStorage) or is_s3_storage_class(
+            storage_class
+        )
+        with _bases_lock:
+            bases = forms.ClearableFileInput.__bases__
+            if enabled and S3FileInputMixin not in bases:
+                forms.ClearableFileInput.__bases__ = (S3FileInputMixin, *bases)
+            elif not enabled and S3FileInputMixin in bases:
+                forms.ClearableFileInput.__bases__ = tuple(
+                    cls for cls in bases if cls is not S3FileInputMixin
+                )
 
         checks.register(storage_check, checks.Tags.security, deploy=True)
+        checks.register(pool_check, deploy=True)
+        checks.register(optimized_storage_check, deploy=True)
+        checks.register(middleware_check, deploy=True)
+        checks.register(memory_check, deploy=True)
+        checks.register(expires_check, deploy=True)
+        checks.register(prefetch_check, deploy=True)
+        checks.register(resolution_cache_check, deploy=True)
@@ -0,0 +1,188 @@
+"""
+Read-through cache of uploaded files.
+
+Uploaded files are often read several times within seconds, e.g. by a form's
+validators, the view and a signal receiver. With the ``S3FILE_CACHE``
+setting, range files keep the content of recently read objects locally, keyed
+by the object's key and ETag, so that repeated reads don't go back to S3.
+
+The cache is limited to ``S3FILE_CACHE_SIZE`` bytes and evicts the least
+recently used objects first.
+"""
+
+import collections
+import contextlib
+import functools
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import weakref
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+
+class BaseCache:
+    """
+    Least recently used cache of S3 objects with a byte budget.
+
+    Objects larger than ``max_object_size`` bytes, a quarter of the budget by
+    default, are not cached.
+    """
+
+    def __init__(self, max_size=64 * 2**20, max_object_size=None):
+        self.max_size = max_size
+        self.max_object_size = max_object_size or max_size // 4
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def digest(key, etag):
+        return hashlib.sha256(f"{etag}:{key}".encode()).hexdigest()
+
+    def get(self, key, etag):
+        """Return the cached content of an object or ``None``."""
+        digest = self.digest(key, etag)
+        with self.lock:
+            if digest in self.entries:
+                self.entries.move_to_end(digest)
+                data = self.read(digest)
+                if data is not None:
+                    self.hits += 1
+                    return data
+                # the entry is gone, e.g. its file has been deleted
+                self.size -= self.entries.pop(digest)
+            self.misses += 1
+        return None
+
+    def set(self, key, etag, data):
+        """Cache the content of an object, evicting the least recently used ones."""
+        if len(data) > self.max_object_size:
+            return
+        digest = self.digest(key, etag)
+        with self.lock:
+            if digest in self.entries:
+                return
+            self.write(digest, data)
+            self.entries[digest] = len(data)
+            self.size += len(data)
+            self.evict()
+
+    def evict(self):
+        """Evict the least recently used objects, until the cache fits its budget."""
+        while self.size > self.max_size:
+            evicted, size = self.entries.popitem(last=False)
+            self.remove(evicted)
+            self.size -= size
+            self.evictions += 1
+
+    def stats(self):
+        """Return the hit, miss and eviction counters and the cache's size."""
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self.entries),
+                "size": self.size,
+            }
+
+    def read(self, digest):
+        raise NotImplementedError  # pragma: no cover
+
+    def write(self, digest, data):
+        raise NotImplementedError  # pragma: no cover
+
+    def remove(self, digest):
+        raise NotImplementedError  # pragma: no cover
+
+
+class MemoryCache(BaseCache):
+    """Keep cached objects in the process' memory."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.data = {}
+
+    def read(self, digest):
+        return self.data.get(digest)
+
+    def write(self, digest, data):
+        self.data[digest] = data
+
+    def remove(self, digest):
+        self.data.pop(digest, None)
+
+
+class DiskCache(BaseCache):
+    """
+    Keep cached objects in files in the ``S3FILE_CACHE_DIR`` directory.
+
+    Files that were cached by a previous process are reused, and the least
+    recently written ones are evicted to fit the budget. Without a directory,
+    a temporary directory is used, which is deleted with the cache.
+    """
+
+    def __init__(self, *args, directory=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.directory = directory or getattr(settings, "S3FILE_CACHE_DIR", None)
+        if not self.directory:
+            self.directory = tempfile.mkdtemp(prefix="s3file-cache-")
+            weakref.finalize(self, shutil.rmtree, self.directory, ignore_errors=True)
+        os.makedirs(self.directory, exist_ok=True)
+        with os.scandir(self.directory) as entries:
+            # files starting with a dot are still being written
+            files = sorted(
+                (
+                    (entry.stat().st_mtime, entry.name, entry.stat().st_size)
+                    for entry in entries
+                    if entry.is_file() and not entry.name.startswith(".")
+                ),
+            )
+        for _, name, size in files:
+            self.entries[name] = size
+            self.size += size
+        self.evict()
+
+    def read(self, digest):
+        try:
+            with open(os.path.join(self.directory, digest), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def write(self, digest, data):
+        with tempfile.NamedTemporaryFile(
+            dir=self.directory, prefix=".", delete=False
+        ) as f:
+            f.write(data)
+        os.replace(f.name, os.path.join(self.directory, digest))
+
+    def remove(self, digest):
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(os.path.join(self.directory, digest))
+
+
+@functools.cache
+def get_cache():
+    """Return the cache from the ``S3FILE_CACHE`` setting or ``None``."""
+    backend = getattr(settings, "S3FILE_CACHE", None)
+    if not backend:
+        return None
+    return import_string(backend)(
+        max_size=getattr(settings, "S3FILE_CACHE_SIZE", None) or 64 * 2**20
+    )
+
+
+@receiver(setting_changed)
+def reset_cache(*, setting, **kwargs):
+    if setting in ("S3FILE_CACHE", "S3FILE_CACHE_SIZE", "S3FILE_CACHE_DIR"):
+        get_cache.cache_clear()
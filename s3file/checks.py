@@ -1,5 +1,16 @@
-from django.core.checks import Error
-from django.core.files.storage import FileSystemStorage, default_storage
+from django.conf import settings
+from django.core.checks import Error, Warning
+from django.core.files.storage import FileSystemStorage, default_storage, storages
+from django.utils.module_loading import import_string
+
+#: Middleware that may respond before the view is called, e.g. with a redirect.
+SHORT_CIRCUIT_MIDDLEWARE = [
+    "django.middleware.security.SecurityMiddleware",
+    "django.middleware.common.CommonMiddleware",
+]
+
+#: The longest lifetime of AWS Signature Version 4 presigned requests.
+MAX_EXPIRES = 7 * 24 * 60 * 60
 
 
 def storage_check(app_configs, **kwargs):
@@ -12,3 +23,133 @@ def storage_check(app_configs, **kwargs):
             )
         ]
     return []
+
+
+def pool_check(app_configs, **kwargs):
+    from .storages import storage
+
+    client_config = getattr(storage, "client_config", None)
+    concurrency = getattr(settings, "S3FILE_READ_CONCURRENCY", 4)
+    if client_config is not None and client_config.max_pool_connections < concurrency:
+        return [
+            Warning(
+                f"The S3 connection pool of {client_config.max_pool_connections}"
+                f" connections is smaller than S3FILE_READ_CONCURRENCY"
+                f" ({concurrency}).",
+                hint="Please increase the S3FILE_MAX_POOL_CONNECTIONS setting.",
+                id="s3file.W001",
+            )
+        ]
+    return []
+
+
+def optimized_storage_check(app_configs, **kwargs):
+    from .storages import is_s3_storage_class
+
+    storage_class = import_string(storages.backends["default"]["BACKEND"])
+    if not is_s3_storage_class(storage_class):
+        return []
+    from .storages_optimized import S3OptimizedUploadStorage
+
+    if not issubclass(storage_class, S3OptimizedUploadStorage):
+        return [
+            Warning(
+                "The default storage downloads and re-uploads every uploaded file"
+                " when it is saved.",
+                hint="Use S3OptimizedUploadStorage to copy the files within S3.",
+                id="s3file.W002",
+            )
+        ]
+    return []
+
+
+def middleware_check(app_configs, **kwargs):
+    middleware = list(settings.MIDDLEWARE)
+    try:
+        position = middleware.index("s3file.middleware.S3FileMiddleware")
+    except ValueError:
+        return []
+    return [
+        Warning(
+            f"S3FileMiddleware is placed before {name}, which may respond before"
+            f" the view is called.",
+            hint="S3FileMiddleware fetches the uploaded files from S3 for every"
+            " request. Place it after middleware that may skip the view.",
+            id="s3file.W003",
+        )
+        for name in middleware[position + 1 :]
+        if name in SHORT_CIRCUIT_MIDDLEWARE
+    ]
+
+
+def memory_check(app_configs, **kwargs):
+    from .storages import storage
+
+    if getattr(storage, "max_memory_size", None) == 0 and not getattr(
+        settings, "S3FILE_READ_MODE", None
+    ):
+        return [
+            Warning(
+                "Uploaded files are read into memory entirely, since"
+                " AWS_S3_MAX_MEMORY_SIZE is 0.",
+                hint="Set AWS_S3_MAX_MEMORY_SIZE to spool large files to disk,"
+                " or set S3FILE_READ_MODE to read files from S3 on demand.",
+                id="s3file.W004",
+            )
+        ]
+    return []
+
+
+def expires_check(app_configs, **kwargs):
+    from .forms import S3FileInputMixin
+
+    if (expires := S3FileInputMixin().expires) > MAX_EXPIRES:
+        return [
+            Warning(
+                f"Upload policies expire after {expires} seconds, which exceeds"
+                f" the {MAX_EXPIRES} seconds of AWS Signature Version 4.",
+                hint="Uploads are rejected once the signing credentials expired,"
+                " only after the whole file has been transferred. Please lower"
+                " the S3FILE_UPLOAD_EXPIRES setting.",
+                id="s3file.W005",
+            )
+        ]
+    return []
+
+
+def prefetch_check(app_configs, **kwargs):
+    if getattr(settings, "S3FILE_READ_MODE", None) == "range":
+        return []
+    return [
+        Warning(
+            f"{name} only applies to range files.",
+            hint=f'Set S3FILE_READ_MODE to "range" to use the {name} setting.',
+            id="s3file.W006",
+        )
+        for name in ["S3FILE_PREFETCH", "S3FILE_CACHE"]
+        if getattr(settings, name, None)
+    ]
+
+
+def resolution_cache_check(app_configs, **kwargs):
+    if not (alias := getattr(settings, "S3FILE_RESOLUTION_CACHE", None)):
+        return []
+    if not getattr(settings, "S3FILE_READ_MODE", None):
+        return [
+            Warning(
+                "S3FILE_RESOLUTION_CACHE only applies to files opened with a read mode.",
+                hint='Set S3FILE_READ_MODE to "range" or "stream".',
+                id="s3file.W007",
+            )
+        ]
+    backend = settings.CACHES.get(alias, {}).get("BACKEND", "")
+    if backend.endswith((".LocMemCache", ".DummyCache")):
+        return [
+            Warning(
+                f"The {alias!r} cache isn't shared between processes, so retried"
+                " requests, that reach another process, aren't cached.",
+                hint="Set S3FILE_RESOLUTION_CACHE to a shared cache, e.g. Redis.",
+                id="s3file.W008",
+            )
+        ]
+    return []
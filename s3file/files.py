@@ -0,0 +1,590 @@
+import collections
+import concurrent.futures
+import functools
+import io
+import itertools
+import logging
+import mimetypes
+import os
+import struct
+import threading
+import zipfile
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation, TooManyFilesSent
+from django.core.files.base import File
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from . import cache, metrics
+
+logger = logging.getLogger("s3file")
+
+
+def get_object(client, bucket_name, key, start=None, end=None, if_match=None):
+    """
+    Return the GET response for a key, optionally limited to a byte range.
+
+    If ``if_match`` is an ETag, S3 responds with ``412 Precondition Failed``
+    if the object's ETag differs.
+    """
+    params = {"Bucket": bucket_name, "Key": key}
+    if start is not None:
+        params["Range"] = f"bytes={start}-{'' if end is None else end - 1}"
+    if if_match is not None:
+        params["IfMatch"] = if_match
+    return client.get_object(**params)
+
+
+@functools.cache
+def get_prefetch_executor():
+    """Return the thread pool that prefetches uploaded files."""
+    return concurrent.futures.ThreadPoolExecutor(
+        getattr(settings, "S3FILE_READ_CONCURRENCY", 4),
+        thread_name_prefix="s3file-prefetch",
+    )
+
+
+@receiver(setting_changed)
+def reset_prefetch_executor(*, setting, **kwargs):
+    if setting == "S3FILE_READ_CONCURRENCY":
+        get_prefetch_executor.cache_clear()
+
+
+def head_object(client, bucket_name, key):
+    """Return the object's metadata or raise FileNotFoundError."""
+    from botocore.exceptions import ClientError
+
+    try:
+        return client.head_object(Bucket=bucket_name, Key=key)
+    except ClientError as e:
+        if e.response["ResponseMetadata"]["HTTPStatusCode"] == 404:
+            raise FileNotFoundError(f"File does not exist: {key}") from e
+        raise
+
+
+def get_metadata(file):
+    """
+    Return the ``ContentLength`` and ``ContentType`` of a file without reading it.
+
+    For files opened by the middleware, the metadata has already been fetched
+    from S3 when the file was opened, or read from the ``S3FILE_RESOLUTION_CACHE``.
+    """
+    from django.db.models.fields.files import FieldFile
+
+    if isinstance(file, FieldFile):
+        file = file.file
+    if isinstance(file, S3ObjectFile):
+        return file.metadata
+    if obj := getattr(file, "obj", None):
+        # django-storages loads the object's metadata when opening a file
+        return {"ContentLength": obj.content_length, "ContentType": obj.content_type}
+    return {
+        "ContentLength": file.size,
+        "ContentType": getattr(file, "content_type", None)
+        or mimetypes.guess_type(file.name or "")[0],
+    }
+
+
+class ObjectIO(io.RawIOBase):
+    """
+    Read-only raw stream of an S3 object.
+
+    If ``if_match`` is set to the ETag of previously fetched metadata, e.g.
+    from the ``S3FILE_RESOLUTION_CACHE``, all GETs are conditional on it.
+    If the object has changed since, its metadata is fetched again like on a
+    cache miss, and ``on_refresh`` is called with it.
+    """
+
+    if_match = None
+    on_refresh = None
+
+    def __init__(self, client, bucket_name, key, metadata):
+        self.client = client
+        self.bucket_name = bucket_name
+        self.key = key
+        self.name = key
+        self.metadata = metadata
+        self.size = metadata["ContentLength"]
+        self._position = 0
+
+    def get_object(self, start=None, end=None):
+        """Return the GET response for the object, see :func:`get_object`."""
+        from botocore.exceptions import ClientError
+
+        if self.if_match is not None:
+            try:
+                return get_object(
+                    self.client, self.bucket_name, self.key, start, end, self.if_match
+                )
+            except ClientError as e:
+                if e.response["ResponseMetadata"]["HTTPStatusCode"] != 412:
+                    raise
+            self.refresh(head_object(self.client, self.bucket_name, self.key))
+        return get_object(self.client, self.bucket_name, self.key, start, end)
+
+    def validate(self):
+        """Fetch the metadata again, if it may be stale, and replace it if it is."""
+        if self.if_match is not None:
+            metadata = head_object(self.client, self.bucket_name, self.key)
+            if metadata.get("ETag") != self.if_match:
+                self.refresh(metadata)
+
+    def refresh(self, metadata):
+        """Replace stale metadata."""
+        self.metadata = metadata
+        self.size = metadata["ContentLength"]
+        self.if_match = None
+        if self.on_refresh is not None:
+            self.on_refresh(metadata)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_SET:
+            position = offset
+        elif whence == os.SEEK_CUR:
+            position = self._position + offset
+        elif whence == os.SEEK_END:
+            position = self.size + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence!r}")
+        if position < 0:
+            raise ValueError(f"Negative seek position: {position}")
+        self._position = position
+        return position
+
+    def readall(self):
+        return self.read()
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[: len(data)] = data
+        return len(data)
+
+
+class RangeIO(ObjectIO):
+    """
+    Seekable, read-only view of an S3 object that is fetched in byte ranges.
+
+    Data is read in blocks of ``block_size`` bytes and the ``max_blocks`` most
+    recently used blocks are kept in memory. Reads larger than the cache bypass it.
+    """
+
+    _prefetched = None
+
+    def __init__(
+        self, client, bucket_name, key, metadata, block_size, max_blocks, cache=None
+    ):
+        super().__init__(client, bucket_name, key, metadata)
+        self.block_size = block_size
+        self.max_blocks = max_blocks
+        self.blocks = collections.OrderedDict()
+        etag = metadata.get("ETag")
+        self.cache = (
+            cache
+            if cache is not None and etag and self.size <= cache.max_object_size
+            else None
+        )
+        self._cache_lock = threading.Lock()
+
+    def fetch(self, start, end):
+        """Return the bytes between start and end with a single ranged GET."""
+        if self._prefetched is not None:
+            # wait for the prefetch, rather than fetching the same bytes twice
+            data = self._prefetched.result()
+            if end <= len(data):
+                return data[start:end]
+        if self.cache is not None:
+            return self.fetch_cached()[start:end]
+        response = self.get_object(start, end)
+        with response["Body"] as body:
+            return body.read()
+
+    def fetch_cached(self):
+        """Return the whole object from the cache, or fetch and cache it."""
+        etag = self.metadata["ETag"]
+        with self._cache_lock:
+            if (data := self.cache.get(self.key, etag)) is None:
+                response = self.get_object()
+                with response["Body"] as body:
+                    data = body.read()
+                # the metadata may have been refreshed by the GET
+                self.cache.set(self.key, self.metadata["ETag"], data)
+        return data
+
+    def prefetch(self, end, **labels):
+        """Fetch the bytes up to end in the background, until they are read."""
+        if (end := min(end, self.size)) > 0:
+            self._prefetched = get_prefetch_executor().submit(
+                self._prefetch, end, labels
+            )
+
+    def _prefetch(self, end, labels):
+        try:
+            with metrics.timer("prefetch", bytes=end, **labels):
+                response = self.get_object(0, end)
+                with response["Body"] as body:
+                    return body.read()
+        except Exception:
+            logger.warning("Failed to prefetch %r.", self.key, exc_info=True)
+            return b""
+
+    def refresh(self, metadata):
+        self.blocks.clear()
+        super().refresh(metadata)
+
+    def load_blocks(self, first, last):
+        """Fetch all missing blocks between first and last, one GET per gap."""
+        index = first
+        while index <= last:
+            if index in self.blocks:
+                self.blocks.move_to_end(index)
+                index += 1
+                continue
+            gap_end = index
+            while gap_end < last and gap_end + 1 not in self.blocks:
+                gap_end += 1
+            start = index * self.block_size
+            data = self.fetch(start, min((gap_end + 1) * self.block_size, self.size))
+            for i in range(index, gap_end + 1):
+                offset = (i - index) * self.block_size
+                self.blocks[i] = data[offset : offset + self.block_size]
+            index = gap_end + 1
+        while len(self.blocks) > self.max_blocks:
+            self.blocks.popitem(last=False)
+
+    def read(self, size=-1):
+        if self.closed:
+            raise ValueError("I/O operation on closed file.")
+        metadata = self.metadata
+        start = self._position
+        end = self.size if size is None or size < 0 else min(start + size, self.size)
+        if start >= end:
+            return b""
+        data = self.read_range(start, end)
+        if self.metadata is not metadata:
+            # the object has changed, the blocks were fetched with a stale size
+            self.blocks.clear()
+            return self.read(size)
+        self._position = end
+        return data
+
+    def read_range(self, start, end):
+        """Return the bytes between start and end, without moving the position."""
+        first, last = start // self.block_size, (end - 1) // self.block_size
+        if last - first >= self.max_blocks:
+            return self.fetch(start, end)
+        self.load_blocks(first, last)
+        offset = start - first * self.block_size
+        return b"".join(self.blocks[i] for i in range(first, last + 1))[
+            offset : offset + end - start
+        ]
+
+    def close(self):
+        if self._prefetched is not None:
+            self._prefetched.cancel()
+            self._prefetched = None
+        self.blocks.clear()
+        super().close()
+
+
+class MemberIO(ObjectIO):
+    """Read-only view of a file in an uncompressed ZIP archive on S3."""
+
+    def __init__(self, archive, info):
+        super().__init__(
+            archive.client,
+            archive.bucket_name,
+            archive.key,
+            {
+                "ContentLength": info.file_size,
+                "ContentType": mimetypes.guess_type(info.filename)[0]
+                or "application/octet-stream",
+            },
+        )
+        self.archive = archive
+        self.header_offset = info.header_offset
+        self._data_offset = None
+
+    @property
+    def data_offset(self):
+        if self._data_offset is None:
+            # the local header's extra field may differ from the central directory
+            header = self.archive.read_range(
+                self.header_offset, self.header_offset + 30
+            )
+            if header[:4] != b"PK\x03\x04":
+                raise SuspiciousFileOperation("Invalid bundle member header.")
+            name_length, extra_length = struct.unpack("<HH", header[26:30])
+            self._data_offset = self.header_offset + 30 + name_length + extra_length
+        return self._data_offset
+
+    def read(self, size=-1):
+        if self.closed:
+            raise ValueError("I/O operation on closed file.")
+        start = self._position
+        end = self.size if size is None or size < 0 else min(start + size, self.size)
+        if start >= end:
+            return b""
+        data = self.archive.read_range(self.data_offset + start, self.data_offset + end)
+        self._position = end
+        return data
+
+
+class StreamIO(ObjectIO):
+    """
+    Forward-only stream of an S3 object's response body.
+
+    Data is passed through without local buffering. Seeking closes the current
+    response and reads from the new position with a ranged GET.
+    """
+
+    _body = None
+
+    def _open_body(self):
+        self._body = self.get_object(self._position or None)["Body"]
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        position = self._position
+        if super().seek(offset, whence) != position and self._body is not None:
+            self._body.close()
+            self._body = None
+        return self._position
+
+    def read(self, size=-1):
+        if self.closed:
+            raise ValueError("I/O operation on closed file.")
+        if self._position >= self.size:
+            return b""
+        if self._body is None:
+            self._open_body()
+        data = self._body.read(None if size is None or size < 0 else size)
+        self._position += len(data)
+        return data
+
+    def iter_chunks(self, chunk_size):
+        if self._position >= self.size:
+            return
+        if self._body is None:
+            self._open_body()
+        for data in self._body.iter_chunks(chunk_size):
+            self._position += len(data)
+            yield data
+
+    def close(self):
+        if self._body is not None:
+            self._body.close()
+            self._body = None
+        super().close()
+
+
+class S3ObjectFile(File):
+    """Read-only file for an S3 object, opened without downloading its content."""
+
+    def __init__(self, key, storage, name=None, metadata=None):
+        self.key = key
+        self.storage = storage
+        client = storage.connection.meta.client
+        bucket_name = storage.bucket.name
+        if_match = None
+        if metadata is None:
+            metadata = head_object(client, bucket_name, key)
+        else:
+            # the metadata may be stale, e.g. if it has been cached
+            if_match = metadata.get("ETag")
+        super().__init__(
+            self.get_io(client, bucket_name, key, metadata),
+            name or key.rsplit("/", 1)[-1],
+        )
+        self.file.if_match = if_match
+        self.mode = "rb"
+
+    def get_io(self, client, bucket_name, key, metadata):
+        raise NotImplementedError  # pragma: no cover
+
+    @property
+    def obj(self):
+        return self.storage.bucket.Object(self.key)
+
+    @property
+    def metadata(self):
+        return self.file.metadata
+
+    @property
+    def size(self):
+        # the metadata may be refreshed, see ObjectIO.if_match
+        return self.file.size
+
+    @property
+    def content_type(self):
+        return self.metadata.get("ContentType")
+
+    def open(self, mode=None):
+        if mode and mode != self.mode:
+            raise ValueError("Cannot reopen file with a new mode.")
+        self.seek(0)
+        return self
+
+
+class S3RangeFile(S3ObjectFile):
+    """
+    File for an S3 object that only downloads the byte ranges that are read.
+
+    Only the object's metadata is fetched when the file is opened. This allows
+    libraries like Pillow to read an image's header without downloading the
+    whole object.
+    """
+
+    block_size = 64 * 2**10
+    max_blocks = 32
+    part_size = 8 * 2**20
+    concurrency = None
+
+    def get_io(self, client, bucket_name, key, metadata):
+        return RangeIO(
+            client,
+            bucket_name,
+            key,
+            metadata,
+            self.block_size,
+            self.max_blocks,
+            cache.get_cache(),
+        )
+
+    def chunks(self, chunk_size=None):
+        """
+        Read the file from the start, fetching parts with concurrent ranged GETs.
+
+        Up to ``S3FILE_READ_CONCURRENCY`` parts of ``part_size`` bytes are
+        downloaded ahead of the consumer, which bounds the memory used to
+        roughly ``part_size * (S3FILE_READ_CONCURRENCY + 1)`` bytes.
+        """
+        chunk_size = chunk_size or self.DEFAULT_CHUNK_SIZE
+        for data in self._parts():
+            for offset in range(0, len(data), chunk_size):
+                yield data[offset : offset + chunk_size]
+        self.seek(0, os.SEEK_END)
+
+    def _parts(self):
+        starts = iter(range(0, self.size, self.part_size))
+        concurrency = self.concurrency or getattr(
+            settings, "S3FILE_READ_CONCURRENCY", 4
+        )
+        if concurrency < 2 or self.size <= self.part_size:
+            for start in starts:
+                yield self._fetch_part(start)
+            return
+
+        with concurrent.futures.ThreadPoolExecutor(concurrency) as executor:
+            pending = collections.deque(
+                executor.submit(self._fetch_part, start)
+                for start in itertools.islice(starts, concurrency)
+            )
+            try:
+                while pending:
+                    data = pending.popleft().result()
+                    if (start := next(starts, None)) is not None:
+                        pending.append(executor.submit(self._fetch_part, start))
+                    yield data
+            finally:
+                for future in pending:
+                    future.cancel()
+
+    def _fetch_part(self, start):
+        return self.file.fetch(start, min(start + self.part_size, self.size))
+
+    def prefetch(self, max_size, **labels):
+        """
+        Start downloading the file in the background, before it is read.
+
+        Files up to ``max_size`` bytes are downloaded entirely, larger files
+        only their first block. Reads wait for the download to finish, instead
+        of requesting the same bytes again.
+        """
+        self.file.prefetch(
+            self.size if self.size <= max_size else self.block_size, **labels
+        )
+
+
+class S3StreamingFile(S3ObjectFile):
+    """
+    File for an S3 object that streams the response body without buffering.
+
+    Unlike the storage's file, the content is neither copied to a temporary
+    file nor kept in memory, which keeps memory and disk usage constant
+    when a file is read only once, e.g. by a parser.
+    """
+
+    def get_io(self, client, bucket_name, key, metadata):
+        return StreamIO(client, bucket_name, key, metadata)
+
+    def chunks(self, chunk_size=None):
+        self.seek(0)
+        yield from self.file.iter_chunks(chunk_size or self.DEFAULT_CHUNK_SIZE)
+
+    def multiple_chunks(self, chunk_size=None):
+        return True
+
+
+class S3BundleMemberFile(S3ObjectFile):
+    """
+    File in an uncompressed ZIP archive uploaded by ``s3file.js``.
+
+    The member's bytes are read from the archive with ranged GETs, which are
+    shared with the other members of the same archive.
+    """
+
+    # members are copied from the archive by the S3OptimizedUploadStorage
+    obj = None
+
+    def __init__(self, archive, info, name):
+        self.key = archive.key
+        self.storage = archive.storage
+        File.__init__(self, MemberIO(archive.file, info), name)
+        self.mode = "rb"
+
+
+def open_bundle(key, storage):
+    """
+    Return the files in an uncompressed ZIP archive on S3.
+
+    Only the archive's central directory is read. The number of files is
+    limited by the ``DATA_UPLOAD_MAX_NUMBER_FILES`` setting.
+    """
+    from django.http.multipartparser import MultiPartParser
+
+    archive = S3RangeFile(key, storage)
+    try:
+        with zipfile.ZipFile(archive.file) as zip_file:
+            members = [info for info in zip_file.infolist() if not info.is_dir()]
+    except (zipfile.BadZipFile, ValueError) as e:
+        raise SuspiciousFileOperation("Invalid bundle.") from e
+    max_files = settings.DATA_UPLOAD_MAX_NUMBER_FILES
+    if max_files is not None and len(members) > max_files:
+        raise TooManyFilesSent(
+            "The number of files exceeded settings.DATA_UPLOAD_MAX_NUMBER_FILES."
+        )
+    bundle = []
+    for info in members:
+        if info.compress_type != zipfile.ZIP_STORED or info.flag_bits & 0x1:
+            raise SuspiciousFileOperation(
+                "Bundles must not be compressed or encrypted."
+            )
+        if not (name := MultiPartParser.sanitize_file_name(None, info.filename)):
+            raise SuspiciousFileOperation("Bundle member without a filename.")
+        bundle.append(S3BundleMemberFile(archive, info, name))
+    return bundle
+
+
+FILE_CLASSES = {
+    "range": S3RangeFile,
+    "stream": S3StreamingFile,
+}
@@ -1,9 +1,14 @@
 import base64
+import datetime
 import logging
 import pathlib
 import uuid
 
+from django import forms
 from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.templatetags.static import static
+from django.urls import reverse
 from django.utils.functional import cached_property
 from storages.utils import safe_join
 
@@ -54,53 +59,89 @@ except ImportError:
             super().__init__(src, **attributes)
 
 
+from s3file import files, layouts, metrics, validators
 from s3file.middleware import S3FileMiddleware
-from s3file.storages import get_aws_location, storage
+from s3file.storages import get_aws_location, get_storage, route_storage
 
 logger = logging.getLogger("s3file")
 
 
+class atomic_cached_property(cached_property):  # noqa: N801
+    """
+    Cached property that returns the same value to all threads.
+
+    If threads compute the value concurrently, the first value stored wins,
+    where Django's ``cached_property`` would overwrite it.
+    """
+
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+        return instance.__dict__.setdefault(self.name, self.func(instance))
+
+
 class S3FileInputMixin:
     """FileInput that uses JavaScript to directly upload to Amazon S3."""
 
     needs_multipart_form = False
-    upload_path = safe_join(
-        str(get_aws_location()),
-        str(
-            getattr(
-                settings, "S3FILE_UPLOAD_PATH", pathlib.PurePosixPath("tmp", "s3file")
-            )
-        ),
-    )
-    expires = settings.SESSION_COOKIE_AGE
+    max_size = None
+    field_name = None
+
+    @property
+    def upload_path(self):
+        return safe_join(
+            str(get_aws_location()),
+            str(
+                getattr(
+                    settings,
+                    "S3FILE_UPLOAD_PATH",
+                    pathlib.PurePosixPath("tmp", "s3file"),
+                )
+            ),
+        )
+
+    @property
+    def expires(self):
+        return (
+            getattr(settings, "S3FILE_UPLOAD_EXPIRES", None)
+            or settings.SESSION_COOKIE_AGE
+        )
+
+    @atomic_cached_property
+    def storage_alias(self):
+        return route_storage()
+
+    @property
+    def storage(self):
+        return get_storage(self.storage_alias)
 
     @property
     def bucket_name(self):
-        return storage.bucket.name
+        return self.storage.bucket.name
 
     @property
     def client(self):
-        return storage.connection.meta.client
+        return self.storage.connection.meta.client
 
     def build_attrs(self, *args, **kwargs):
         attrs = super().build_attrs(*args, **kwargs)
 
-        accept = attrs.get("accept")
-        response = self.client.generate_presigned_post(
-            self.bucket_name,
-            str(pathlib.PurePosixPath(self.upload_folder, "${filename}")),
-            Conditions=self.get_conditions(accept),
-            ExpiresIn=self.expires,
-        )
-
+        upload = self.presign(attrs.get("accept"))
         defaults = {
-            f"data-fields-{key}": value for key, value in response["fields"].items()
+            f"data-fields-{key}": value for key, value in upload["fields"].items()
         }
-        defaults["data-url"] = response["url"]
-        # we sign upload location, and will only accept files within the same folder
-        defaults["data-s3f-signature"] = S3FileMiddleware.sign_s3_key_prefix(
-            self.upload_folder
-        )
+        defaults["data-url"] = upload["url"]
+        defaults["data-s3f-signature"] = upload["signature"]
+        if self.max_size is not None:
+            defaults["data-s3f-max-size"] = self.max_size
+        if getattr(settings, "S3FILE_TELEMETRY", False):
+            defaults["data-s3f-telemetry-url"] = reverse("s3file:telemetry")
+        if service_worker := getattr(settings, "S3FILE_SERVICE_WORKER", False):
+            defaults["data-s3f-service-worker-url"] = (
+                static("s3file/js/s3file-sw.js")
+                if service_worker is True
+                else service_worker
+            )
         defaults.update(attrs)
 
         try:
@@ -109,34 +150,132 @@ class S3FileInputMixin:
             defaults["class"] = "s3file"
         return defaults
 
+    def presign(self, accept=None):
+        """
+        Return the presigned POST to upload files to the upload folder.
+
+        The result contains the POST's ``url`` and form ``fields`` as well as the
+        ``signature`` the middleware requires to accept the uploaded files.
+        """
+        with metrics.timer(
+            "presign", field=self.field_name, storage=self.storage_alias or "default"
+        ):
+            response = self.client.generate_presigned_post(
+                self.bucket_name,
+                str(pathlib.PurePosixPath(self.upload_folder, "${filename}")),
+                Conditions=self.get_conditions(accept),
+                ExpiresIn=self.expires,
+            )
+        return {
+            "url": response["url"],
+            "fields": response["fields"],
+            # we sign upload location, and will only accept files within the same folder
+            "signature": S3FileMiddleware.sign_s3_key_prefix(
+                self.upload_folder, self.storage_alias
+            ),
+        }
+
+    def get_context(self, name, value, attrs):
+        self.field_name = name
+        return super().get_context(name, value, attrs)
+
     def get_conditions(self, accept):
         conditions = [
             {"bucket": self.bucket_name},
             ["starts-with", "$key", str(self.upload_folder)],
             {"success_action_status": "201"},
         ]
-        if accept and "," not in accept:
-            top_type, sub_type = accept.split("/", 1)
-            if sub_type == "*":
-                conditions.append(["starts-with", "$Content-Type", f"{top_type}/"])
-            else:
-                conditions.append({"Content-Type": accept})
-        else:
+        if self.max_size is not None:
+            conditions.append(["content-length-range", 0, self.max_size])
+        content_types = [value.strip() for value in (accept or "").split(",")]
+        # file extensions, e.g. ".pdf", and "*/*" don't limit the content type
+        top_types = {
+            value.split("/", 1)[0] if "/" in value else "*" for value in content_types
+        }
+        if len(top_types) != 1 or "*" in top_types:
             conditions.append(["starts-with", "$Content-Type", ""])
+        elif len(content_types) == 1 and not accept.endswith("/*"):
+            conditions.append({"Content-Type": accept})
+        else:
+            # wildcards and several types are limited to their shared top-level type
+            conditions.append(["starts-with", "$Content-Type", f"{top_types.pop()}/"])
 
         return conditions
 
-    @cached_property
+    @atomic_cached_property
     def upload_folder(self):
-        return str(
-            pathlib.PurePosixPath(
-                self.upload_path,
-                base64
-                .urlsafe_b64encode(uuid.uuid4().bytes)
-                .decode("utf-8")
-                .rstrip("=\n"),
-            )
-        )  # S3 uses POSIX paths
+        return layouts.get_layout().get_folder(
+            self.upload_path,
+            self.get_partition(),
+            base64.urlsafe_b64encode(uuid.uuid4().bytes).decode("utf-8").rstrip("=\n"),
+        )
+
+    def get_partition(self, date=None):
+        """
+        Return the folders between the upload path and the unique upload folder.
+
+        If the ``S3FILE_UPLOAD_DATE_FORMAT`` setting is set, e.g. to ``%Y/%m/%d``,
+        uploads are partitioned by the date of the upload.
+        """
+        if date_format := getattr(settings, "S3FILE_UPLOAD_DATE_FORMAT", None):
+            date = date or datetime.datetime.now(tz=datetime.UTC)
+            return pathlib.PurePosixPath(date.strftime(date_format)).parts
+        return ()
 
     class Media:
         js = [Script("s3file/js/s3file.js", type="module")]
+
+
+class S3FileFieldMixin:
+    """
+    Form field mixin to validate uploads by their S3 object metadata.
+
+    The size limit is signed into the upload policy, so that S3 rejects
+    invalid uploads, and so is the content type, or the top-level type that
+    all content types share, e.g. ``image/``. The limits are validated again
+    by the field, without downloading the file.
+    """
+
+    def __init__(self, *args, max_size=None, content_types=None, **kwargs):
+        self.max_size = max_size
+        self.content_types = content_types
+        super().__init__(*args, **kwargs)
+        if max_size is not None:
+            self.validators.append(validators.MaxSizeValidator(max_size))
+            self.widget.max_size = max_size
+        if content_types:
+            self.validators.append(validators.ContentTypeValidator(content_types))
+
+    def widget_attrs(self, widget):
+        attrs = super().widget_attrs(widget)
+        if self.content_types:
+            attrs.setdefault("accept", ",".join(self.content_types))
+        return attrs
+
+
+class S3ImageFieldMixin:
+    """
+    Image field mixin that lets Pillow read S3 files without downloading them.
+
+    Django's ``ImageField`` copies the file into memory to verify the image.
+    Files opened with a ``S3FILE_READ_MODE`` are seekable, so Pillow only
+    fetches the blocks it needs to identify the image. The image isn't
+    verified, since that reads the whole file, and the file's ``content_type``
+    remains the one stored on S3.
+    """
+
+    def to_python(self, data):
+        if not isinstance(data, files.S3ObjectFile):
+            return super().to_python(data)
+        # skip ImageField.to_python, which reads the whole file
+        f = super(forms.ImageField, self).to_python(data)
+        from PIL import Image
+
+        try:
+            f.image = Image.open(f.file)
+        except Exception as e:
+            raise ValidationError(
+                self.error_messages["invalid_image"], code="invalid_image"
+            ) from e
+        f.seek(0)
+        return f
@@ -0,0 +1,91 @@
+"""
+Key layouts of the folders, that files are uploaded to.
+
+Each form is uploaded to a unique folder below the ``S3FILE_UPLOAD_PATH``.
+The layout in the ``S3FILE_KEY_LAYOUT`` setting decides where the folder
+is placed, e.g. to spread uploads across many key prefixes. Folders are
+always placed below the upload path, so that a single lifecycle rule
+expires all uploads.
+"""
+
+import functools
+import hashlib
+import pathlib
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+
+class KeyLayout:
+    """
+    Place the unique folders directly below the upload path.
+
+    If the ``S3FILE_UPLOAD_DATE_FORMAT`` setting is set, the folders are
+    partitioned by date, e.g. ``tmp/s3file/2024/01/31/<id>``.
+    """
+
+    def get_folder(self, upload_path, partition, unique_id):
+        """Return the upload folder for a unique ID and date partition."""
+        return str(pathlib.PurePosixPath(upload_path, *partition, unique_id))
+
+    def get_prefixes(self, upload_path, partition=()):
+        """Return the key prefixes, that contain all folders of a partition."""
+        return [f"{pathlib.PurePosixPath(upload_path, *partition)}/"]
+
+
+class ShardedKeyLayout(KeyLayout):
+    """
+    Spread the unique folders across shard prefixes.
+
+    S3 scales the request rate per key prefix, which it partitions gradually.
+    Bursts of uploads to a single prefix may be throttled with ``503 Slow Down``
+    responses until it has been partitioned. This layout prefixes each folder
+    with one of the ``S3FILE_KEY_SHARDS`` shards, which is derived from the
+    folder's unique ID, e.g. ``tmp/s3file/a/2024/01/31/<id>``.
+    """
+
+    def __init__(self, shards=None):
+        self.shards = shards or getattr(settings, "S3FILE_KEY_SHARDS", 16)
+        if not isinstance(self.shards, int) or self.shards < 1:
+            raise ImproperlyConfigured(
+                f"S3FILE_KEY_SHARDS must be a positive integer, not {self.shards!r}."
+            )
+        self.width = len(f"{self.shards - 1:x}")
+
+    def get_shard(self, unique_id):
+        """Return the hexadecimal shard of a unique ID."""
+        digest = hashlib.blake2b(unique_id.encode(), digest_size=8).digest()
+        return f"{int.from_bytes(digest) % self.shards:0{self.width}x}"
+
+    def get_folder(self, upload_path, partition, unique_id):
+        return super().get_folder(
+            pathlib.PurePosixPath(upload_path, self.get_shard(unique_id)),
+            partition,
+            unique_id,
+        )
+
+    def get_prefixes(self, upload_path, partition=()):
+        prefixes = []
+        for shard in range(self.shards):
+            prefixes += super().get_prefixes(
+                pathlib.PurePosixPath(upload_path, f"{shard:0{self.width}x}"),
+                partition,
+            )
+        return prefixes
+
+
+@functools.cache
+def get_layout():
+    """Return the key layout from the ``S3FILE_KEY_LAYOUT`` setting."""
+    return import_string(
+        getattr(settings, "S3FILE_KEY_LAYOUT", None) or "s3file.layouts.KeyLayout"
+    )()
+
+
+@receiver(setting_changed)
+def reset_layout(*, setting, **kwargs):
+    if setting in ("S3FILE_KEY_LAYOUT", "S3FILE_KEY_SHARDS"):
+        get_layout.cache_clear()
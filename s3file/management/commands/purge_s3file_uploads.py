@@ -0,0 +1,132 @@
+import concurrent.futures
+import datetime
+import itertools
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from s3file.forms import S3FileInputMixin
+from s3file.layouts import get_layout
+from s3file.storages import get_storage
+
+
+class Command(BaseCommand):
+    help = "Delete temporary S3File uploads that are older than a given age."
+
+    batch_size = 1000  # maximum number of keys per DeleteObjects request
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--max-age",
+            type=int,
+            default=24 * 60 * 60,
+            help="Delete uploads older than this many seconds (default: 1 day).",
+        )
+        parser.add_argument(
+            "--date",
+            type=datetime.date.fromisoformat,
+            help=(
+                "Only scan the uploads of a single day (YYYY-MM-DD)."
+                " Requires the S3FILE_UPLOAD_DATE_FORMAT setting."
+            ),
+        )
+        parser.add_argument(
+            "--storage",
+            dest="storage_alias",
+            help="Alias of the storage to purge (default: the default storage).",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=8,
+            help="Number of concurrent DeleteObjects requests (default: 8).",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="List the uploads that would be deleted without deleting them.",
+        )
+
+    def handle(self, *args, max_age, date, storage_alias, workers, dry_run, **options):
+        storage = get_storage(storage_alias)
+        client = storage.connection.meta.client
+        bucket_name = storage.bucket.name
+        prefixes = self.get_prefixes(date)
+        cutoff = datetime.datetime.now(tz=datetime.UTC) - datetime.timedelta(
+            seconds=max_age
+        )
+        stats = {"scanned": 0, "matched": 0, "bytes": 0, "deleted": 0, "errors": 0}
+        start = time.monotonic()
+
+        objects = (
+            obj
+            for prefix in prefixes
+            for obj in self.list_objects(client, bucket_name, prefix, stats)
+            if obj["LastModified"] < cutoff
+        )
+        with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+            pending = set()
+            while batch := list(itertools.islice(objects, self.batch_size)):
+                stats["matched"] += len(batch)
+                stats["bytes"] += sum(obj["Size"] for obj in batch)
+                if dry_run:
+                    for obj in batch:
+                        self.stdout.write(obj["Key"], style_func=None)
+                    continue
+                pending.add(
+                    executor.submit(self.delete_objects, client, bucket_name, batch)
+                )
+                if len(pending) >= workers * 2:
+                    done, pending = concurrent.futures.wait(
+                        pending, return_when=concurrent.futures.FIRST_COMPLETED
+                    )
+                    self.collect(done, stats)
+            self.collect(concurrent.futures.as_completed(pending), stats)
+
+        location = f"s3://{bucket_name}/{prefixes[0]}"
+        if len(prefixes) > 1:
+            location += f" and {len(prefixes) - 1} more prefixes"
+        self.stdout.write(
+            f"{'Would delete' if dry_run else 'Deleted'}"
+            f" {stats['matched' if dry_run else 'deleted']} of {stats['scanned']}"
+            f" uploads in {location}"
+            f" ({stats['bytes']} bytes, {stats['errors']} errors)"
+            f" in {time.monotonic() - start:.1f}s."
+        )
+        if stats["errors"]:
+            raise CommandError(f"Failed to delete {stats['errors']} uploads.")
+
+    def get_prefixes(self, date=None):
+        widget = S3FileInputMixin()
+        if date is None:
+            return get_layout().get_prefixes(widget.upload_path)
+        if not (partition := widget.get_partition(date)):
+            raise CommandError("--date requires the S3FILE_UPLOAD_DATE_FORMAT setting.")
+        return get_layout().get_prefixes(widget.upload_path, partition)
+
+    def list_objects(self, client, bucket_name, prefix, stats):
+        """Yield all objects below the prefix using paginated ListObjectsV2 calls."""
+        params = {"Bucket": bucket_name, "Prefix": prefix}
+        while True:
+            response = client.list_objects_v2(**params)
+            stats["scanned"] += response.get("KeyCount", 0)
+            yield from response.get("Contents", [])
+            if not response.get("IsTruncated"):
+                return
+            params["ContinuationToken"] = response["NextContinuationToken"]
+
+    def delete_objects(self, client, bucket_name, batch):
+        response = client.delete_objects(
+            Bucket=bucket_name,
+            Delete={"Objects": [{"Key": obj["Key"]} for obj in batch], "Quiet": True},
+        )
+        errors = response.get("Errors", [])
+        for error in errors:
+            self.stderr.write(f"{error['Key']}: {error.get('Message', error['Code'])}")
+        return len(batch) - len(errors), len(errors)
+
+    def collect(self, futures, stats):
+        for future in futures:
+            deleted, errors = future.result()
+            stats["deleted"] += deleted
+            stats["errors"] += errors
@@ -0,0 +1,178 @@
+"""
+Instrumentation of S3File's hot paths.
+
+S3File records the duration of the following operations:
+
+* ``presign``: the upload policy signed when a file input is rendered,
+* ``verify``: the signature check of each uploaded key in the middleware,
+* ``open``: each file opened by the middleware,
+* ``request``: all files of a field processed by the middleware,
+* ``prefetch``: each file downloaded in the background, see ``S3FILE_PREFETCH``,
+* ``copy``: each copy by the ``S3OptimizedUploadStorage``.
+
+The measurements are passed to the backend in the ``S3FILE_METRICS_BACKEND``
+setting, which defaults to a no-op backend.
+"""
+
+import collections
+import contextlib
+import functools
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger("s3file.metrics")
+
+
+class BaseBackend:
+    """Receive the measurements of S3File's operations."""
+
+    def record(self, name, duration, labels):
+        """
+        Record an operation's duration in seconds.
+
+        Labels include the ``field`` name and ``storage`` alias, as well as
+        the number of ``files`` and ``bytes``, if applicable. Failed operations
+        are labeled with the ``error`` class name.
+        """
+        raise NotImplementedError  # pragma: no cover
+
+
+class NullBackend(BaseBackend):
+    """Discard all measurements."""
+
+    def record(self, name, duration, labels):
+        pass
+
+
+class LoggingBackend(BaseBackend):
+    """Log all measurements to the ``s3file.metrics`` logger."""
+
+    level = logging.INFO
+
+    def record(self, name, duration, labels):
+        logger.log(
+            self.level,
+            "%s %.2fms %s",
+            name,
+            duration * 1000,
+            " ".join(
+                f"{key}={value}"
+                for key, value in sorted(labels.items())
+                if value is not None
+            ),
+            extra={"metric": name, "duration": duration, "labels": labels},
+        )
+
+
+class RegistryBackend(BaseBackend):
+    """
+    Aggregate measurements in memory and expose them in Prometheus' text format.
+
+    Durations are summarized per operation and string labels, while the number
+    of ``files`` and ``bytes`` are summed up as counters. Labels that are unique
+    per request, like the ``correlation_id``, are ignored. Once ``max_samples``
+    label sets have been recorded, measurements with new label sets are dropped.
+    """
+
+    prefix = "s3file"
+    counters = ("files", "bytes")
+    ignored_labels = ("correlation_id",)
+    max_samples = 10_000
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = collections.defaultdict(
+            lambda: dict.fromkeys(("count", "sum", *self.counters), 0)
+        )
+
+    def record(self, name, duration, labels):
+        key = (
+            name,
+            tuple(
+                sorted(
+                    (label, str(value))
+                    for label, value in labels.items()
+                    if label not in self.counters
+                    and label not in self.ignored_labels
+                    and value is not None
+                )
+            ),
+        )
+        with self.lock:
+            if key not in self.samples and len(self.samples) >= self.max_samples:
+                logger.warning("dropped %s sample, too many label sets", name)
+                return
+            sample = self.samples[key]
+            sample["count"] += 1
+            sample["sum"] += duration
+            for counter in self.counters:
+                sample[counter] += labels.get(counter) or 0
+
+    def expose(self):
+        """Return all samples in Prometheus' text exposition format."""
+        lines = []
+        with self.lock:
+            samples = sorted(
+                (key, dict(sample)) for key, sample in self.samples.items()
+            )
+        for name in dict.fromkeys(name for (name, _), _ in samples):
+            metric = f"{self.prefix}_{name}"
+            lines.append(f"# TYPE {metric}_seconds summary")
+            for (sample_name, labels), sample in samples:
+                if sample_name != name:
+                    continue
+                label_str = ",".join(
+                    f'{label}="{self.escape(value)}"' for label, value in labels
+                )
+                label_str = f"{{{label_str}}}" if label_str else ""
+                lines.append(f"{metric}_seconds_count{label_str} {sample['count']}")
+                lines.append(f"{metric}_seconds_sum{label_str} {sample['sum']!r}")
+                lines.extend(
+                    f"{metric}_{counter}_total{label_str} {sample[counter]}"
+                    for counter in self.counters
+                    if sample[counter]
+                )
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def escape(value):
+        return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+@functools.cache
+def get_backend():
+    """Return the backend from the ``S3FILE_METRICS_BACKEND`` setting."""
+    backend = getattr(settings, "S3FILE_METRICS_BACKEND", None)
+    if backend is None:
+        return NullBackend()
+    return import_string(backend)()
+
+
+@receiver(setting_changed)
+def reset_backend(*, setting, **kwargs):
+    if setting == "S3FILE_METRICS_BACKEND":
+        get_backend.cache_clear()
+
+
+@contextlib.contextmanager
+def timer(name, **labels):
+    """
+    Measure the duration of the block and record it with the given labels.
+
+    The labels are yielded, so that labels like the number of bytes can be
+    added within the block.
+    """
+    start = time.perf_counter()
+    try:
+        yield labels
+    except BaseException as e:
+        labels["error"] = type(e).__name__
+        raise
+    finally:
+        get_backend().record(name, time.perf_counter() - start, labels)
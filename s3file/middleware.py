@@ -1,46 +1,169 @@
+import hashlib
+import json
 import logging
 import pathlib
 
+from django.conf import settings
 from django.core import signing
-from django.core.exceptions import PermissionDenied, SuspiciousFileOperation
+from django.core.cache import caches
+from django.core.exceptions import (
+    ImproperlyConfigured,
+    PermissionDenied,
+    SuspiciousFileOperation,
+)
 from django.http.multipartparser import MultiPartParser
 from django.utils.crypto import constant_time_compare
 from storages.utils import clean_name
 
-from . import views
-from .storages import get_aws_location, local_dev, storage
+from . import files, metrics, signals, views
+from .storages import current_request, get_aws_location, get_storage, is_local_dev
 
 logger = logging.getLogger("s3file")
 
+#: The object metadata, that is cached by the ``S3FILE_RESOLUTION_CACHE``.
+RESOLUTION_METADATA = (
+    "ContentLength",
+    "ContentType",
+    "ContentEncoding",
+    "ETag",
+    "LastModified",
+)
+
 
 class S3FileMiddleware:
     def __init__(self, get_response):
         self.get_response = get_response
 
     def __call__(self, request):
-        file_fields = request.POST.getlist("s3file")
-        for field_name in file_fields:
-            if paths := request.POST.getlist(field_name):
-                try:
-                    signature = request.POST[f"{field_name}-s3f-signature"]
-                except KeyError:
-                    raise PermissionDenied("No signature provided.")
-                try:
-                    request.FILES.setlist(
-                        field_name, list(self.get_files_from_storage(paths, signature))
-                    )
-                except SuspiciousFileOperation as e:
-                    raise PermissionDenied("Illegal filename!") from e
+        token = current_request.set(request)
+        try:
+            return self.process_request(request)
+        finally:
+            current_request.reset(token)
+
+    def process_request(self, request):
+        for field_name, uploaded_files in self.resolve_files(self.get_data(request)):
+            request.FILES.setlist(field_name, uploaded_files)
 
-        if local_dev and request.path == "/__s3_mock__/":
+        if request.path == "/__s3_mock__/" and is_local_dev():
             return views.S3MockView.as_view()(request)
 
         return self.get_response(request)
 
+    @staticmethod
+    def get_data(request):
+        """
+        Return the submitted form data or JSON object of a request.
+
+        JSON bodies are only parsed, if the client opted in with the
+        ``X-S3File`` header, the body doesn't exceed Django's
+        ``DATA_UPLOAD_MAX_MEMORY_SIZE`` and it contains S3 file keys.
+        """
+        if request.content_type != "application/json":
+            return request.POST
+        if "X-S3File" not in request.headers:
+            return {}
+        try:
+            content_length = int(request.META.get("CONTENT_LENGTH") or 0)
+        except ValueError:
+            return {}
+        if (
+            settings.DATA_UPLOAD_MAX_MEMORY_SIZE is not None
+            and content_length > settings.DATA_UPLOAD_MAX_MEMORY_SIZE
+        ):
+            # leave the body to the view, e.g. to stream it
+            return {}
+        try:
+            data = json.loads(request.body)
+        except ValueError:
+            return {}
+        return data if isinstance(data, dict) and "s3file" in data else {}
+
     @classmethod
-    def get_files_from_storage(cls, paths, signature):
-        """Return S3 file where the name does not include the path."""
+    def resolve_files(cls, data):
+        """
+        Yield the field names and files for the signed S3 keys in the data.
+
+        The data is either a ``QueryDict`` or a JSON object with the same
+        structure, e.g. a DRF ``request.data``::
+
+            {
+                "s3file": ["avatar"],
+                "avatar": ["tmp/s3file/abc/avatar.jpg"],
+                "avatar-s3f-signature": "signature",
+            }
+        """
+        for field_name in cls.getlist(data, "s3file"):
+            if isinstance(field_name, str) and (paths := cls.getlist(data, field_name)):
+                try:
+                    signature = data[f"{field_name}-s3f-signature"]
+                except KeyError:
+                    raise PermissionDenied("No signature provided.")
+                if not isinstance(signature, str) or not all(
+                    isinstance(path, str) for path in paths
+                ):
+                    raise PermissionDenied("Illegal filename!")
+                # rejected submissions are only labeled with the error class,
+                # since the field name is chosen by the client
+                with metrics.timer(
+                    "request",
+                    files=len(paths),
+                    correlation_id=data.get("s3file-correlation-id"),
+                ) as labels:
+                    try:
+                        uploaded_files = list(
+                            cls.get_files_from_storage(
+                                paths,
+                                signature,
+                                field_name,
+                                bundle=field_name in cls.getlist(data, "s3file-bundle"),
+                            )
+                        )
+                    except SuspiciousFileOperation as e:
+                        raise PermissionDenied("Illegal filename!") from e
+                    labels["field"] = field_name
+                    labels["files"] = len(uploaded_files)
+                    labels["bytes"] = sum(f.size or 0 for f in uploaded_files)
+                signals.files_resolved.send(
+                    sender=cls,
+                    request=current_request.get(),
+                    field_name=field_name,
+                    files=uploaded_files,
+                    uploads=[
+                        {
+                            "key": f.key,
+                            "name": f.name,
+                            "size": f.size,
+                            "storage": signature.rpartition(":")[0] or None,
+                        }
+                        for f in uploaded_files
+                    ],
+                )
+                yield field_name, uploaded_files
+
+    @staticmethod
+    def getlist(data, key):
+        if hasattr(data, "getlist"):
+            return data.getlist(key)
+        value = data.get(key)
+        if value is None:
+            return []
+        return value if isinstance(value, list) else [value]
+
+    @classmethod
+    def get_files_from_storage(cls, paths, signature, field_name=None, bundle=False):
+        """
+        Return S3 file where the name does not include the path.
+
+        If ``bundle`` is true, each path is an uncompressed ZIP archive, that
+        ``s3file.js`` uploaded instead of the individual files, and the files
+        in the archive are returned.
+        """
         location = get_aws_location()
+        # the storage alias is part of the signed value, see sign_s3_key_prefix
+        storage_alias = signature.rpartition(":")[0] or None
+        # only trusted once the signature has been verified
+        labels = {"field": field_name, "storage": storage_alias or "default"}
         for vulnerable_path in paths:
             cleaned_path = pathlib.PurePosixPath(clean_name(vulnerable_path))
             if (
@@ -64,22 +187,98 @@ class S3FileMiddleware:
                     "No upload folder, or file in the root of the upload folder."
                 )
 
-            if not constant_time_compare(
-                cls.sign_s3_key_prefix(str(cleaned_path.parent)), signature
-            ):
-                raise SuspiciousFileOperation("Illegal signature!")
+            with metrics.timer("verify") as verify_labels:
+                if not constant_time_compare(
+                    cls.sign_s3_key_prefix(str(cleaned_path.parent), storage_alias),
+                    signature,
+                ):
+                    raise SuspiciousFileOperation("Illegal signature!")
+                verify_labels.update(labels)
             try:
-                f = storage.open(cleaned_path.relative_to(location))
-                f.name = cleaned_path.name
-                yield f
+                with metrics.timer("open", **labels) as open_labels:
+                    if bundle:
+                        opened = files.open_bundle(
+                            str(cleaned_path), get_storage(storage_alias)
+                        )
+                    else:
+                        f = cls.open_file(
+                            cleaned_path,
+                            location,
+                            get_storage(storage_alias),
+                            signature,
+                        )
+                        f.name = cleaned_path.name
+                        opened = [f]
+                    open_labels["bytes"] = sum(f.size for f in opened)
             except (OSError, ValueError):
                 logger.exception("File not found: %r", vulnerable_path)
+            else:
+                for f in opened:
+                    if (
+                        prefetch := getattr(settings, "S3FILE_PREFETCH", None)
+                    ) and hasattr(f, "prefetch"):
+                        # overlap the download with the view's work
+                        f.prefetch(0 if prefetch is True else prefetch, **labels)
+                    f.key = str(cleaned_path)
+                    yield f
+
+    @classmethod
+    def open_file(cls, path, location, storage, signature=None):
+        """
+        Open an uploaded file according to the ``S3FILE_READ_MODE`` setting.
+
+        If the ``S3FILE_RESOLUTION_CACHE`` setting is set to a cache alias,
+        the metadata of files opened with a read mode is cached, so that
+        retried or repeated submissions of the same signed keys don't request
+        it from S3 again. Files are only read if their ETag still matches the
+        cached one, otherwise the entry is treated as a cache miss.
+        """
+        if read_mode := getattr(settings, "S3FILE_READ_MODE", None):
+            try:
+                file_class = files.FILE_CLASSES[read_mode]
+            except KeyError as e:
+                raise ImproperlyConfigured(
+                    f"Unknown S3FILE_READ_MODE: {read_mode!r}"
+                ) from e
+            alias = getattr(settings, "S3FILE_RESOLUTION_CACHE", None)
+            if not alias or signature is None:
+                return file_class(str(path), storage)
+            resolution_cache = caches[alias]
+            cache_key = cls.get_resolution_cache_key(path, signature)
+            if (metadata := resolution_cache.get(cache_key)) is not None:
+                f = file_class(str(path), storage, metadata=metadata)
+                # reads fail over to fresh metadata, if the object has changed
+                f.file.on_refresh = lambda metadata: resolution_cache.delete(cache_key)
+                return f
+            f = file_class(str(path), storage)
+            resolution_cache.set(
+                cache_key,
+                {
+                    name: f.metadata[name]
+                    for name in RESOLUTION_METADATA
+                    if name in f.metadata
+                },
+                getattr(settings, "S3FILE_RESOLUTION_CACHE_TIMEOUT", 60),
+            )
+            return f
+        return storage.open(path.relative_to(location))
+
+    @staticmethod
+    def get_resolution_cache_key(path, signature):
+        """Return the cache key of a file's metadata for its verified signature."""
+        digest = hashlib.sha256(f"{signature}\0{path}".encode()).hexdigest()
+        return f"s3file:resolution:{digest}"
 
     @classmethod
-    def sign_s3_key_prefix(cls, path):
+    def sign_s3_key_prefix(cls, path, storage_alias=None):
         """
         Signature to validate the S3 keys passed the middleware before fetching files.
 
         Return a base64-encoded HMAC-SHA256 of the upload folder aka the S3 key-prefix.
+        Uploads to a storage other than the default one are signed together with the
+        storage alias, which is prefixed to the signature, e.g. ``eu:signature``.
         """
-        return signing.Signer(salt="s3file.middleware.S3FileMiddleware").signature(path)
+        signer = signing.Signer(salt="s3file.middleware.S3FileMiddleware")
+        if storage_alias is None:
+            return signer.signature(path)
+        return f"{storage_alias}:{signer.signature(f'{storage_alias}:{path}')}"
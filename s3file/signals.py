@@ -0,0 +1,13 @@
+"""Signals sent by S3File."""
+
+from django.dispatch import Signal
+
+#: Sent by the middleware once all files of a field have been resolved.
+#:
+#: Receivers are called with the ``field_name``, the ``files`` in
+#: ``request.FILES`` and the ``uploads``: a list of JSON-serializable
+#: dictionaries with each file's S3 ``key``, ``name``, ``size`` in bytes and
+#: ``storage`` alias, which can be passed to :func:`s3file.tasks.enqueue`.
+#: The ``request`` is ``None`` if the files have not been resolved by the
+#: middleware, e.g. by calling ``S3FileMiddleware.resolve_files`` directly.
+files_resolved = Signal()
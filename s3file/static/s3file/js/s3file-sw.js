@@ -0,0 +1,215 @@
+// Service worker that carries on S3File uploads after the form's page unloads.
+const STATUS_CACHE = "s3file-status"
+const RETRIES = 3
+const jobs = new Map()
+
+function parseKey(text) {
+  // DOMParser isn't available in service workers
+  const entities = { lt: "<", gt: ">", quot: '"', apos: "'", amp: "&" }
+  const key = /<Key>([^<]*)<\/Key>/.exec(text)[1]
+  return decodeURI(key.replace(/&(lt|gt|quot|apos|amp);/g, (_, name) => entities[name]))
+}
+
+function sleep(ms) {
+  return new Promise((resolve) => setTimeout(resolve, ms))
+}
+
+async function uploadFile(upload, file, retries = RETRIES) {
+  const body = new globalThis.FormData()
+  for (const [name, value] of upload.fields) {
+    body.append(name, value)
+  }
+  body.append("success_action_status", "201")
+  body.append("Content-Type", file.type)
+  body.append("file", file)
+  for (let attempt = 0; ; attempt++) {
+    let error
+    try {
+      const response = await globalThis.fetch(upload.url, { method: "POST", body })
+      if (response.status === 201) {
+        return parseKey(await response.text())
+      }
+      error = new Error(response.statusText || String(response.status))
+      error.status = response.status
+      if (response.status < 500) {
+        // the upload was rejected, e.g. because the policy expired
+        throw error
+      }
+    } catch (err) {
+      if (!(err instanceof TypeError)) {
+        throw err
+      }
+      // network error, e.g. on a flaky mobile connection
+      error = new Error(err.message)
+      error.status = 0
+    }
+    if (attempt >= retries) {
+      throw error
+    }
+    await sleep(1000 * 2 ** attempt)
+  }
+}
+
+async function measureUpload(job, upload, file) {
+  const start = globalThis.performance.now()
+  const record = (status, error) => {
+    // like s3file.js, but fetch can't observe when the first bytes are sent
+    job.measurements.push({
+      field: upload.name,
+      size: file.size,
+      ttfb: null,
+      duration: globalThis.performance.now() - start,
+      status,
+      error,
+    })
+  }
+  try {
+    const key = await uploadFile(upload, file)
+    record(201, null)
+    return key
+  } catch (err) {
+    record(err.status ?? 0, err.message)
+    throw err
+  }
+}
+
+async function sendTelemetry(job) {
+  // the page has been closed, so the worker sends the beacon itself
+  if (!job.telemetry) {
+    return
+  }
+  const body = JSON.stringify({
+    correlationId: job.telemetry.correlationId,
+    duration: globalThis.performance.now() - job.start,
+    uploads: job.measurements,
+  })
+  try {
+    await globalThis.fetch(job.telemetry.url, {
+      method: "POST",
+      body,
+      headers: { "Content-Type": "application/json" },
+      credentials: "same-origin",
+    })
+  } catch (err) {
+    console.error(err)
+  }
+}
+
+function statusRequest(id) {
+  return new globalThis.Request(new URL(`s3file-status/${id}`, self.registration.scope))
+}
+
+async function setStatus(job, status) {
+  const cache = await globalThis.caches.open(STATUS_CACHE)
+  const body = JSON.stringify({ id: job.id, action: job.action, ...status })
+  await cache.put(
+    statusRequest(job.id),
+    new globalThis.Response(body, { headers: { "Content-Type": "application/json" } }),
+  )
+}
+
+async function notify(job, message) {
+  // the page that started the uploads, unless it has been closed since
+  const client = await self.clients.get(job.clientId)
+  client?.postMessage({ id: job.id, ...message })
+  return client
+}
+
+async function submit(job, fields) {
+  const body = new globalThis.FormData()
+  for (const [name, value] of fields) {
+    body.append(name, value)
+  }
+  const response = await globalThis.fetch(job.action, {
+    method: "POST",
+    body,
+    credentials: "same-origin",
+  })
+  return {
+    status: response.ok ? "submitted" : "failed",
+    statusCode: response.status,
+    url: response.url,
+  }
+}
+
+async function run(job) {
+  await setStatus(job, { status: "uploading" })
+  let keys
+  try {
+    keys = await Promise.all(
+      job.uploads.flatMap((upload) =>
+        upload.files.map(async (file) => {
+          const key = await measureUpload(job, upload, file)
+          job.loaded += file.size
+          await notify(job, {
+            type: "progress",
+            field: upload.name,
+            fileName: file.name,
+            loaded: job.loaded,
+            total: job.total,
+          })
+          return [upload.name, key]
+        }),
+      ),
+    )
+  } catch (err) {
+    await setStatus(job, { status: "failed", error: err.message })
+    const message = { type: "error", error: err.message, uploads: job.measurements }
+    if (!(await notify(job, message))) {
+      await sendTelemetry(job)
+    }
+    return
+  }
+
+  if (await notify(job, { type: "uploaded", keys, uploads: job.measurements })) {
+    // the page is still open and submits the form itself
+    const cache = await globalThis.caches.open(STATUS_CACHE)
+    await cache.delete(statusRequest(job.id))
+    return
+  }
+  await sendTelemetry(job)
+  try {
+    await setStatus(job, await submit(job, [...job.fields, ...keys]))
+  } catch (err) {
+    await setStatus(job, { status: "failed", error: err.message })
+  }
+}
+
+async function reportStatus(client) {
+  const cache = await globalThis.caches.open(STATUS_CACHE)
+  for (const request of await cache.keys()) {
+    const status = await (await cache.match(request)).json()
+    if (status.status === "uploading") {
+      if (jobs.has(status.id)) {
+        continue
+      }
+      // the worker has been stopped by the browser before the uploads finished
+      status.status = "interrupted"
+    }
+    client.postMessage({ type: "status", ...status })
+    await cache.delete(request)
+  }
+}
+
+self.addEventListener("install", () => {
+  self.skipWaiting()
+})
+
+self.addEventListener("message", (event) => {
+  const { data } = event
+  if (data.type === "upload") {
+    const files = data.uploads.flatMap((upload) => upload.files)
+    const job = {
+      ...data,
+      clientId: event.source.id,
+      start: globalThis.performance.now(),
+      measurements: [],
+      loaded: 0,
+      total: files.reduce((total, file) => total + file.size, 0),
+    }
+    jobs.set(job.id, job)
+    event.waitUntil(run(job).finally(() => jobs.delete(job.id)))
+  } else if (data.type === "status") {
+    event.waitUntil(reportStatus(event.source))
+  }
+})
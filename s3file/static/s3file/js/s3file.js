@@ -10,24 +10,72 @@ function waitForAllFiles(form) {
       waitForAllFiles(form)
     }, 100)
   } else {
+    sendTelemetry(form)
     globalThis.HTMLFormElement.prototype.submit.call(form)
   }
 }
 
+function createCorrelationId() {
+  if (globalThis.crypto?.randomUUID) {
+    return globalThis.crypto.randomUUID()
+  }
+  return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`
+}
+
+function recordTelemetry(form, upload) {
+  if (form.telemetry) {
+    form.telemetry.uploads.push(upload)
+  }
+}
+
+function sendTelemetry(form) {
+  const telemetry = form.telemetry
+  if (!telemetry || telemetry.sent) {
+    return
+  }
+  telemetry.sent = true
+  const body = JSON.stringify({
+    correlationId: telemetry.correlationId,
+    duration: globalThis.performance.now() - telemetry.start,
+    uploads: telemetry.uploads,
+  })
+  globalThis.navigator.sendBeacon(
+    telemetry.url,
+    new globalThis.Blob([body], { type: "application/json" }),
+  )
+}
+
 async function request(method, url, data, fileInput, file, form) {
   file.loaded = 0
   return await new Promise((resolve, reject) => {
     const xhr = new globalThis.XMLHttpRequest()
+    const start = globalThis.performance.now()
+    let ttfb = null
+
+    const record = (error) => {
+      recordTelemetry(form, {
+        field: fileInput.name,
+        size: file.size,
+        ttfb,
+        duration: globalThis.performance.now() - start,
+        status: xhr.status,
+        error,
+      })
+    }
 
     xhr.onload = () => {
       if (xhr.status === 201) {
+        record(null)
         resolve(xhr.responseText)
       } else {
+        record(xhr.statusText || String(xhr.status))
         reject(xhr.statusText)
       }
     }
 
     xhr.upload.onprogress = (e) => {
+      // time until the first bytes of the file have been sent
+      ttfb ??= globalThis.performance.now() - start
       const diff = e.loaded - file.loaded
       form.loaded += diff
       fileInput.loaded += diff
@@ -65,6 +113,7 @@ async function request(method, url, data, fileInput, file, form) {
     }
 
     xhr.onerror = () => {
+      record("network error")
       reject(xhr.statusText)
     }
 
@@ -73,49 +122,254 @@ async function request(method, url, data, fileInput, file, form) {
   })
 }
 
+let crcTable = null
+
+function crc32(crc, bytes) {
+  if (!crcTable) {
+    crcTable = new Uint32Array(256)
+    for (let n = 0; n < 256; n++) {
+      let c = n
+      for (let k = 0; k < 8; k++) {
+        c = c & 1 ? 0xedb88320 ^ (c >>> 1) : c >>> 1
+      }
+      crcTable[n] = c >>> 0
+    }
+  }
+  for (const byte of bytes) {
+    crc = crcTable[(crc ^ byte) & 0xff] ^ (crc >>> 8)
+  }
+  return crc
+}
+
+async function fileCrc32(file) {
+  // read the file in chunks, without loading it into memory entirely
+  const reader = file.stream().getReader()
+  let crc = 0xffffffff
+  for (let chunk = await reader.read(); !chunk.done; chunk = await reader.read()) {
+    crc = crc32(crc, chunk.value)
+  }
+  return (crc ^ 0xffffffff) >>> 0
+}
+
+function canBundle(fileInput, files) {
+  // the policy's content type and size conditions would apply to the archive
+  if (fileInput.accept || fileInput.dataset.s3fMaxSize !== undefined) {
+    return false
+  }
+  // without ZIP64, archives are limited to 65535 files and 4 GiB
+  const size = files.reduce((total, file) => total + file.size + 1024, 0)
+  return files.length > 1 && files.length < 0xffff && size < 0xffffffff
+}
+
+async function createBundle(files) {
+  // uncompressed ZIP archive, that references the files instead of copying them
+  const encoder = new globalThis.TextEncoder()
+  const entries = []
+  const centralDirectory = []
+  let offset = 0
+  let centralDirectorySize = 0
+  for (const file of files) {
+    const name = encoder.encode(file.name)
+    const crc = await fileCrc32(file)
+    const header = new DataView(new ArrayBuffer(30))
+    header.setUint32(0, 0x04034b50, true)
+    header.setUint16(4, 20, true)
+    header.setUint16(6, 0x0800, true) // UTF-8 file names
+    header.setUint32(14, crc, true)
+    header.setUint32(18, file.size, true)
+    header.setUint32(22, file.size, true)
+    header.setUint16(26, name.length, true)
+    entries.push(header, name, file)
+
+    const entry = new DataView(new ArrayBuffer(46))
+    entry.setUint32(0, 0x02014b50, true)
+    entry.setUint16(4, 20, true)
+    entry.setUint16(6, 20, true)
+    entry.setUint16(8, 0x0800, true)
+    entry.setUint32(16, crc, true)
+    entry.setUint32(20, file.size, true)
+    entry.setUint32(24, file.size, true)
+    entry.setUint16(28, name.length, true)
+    entry.setUint32(42, offset, true)
+    centralDirectory.push(entry, name)
+    offset += 30 + name.length + file.size
+    centralDirectorySize += 46 + name.length
+  }
+  const end = new DataView(new ArrayBuffer(22))
+  end.setUint32(0, 0x06054b50, true)
+  end.setUint16(8, files.length, true)
+  end.setUint16(10, files.length, true)
+  end.setUint32(12, centralDirectorySize, true)
+  end.setUint32(16, offset, true)
+  return new globalThis.File([...entries, ...centralDirectory, end], "bundle.zip", {
+    type: "application/zip",
+  })
+}
+
+async function getUploadFiles(form, fileInput, name) {
+  const files = [...fileInput.files]
+  if (fileInput.dataset.s3fBundle === undefined || !canBundle(fileInput, files)) {
+    return files
+  }
+  const hiddenBundleInput = document.createElement("input")
+  hiddenBundleInput.type = "hidden"
+  hiddenBundleInput.name = "s3file-bundle"
+  hiddenBundleInput.value = name
+  form.appendChild(hiddenBundleInput)
+  return [await createBundle(files)]
+}
+
+function getFields(fileInput) {
+  // the presigned POST's form fields
+  return [...fileInput.attributes]
+    .filter((attr) => attr.name.startsWith("data-fields-"))
+    .map((attr) => [attr.name.replace("data-fields-", ""), attr.value])
+}
+
 function uploadFiles(form, fileInput, name) {
   const url = fileInput.getAttribute("data-url")
   fileInput.loaded = 0
   fileInput.total = 0
-  const promises = [...fileInput.files].map((file) => {
+  const upload = (file) => {
     form.total += file.size
     fileInput.total += file.size
     const s3Form = new globalThis.FormData()
 
-    for (const attr of fileInput.attributes) {
-      let name = attr.name
-
-      if (name.startsWith("data-fields")) {
-        name = name.replace("data-fields-", "")
-        s3Form.append(name, attr.value)
-      }
+    for (const [name, value] of getFields(fileInput)) {
+      s3Form.append(name, value)
     }
 
     s3Form.append("success_action_status", "201")
     s3Form.append("Content-Type", file.type)
     s3Form.append("file", file)
     return request("POST", url, s3Form, fileInput, file, form)
-  })
-  Promise.all(promises).then(
-    (results) => {
-      results.forEach((result) => {
-        const hiddenFileInput = document.createElement("input")
-        hiddenFileInput.type = "hidden"
-        hiddenFileInput.name = name
-        hiddenFileInput.value = parseURL(result)
-        form.appendChild(hiddenFileInput)
-      })
-      fileInput.name = ""
-      globalThis.uploading -= 1
+  }
+  getUploadFiles(form, fileInput, name)
+    .then((files) => Promise.all(files.map(upload)))
+    .then(
+      (results) => {
+        results.forEach((result) => {
+          const hiddenFileInput = document.createElement("input")
+          hiddenFileInput.type = "hidden"
+          hiddenFileInput.name = name
+          hiddenFileInput.value = parseURL(result)
+          form.appendChild(hiddenFileInput)
+        })
+        fileInput.name = ""
+        globalThis.uploading -= 1
+      },
+      (err) => {
+        console.error(err)
+        sendTelemetry(form)
+        fileInput.setCustomValidity(err)
+        fileInput.reportValidity()
+      },
+    )
+}
+
+const backgroundUploads = new Map()
+
+function registerServiceWorker(url) {
+  const container = globalThis.navigator.serviceWorker
+  if (!url || !container) {
+    return null
+  }
+  container.addEventListener("message", receiveMessage)
+  return container.register(url).then(
+    (registration) => {
+      // report the uploads, that finished after a previous page was closed
+      registration.active?.postMessage({ type: "status" })
+      return registration
     },
     (err) => {
       console.error(err)
-      fileInput.setCustomValidity(err)
-      fileInput.reportValidity()
+      return null
     },
   )
 }
 
+function receiveMessage({ data }) {
+  if (data.type === "status") {
+    document.dispatchEvent(
+      new globalThis.CustomEvent("backgroundupload", { detail: data }),
+    )
+    return
+  }
+  const upload = backgroundUploads.get(data.id)
+  if (!upload) {
+    return
+  }
+  const { form, inputs } = upload
+  if (data.type === "progress") {
+    // the worker can't observe the upload's progress, only finished files
+    const fileInput = inputs.get(data.field)
+    const detail = {
+      progress: Math.min(data.loaded / data.total, 1),
+      loaded: data.loaded,
+      total: data.total,
+      currentFileName: data.fileName,
+      currentFileProgress: 1,
+    }
+    form.dispatchEvent(new globalThis.CustomEvent("progress", { detail }))
+    fileInput?.dispatchEvent(new globalThis.CustomEvent("progress", { detail }))
+  } else if (data.type === "uploaded") {
+    backgroundUploads.delete(data.id)
+    data.uploads?.forEach((measurement) => recordTelemetry(form, measurement))
+    sendTelemetry(form)
+    for (const [name, key] of data.keys) {
+      const hiddenFileInput = document.createElement("input")
+      hiddenFileInput.type = "hidden"
+      hiddenFileInput.name = name
+      hiddenFileInput.value = key
+      form.appendChild(hiddenFileInput)
+    }
+    globalThis.HTMLFormElement.prototype.submit.call(form)
+  } else if (data.type === "error") {
+    backgroundUploads.delete(data.id)
+    console.error(data.error)
+    data.uploads?.forEach((measurement) => recordTelemetry(form, measurement))
+    sendTelemetry(form)
+    for (const [name, fileInput] of inputs) {
+      // the names were cleared, so that the files weren't submitted
+      fileInput.name = name
+      fileInput.setCustomValidity(data.error)
+      fileInput.reportValidity()
+    }
+  }
+}
+
+async function delegateUploads(form, inputs, worker) {
+  // the worker carries on the uploads and submits the form, if the page unloads
+  const id = createCorrelationId()
+  const uploads = []
+  for (const input of inputs) {
+    uploads.push({
+      name: input.name,
+      url: input.getAttribute("data-url"),
+      fields: getFields(input),
+      files: await getUploadFiles(form, input, input.name),
+    })
+  }
+  backgroundUploads.set(id, {
+    form,
+    inputs: new Map(inputs.map((input) => [input.name, input])),
+  })
+  inputs.forEach((input) => {
+    input.name = ""
+  })
+  worker.postMessage({
+    type: "upload",
+    id,
+    action: form.action,
+    fields: [...new globalThis.FormData(form)],
+    uploads,
+    telemetry: form.telemetry && {
+      url: form.telemetry.url,
+      correlationId: form.telemetry.correlationId,
+    },
+  })
+}
+
 function clickSubmit({ currentTarget: submitButton }) {
   const form = submitButton.closest("form")
   const submitInput = document.createElement("input")
@@ -130,6 +384,25 @@ function uploadS3Inputs(form) {
   form.loaded = 0
   form.total = 0
   const inputs = [...form.querySelectorAll("input[type=file].s3file")]
+  const telemetryUrl = inputs
+    .map((input) => input.dataset.s3fTelemetryUrl)
+    .find(Boolean)
+  form.telemetry = null
+
+  if (telemetryUrl && globalThis.navigator.sendBeacon) {
+    form.telemetry = {
+      url: telemetryUrl,
+      correlationId: createCorrelationId(),
+      start: globalThis.performance.now(),
+      uploads: [],
+      sent: false,
+    }
+    const hiddenCorrelationInput = document.createElement("input")
+    hiddenCorrelationInput.type = "hidden"
+    hiddenCorrelationInput.name = "s3file-correlation-id"
+    hiddenCorrelationInput.value = form.telemetry.correlationId
+    form.appendChild(hiddenCorrelationInput)
+  }
 
   inputs.forEach((input) => {
     const hiddenS3Input = document.createElement("input")
@@ -143,6 +416,20 @@ function uploadS3Inputs(form) {
     hiddenSignatureInput.value = input.dataset.s3fSignature
     form.appendChild(hiddenSignatureInput)
   })
+  if (form.serviceWorker) {
+    form.serviceWorker.then((registration) => {
+      if (registration?.active) {
+        delegateUploads(form, inputs, registration.active)
+      } else {
+        startUploads(form, inputs)
+      }
+    })
+  } else {
+    startUploads(form, inputs)
+  }
+}
+
+function startUploads(form, inputs) {
   inputs.forEach((input) => {
     globalThis.uploading += 1
     uploadFiles(form, input, input.name)
@@ -155,7 +442,12 @@ document.addEventListener("DOMContentLoaded", () => {
     return input.closest("form")
   })
   forms = new Set(forms)
+  const serviceWorkerUrl = [...document.querySelectorAll("input[type=file].s3file")]
+    .map((input) => input.dataset.s3fServiceWorkerUrl)
+    .find(Boolean)
+  const serviceWorker = registerServiceWorker(serviceWorkerUrl)
   forms.forEach((form) => {
+    form.serviceWorker = serviceWorker
     form.addEventListener("submit", (e) => {
       e.preventDefault()
       uploadS3Inputs(e.target)
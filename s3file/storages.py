@@ -1,16 +1,550 @@
 import base64
+import contextlib
+import contextvars
 import datetime
+import hashlib
 import hmac
 import json
+import logging
+import mimetypes
 import os
+import shutil
+import sys
+import tempfile
+import threading
+import types
+import uuid
 
 from django.conf import settings
-from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.files.base import File
+from django.core.files.storage import FileSystemStorage, default_storage, storages
+from django.core.signals import setting_changed
+from django.dispatch import receiver
 from django.utils._os import safe_join
+from django.utils.functional import SimpleLazyObject, cached_property, empty
+from django.utils.module_loading import import_string
 from storages.utils import clean_name
 
+logger = logging.getLogger("s3file")
+
+
+class S3MockBody:
+    """Stand-in for botocore's ``StreamingBody``."""
+
+    def __init__(self, file, length):
+        self._file = file
+        self._remaining = length
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def read(self, amt=None):
+        if amt is None or amt < 0 or amt > self._remaining:
+            amt = self._remaining
+        data = self._file.read(amt)
+        self._remaining -= len(data)
+        return data
+
+    def iter_chunks(self, chunk_size=1024):
+        while data := self.read(chunk_size):
+            yield data
+
+    def close(self):
+        self._file.close()
+
+
+class S3MockClient:
+    """Local stand-in for the subset of the boto3 S3 client used by S3File."""
+
+    def __init__(self, root):
+        self.root = root
+        self._uploads = {}
+        self._uploads_lock = threading.Lock()
+
+    def _path(self, key):
+        return safe_join(os.path.abspath(self.root), key)
+
+    @staticmethod
+    def _not_found(operation_name, code="404", message="Not Found"):
+        from botocore.exceptions import ClientError
+
+        return ClientError(
+            {
+                "Error": {"Code": code, "Message": message},
+                "ResponseMetadata": {"HTTPStatusCode": 404},
+            },
+            operation_name,
+        )
+
+    @staticmethod
+    def generate_presigned_post(
+        bucket_name, key, Fields=None, Conditions=None, ExpiresIn=3600
+    ):
+        now = datetime.datetime.now(tz=datetime.UTC)
+        date = now.strftime("%Y%m%dT%H%M%SZ")
+        aws_id = getattr(
+            settings,
+            "AWS_ACCESS_KEY_ID",
+            "AWS_ACCESS_KEY_ID",
+        )
+        fields = {
+            **(Fields or {}),
+            "x-amz-algorithm": "AWS4-HMAC-SHA256",
+            "x-amz-date": date,
+            "x-amz-credential": aws_id,
+            "key": key,
+        }
+        # the same policy document that botocore signs
+        policy = {
+            "expiration": (now + datetime.timedelta(seconds=ExpiresIn)).strftime(
+                "%Y-%m-%dT%H:%M:%SZ"
+            ),
+            "conditions": [
+                *(Conditions or []),
+                ["starts-with", "$key", key.removesuffix("${filename}")]
+                if key.endswith("${filename}")
+                else {"key": key},
+                {"x-amz-algorithm": fields["x-amz-algorithm"]},
+                {"x-amz-credential": aws_id},
+                {"x-amz-date": date},
+            ],
+        }
+        policy = json.dumps(policy).encode()
+        fields["policy"] = base64.b64encode(policy).decode()
+        signature = hmac.new(
+            settings.SECRET_KEY.encode(),
+            policy + date.encode(),
+            "sha256",
+        ).digest()
+        signature = base64.b64encode(signature).decode()
+        return {
+            "url": "/__s3_mock__/",
+            "fields": {"x-amz-signature": signature, **fields},
+        }
+
+    def _stat(self, Key, operation_name):
+        try:
+            stat = os.stat(self._path(Key))
+        except FileNotFoundError as e:
+            raise self._not_found(operation_name) from e
+        return {
+            "ContentLength": stat.st_size,
+            "ContentType": mimetypes.guess_type(Key)[0] or "binary/octet-stream",
+            "LastModified": datetime.datetime.fromtimestamp(
+                stat.st_mtime, tz=datetime.UTC
+            ),
+        }
+
+    def head_bucket(self, Bucket):
+        return {}
+
+    def _metadata_path(self, Key):
+        # hidden from listings, like the temporary files of writes in progress
+        return safe_join(os.path.abspath(self.root), ".s3mock-metadata", f"{Key}.json")
+
+    def _read_metadata(self, Key):
+        """
+        Return the ETag and user metadata stored with an object, if any.
+
+        Metadata is only stored if it differs from a single part upload, and it
+        is ignored once the file has been replaced, e.g. by the S3MockView.
+        """
+        try:
+            with open(self._metadata_path(Key)) as f:
+                metadata = json.load(f)
+        except FileNotFoundError:
+            return None
+        stat = os.stat(self._path(Key))
+        if metadata["stat"] != [stat.st_size, stat.st_mtime_ns]:
+            return None
+        return metadata
+
+    def _etag(self, Key):
+        if metadata := self._read_metadata(Key):
+            return metadata["ETag"]
+        md5 = hashlib.md5()  # noqa: S324
+        with open(self._path(Key), "rb") as f:
+            while chunk := f.read(File.DEFAULT_CHUNK_SIZE):
+                md5.update(chunk)
+        return f'"{md5.hexdigest()}"'
+
+    def head_object(self, Bucket, Key):
+        response = self._stat(Key, "HeadObject")
+        metadata = self._read_metadata(Key)
+        response["ETag"] = self._etag(Key)
+        response["Metadata"] = metadata["Metadata"] if metadata else {}
+        return response
+
+    def get_object(self, Bucket, Key, Range=None, IfMatch=None):
+        from botocore.exceptions import ClientError
+
+        response = self._stat(Key, "GetObject")
+        if IfMatch is not None and IfMatch != self._etag(Key):
+            raise ClientError(
+                {
+                    "Error": {
+                        "Code": "PreconditionFailed",
+                        "Message": "At least one of the pre-conditions you"
+                        " specified did not hold",
+                    },
+                    "ResponseMetadata": {"HTTPStatusCode": 412},
+                },
+                "GetObject",
+            )
+        size = response["ContentLength"]
+        start, end = 0, size
+        if Range:
+            first, last = Range.removeprefix("bytes=").split("-")
+            if not first:
+                start = max(size - int(last), 0)
+            else:
+                start = int(first)
+                end = min(int(last) + 1, size) if last else size
+            response["ContentRange"] = f"bytes {start}-{end - 1}/{size}"
+        f = open(self._path(Key), "rb")  # noqa: SIM115
+        f.seek(start)
+        response["ContentLength"] = end - start
+        response["Body"] = S3MockBody(f, end - start)
+        return response
+
+    def list_objects_v2(self, Bucket, Prefix="", ContinuationToken=None, MaxKeys=1000):
+        root = os.path.abspath(self.root)
+        directory = self._path(Prefix.rpartition("/")[0])
+        keys = sorted(
+            key
+            for dirpath, _, filenames in os.walk(directory)
+            for filename in filenames
+            if (
+                key := os.path.relpath(os.path.join(dirpath, filename), root).replace(
+                    os.sep, "/"
+                )
+            ).startswith(Prefix)
+            and not key.startswith(".s3mock-metadata/")
+            and (ContinuationToken is None or key > ContinuationToken)
+        )
+        contents = []
+        for key in keys[:MaxKeys]:
+            response = self._stat(key, "ListObjectsV2")
+            contents.append({
+                "Key": key,
+                "Size": response["ContentLength"],
+                "LastModified": response["LastModified"],
+            })
+        response = {
+            "Contents": contents,
+            "KeyCount": len(contents),
+            "IsTruncated": len(keys) > MaxKeys,
+        }
+        if response["IsTruncated"]:
+            response["NextContinuationToken"] = contents[-1]["Key"]
+        return response
+
+    def delete_objects(self, Bucket, Delete):
+        deleted = []
+        for obj in Delete["Objects"]:
+            self.delete_object(Bucket, obj["Key"])
+            deleted.append({"Key": obj["Key"]})
+        return {} if Delete.get("Quiet") else {"Deleted": deleted}
+
+    def delete_object(self, Bucket, Key):
+        for path in (self._path(Key), self._metadata_path(Key)):
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+        return {}
+
+    def _write(self, Key, chunks, etag=None, metadata=None):
+        """
+        Write an object atomically and return its ETag.
+
+        The ETag defaults to the MD5 of the content, like for single part uploads.
+        """
+        path = self._path(Key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        md5 = hashlib.md5()  # noqa: S324
+        with tempfile.NamedTemporaryFile(
+            dir=os.path.dirname(path), prefix=".s3mock-", delete=False
+        ) as f:
+            for chunk in chunks:
+                md5.update(chunk)
+                f.write(chunk)
+        os.replace(f.name, path)
+        etag = etag or f'"{md5.hexdigest()}"'
+        metadata_path = self._metadata_path(Key)
+        if metadata or etag != f'"{md5.hexdigest()}"':
+            stat = os.stat(path)
+            os.makedirs(os.path.dirname(metadata_path), exist_ok=True)
+            with open(metadata_path, "w") as f:
+                json.dump(
+                    {
+                        "ETag": etag,
+                        "Metadata": metadata or {},
+                        "stat": [stat.st_size, stat.st_mtime_ns],
+                    },
+                    f,
+                )
+        else:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(metadata_path)
+        return etag
+
+    @staticmethod
+    def _read(body):
+        if isinstance(body, (bytes, bytearray)):
+            yield bytes(body)
+            return
+        while chunk := body.read(File.DEFAULT_CHUNK_SIZE):
+            yield chunk
+
+    def put_object(self, Bucket, Key, Body=b"", Metadata=None, **kwargs):
+        return {"ETag": self._write(Key, self._read(Body), metadata=Metadata)}
+
+    @staticmethod
+    def _copy_source(CopySource):
+        if isinstance(CopySource, str):
+            return CopySource.lstrip("/").split("/", 1)[1]
+        return CopySource["Key"]
+
+    def _copy_chunks(self, CopySource, start=0, end=None):
+        response = self.get_object(
+            None,
+            self._copy_source(CopySource),
+            Range=None if end is None else f"bytes={start}-{end - 1}",
+        )
+        with response["Body"] as body:
+            yield from body.iter_chunks(File.DEFAULT_CHUNK_SIZE)
+
+    def copy_object(
+        self, Bucket, Key, CopySource, Metadata=None, MetadataDirective="COPY", **kwargs
+    ):
+        source = self._copy_source(CopySource)
+        self._stat(source, "CopyObject")
+        if MetadataDirective == "COPY":
+            Metadata = (self._read_metadata(source) or {}).get("Metadata")
+        # the copy is a single part object, even if the source isn't
+        etag = self._write(Key, self._copy_chunks(CopySource), metadata=Metadata)
+        return {
+            "CopyObjectResult": {
+                "ETag": etag,
+                "LastModified": self._stat(Key, "CopyObject")["LastModified"],
+            }
+        }
+
+    def create_multipart_upload(self, Bucket, Key, Metadata=None, **kwargs):
+        upload_id = uuid.uuid4().hex
+        directory = tempfile.mkdtemp(prefix="s3file-multipart-")
+        with open(os.path.join(directory, "metadata.json"), "w") as f:
+            json.dump(Metadata or {}, f)
+        with self._uploads_lock:
+            self._uploads[upload_id] = directory
+        return {"Bucket": Bucket, "Key": Key, "UploadId": upload_id}
+
+    def _upload_dir(self, UploadId, operation_name):
+        try:
+            with self._uploads_lock:
+                return self._uploads[UploadId]
+        except KeyError as e:
+            raise self._not_found(
+                operation_name, "NoSuchUpload", "The specified upload does not exist."
+            ) from e
+
+    def upload_part_copy(
+        self,
+        Bucket,
+        Key,
+        CopySource,
+        PartNumber,
+        UploadId,
+        CopySourceRange=None,
+        **kwargs,
+    ):
+        directory = self._upload_dir(UploadId, "UploadPartCopy")
+        start, end = 0, None
+        if CopySourceRange:
+            first, last = CopySourceRange.removeprefix("bytes=").split("-")
+            start, end = int(first), int(last) + 1
+        self._stat(self._copy_source(CopySource), "UploadPartCopy")
+        md5 = hashlib.md5()  # noqa: S324
+        with open(os.path.join(directory, f"{PartNumber:05d}"), "wb") as f:
+            for chunk in self._copy_chunks(CopySource, start, end):
+                md5.update(chunk)
+                f.write(chunk)
+        return {"CopyPartResult": {"ETag": f'"{md5.hexdigest()}"'}}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        directory = self._upload_dir(UploadId, "CompleteMultipartUpload")
+
+        def chunks():
+            for part in MultipartUpload["Parts"]:
+                with open(
+                    os.path.join(directory, f"{part['PartNumber']:05d}"), "rb"
+                ) as f:
+                    while chunk := f.read(File.DEFAULT_CHUNK_SIZE):
+                        yield chunk
+
+        # S3's ETag of a multipart object is the MD5 of its parts' MD5 digests
+        md5 = hashlib.md5()  # noqa: S324
+        for part in MultipartUpload["Parts"]:
+            md5.update(bytes.fromhex(part["ETag"].strip('"')))
+        with open(os.path.join(directory, "metadata.json")) as f:
+            metadata = json.load(f)
+        try:
+            etag = self._write(
+                Key,
+                chunks(),
+                etag=f'"{md5.hexdigest()}-{len(MultipartUpload["Parts"])}"',
+                metadata=metadata,
+            )
+        finally:
+            self.abort_multipart_upload(Bucket, Key, UploadId)
+        return {"Bucket": Bucket, "Key": Key, "ETag": etag}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        with self._uploads_lock:
+            directory = self._uploads.pop(UploadId, "")
+        shutil.rmtree(directory, ignore_errors=True)
+        return {}
+
+    def copy(self, CopySource, Bucket, Key, ExtraArgs=None, Config=None, **kwargs):
+        """
+        Copy an object like boto3's managed transfer.
+
+        Objects larger than the transfer config's multipart threshold are
+        copied in parts with ``UploadPartCopy``, smaller ones with ``CopyObject``.
+        """
+        threshold = getattr(Config, "multipart_threshold", 8 * 1024 * 1024)
+        chunksize = getattr(Config, "multipart_chunksize", 8 * 1024 * 1024)
+        size = self._stat(self._copy_source(CopySource), "HeadObject")["ContentLength"]
+        if size < threshold:
+            self.copy_object(
+                Bucket=Bucket, Key=Key, CopySource=CopySource, **(ExtraArgs or {})
+            )
+            return
+        upload_id = self.create_multipart_upload(
+            Bucket=Bucket, Key=Key, **(ExtraArgs or {})
+        )["UploadId"]
+        parts = []
+        for number, start in enumerate(range(0, size, chunksize), 1):
+            response = self.upload_part_copy(
+                Bucket=Bucket,
+                Key=Key,
+                CopySource=CopySource,
+                PartNumber=number,
+                UploadId=upload_id,
+                CopySourceRange=f"bytes={start}-{min(start + chunksize, size) - 1}",
+            )
+            parts.append({
+                "ETag": response["CopyPartResult"]["ETag"],
+                "PartNumber": number,
+            })
+        self.complete_multipart_upload(
+            Bucket=Bucket, Key=Key, UploadId=upload_id, MultipartUpload={"Parts": parts}
+        )
+
+
+class S3MockObject:
+    """Stand-in for boto3's ``s3.Object`` resource."""
+
+    def __init__(self, client, bucket_name, key):
+        self.meta = types.SimpleNamespace(client=client, data=None)
+        self.bucket_name = bucket_name
+        self.key = key
+
+    def load(self, **kwargs):
+        self.meta.data = self.meta.client.head_object(
+            Bucket=self.bucket_name, Key=self.key
+        )
+
+    reload = load
+
+    def _attribute(name):
+        def get(self):
+            if self.meta.data is None:
+                self.load()
+            return self.meta.data.get(name)
+
+        return property(get)
+
+    content_length = _attribute("ContentLength")
+    content_type = _attribute("ContentType")
+    content_encoding = _attribute("ContentEncoding")
+    e_tag = _attribute("ETag")
+    last_modified = _attribute("LastModified")
+    del _attribute
+
+    def get(self, **kwargs):
+        return self.meta.client.get_object(
+            Bucket=self.bucket_name, Key=self.key, **kwargs
+        )
+
+    def put(self, Body=b"", **kwargs):
+        return self.meta.client.put_object(
+            Bucket=self.bucket_name, Key=self.key, Body=Body, **kwargs
+        )
+
+    def delete(self):
+        return self.meta.client.delete_object(Bucket=self.bucket_name, Key=self.key)
+
+    def download_fileobj(self, Fileobj, ExtraArgs=None, Config=None, **kwargs):
+        with self.get()["Body"] as body:
+            for chunk in body.iter_chunks(File.DEFAULT_CHUNK_SIZE):
+                Fileobj.write(chunk)
+
+    def upload_fileobj(self, Fileobj, ExtraArgs=None, Config=None, **kwargs):
+        self.put(Body=Fileobj, **(ExtraArgs or {}))
+
+    def copy(self, CopySource, ExtraArgs=None, Config=None, **kwargs):
+        self.meta.client.copy(
+            CopySource, self.bucket_name, self.key, ExtraArgs=ExtraArgs, Config=Config
+        )
+
+    def copy_from(self, CopySource, **kwargs):
+        return self.meta.client.copy_object(
+            Bucket=self.bucket_name, Key=self.key, CopySource=CopySource, **kwargs
+        )
+
+
+class S3MockBucket:
+    """Stand-in for boto3's ``s3.Bucket`` resource."""
+
+    def __init__(self, client, name):
+        self.meta = types.SimpleNamespace(client=client)
+        self.name = name
+
+    def Object(self, key):  # noqa: N802
+        return S3MockObject(self.meta.client, self.name, key)
+
+
+class S3MockResource:
+    """Stand-in for boto3's S3 service resource, which stores objects locally."""
+
+    def __init__(self, root):
+        self.meta = types.SimpleNamespace(client=S3MockClient(root))
+
+    def Bucket(self, name):  # noqa: N802
+        return S3MockBucket(self.meta.client, name)
+
+
+class S3MockMixin:
+    """
+    Serve a storage's S3 API from the local file system.
+
+    Objects are stored in the ``base_location`` directory, which is also
+    where the :class:`s3file.views.S3MockView` stores uploaded files.
+    """
+
+    @cached_property
+    def connection(self):
+        return S3MockResource(self.base_location)
 
-class S3MockStorage(FileSystemStorage):
+    @property
+    def bucket(self):
+        return self.connection.Bucket(self.bucket_name)
+
+
+class S3MockStorage(S3MockMixin, FileSystemStorage):
     @property
     def location(self):
         return safe_join(os.path.abspath(self.base_location), get_aws_location())
@@ -19,47 +553,168 @@ class S3MockStorage(FileSystemStorage):
         name = clean_name(name)
         return super().open(name, mode=mode)
 
-    class connection:
-        class meta:
-            class client:
-                @staticmethod
-                def generate_presigned_post(bucket_name, key, **policy):
-                    policy = json.dumps(policy).encode()
-                    policy_b64 = base64.b64encode(policy).decode()
-                    date = datetime.datetime.now(tz=datetime.UTC).strftime(
-                        "%Y%m%dT%H%M%SZ"
-                    )
-                    aws_id = getattr(
-                        settings,
-                        "AWS_ACCESS_KEY_ID",
-                        "AWS_ACCESS_KEY_ID",
-                    )
-                    fields = {
-                        "x-amz-algorithm": "AWS4-HMAC-SHA256",
-                        "x-amz-date": date,
-                        "x-amz-credential": aws_id,
-                        "policy": policy_b64,
-                        "key": key,
-                    }
-                    signature = hmac.new(
-                        settings.SECRET_KEY.encode(),
-                        policy + date.encode(),
-                        "sha256",
-                    ).digest()
-                    signature = base64.b64encode(signature).decode()
-                    return {
-                        "url": "/__s3_mock__/",
-                        "fields": {"x-amz-signature": signature, **fields},
-                    }
-
-    class bucket:
-        name = "test-bucket"
-
-
-local_dev = isinstance(default_storage, FileSystemStorage)
-
-storage = default_storage if not local_dev else S3MockStorage()
+    def __init__(self, *args, bucket_name="test-bucket", **kwargs):
+        super().__init__(*args, **kwargs)
+        self.bucket_name = bucket_name
+
+
+def is_s3_storage_class(storage_class):
+    """
+    Return whether a storage class is an S3 storage of django-storages.
+
+    Only the class is inspected, so boto3 isn't imported and the storage isn't
+    instantiated, unless the class is an S3 storage.
+    """
+    s3 = sys.modules.get("storages.backends.s3")
+    return s3 is not None and issubclass(storage_class, s3.S3Storage)
+
+
+def is_local_dev():
+    """Return whether the local S3 mock is used instead of S3."""
+    return isinstance(default_storage, (FileSystemStorage, S3MockMixin))
+
+
+def reset_connections(storage):
+    """Discard a storage's clients, so they are created again on first use."""
+    if hasattr(storage, "_connections"):
+        # django-storages keeps thread-local connections and a bucket resource
+        storage._connections = threading.local()
+        storage._bucket = None
+
+
+def configure_client(storage):
+    """
+    Apply S3File's connection pool settings to an S3 storage's client config.
+
+    The ``S3FILE_MAX_POOL_CONNECTIONS`` and ``S3FILE_TCP_KEEPALIVE`` settings
+    are merged into the storage's botocore config. The storages are shared with
+    the rest of the project, e.g. ``default_storage``, so the settings apply to
+    all of their clients. Clients that have been created with the previous
+    config are discarded.
+    """
+    options = {
+        option: value
+        for option, setting in [
+            ("max_pool_connections", "S3FILE_MAX_POOL_CONNECTIONS"),
+            ("tcp_keepalive", "S3FILE_TCP_KEEPALIVE"),
+        ]
+        if (value := getattr(settings, setting, None)) is not None
+    }
+    client_config = getattr(storage, "client_config", None)
+    if client_config is not None and any(
+        getattr(client_config, option) != value for option, value in options.items()
+    ):
+        from botocore.config import Config
+
+        storage.client_config = client_config.merge(Config(**options))
+        reset_connections(storage)
+    return storage
+
+
+class AtomicLazyObject(SimpleLazyObject):
+    """Lazy object that is set up only once, even if accessed by many threads."""
+
+    def __init__(self, func):
+        self.__dict__["_lock"] = threading.Lock()
+        super().__init__(func)
+
+    def _setup(self):
+        with self.__dict__["_lock"]:
+            if self._wrapped is empty:
+                super()._setup()
+
+
+# resolved on first use to avoid loading the storage backend at import time
+storage = AtomicLazyObject(
+    lambda: (
+        S3MockStorage()
+        if isinstance(default_storage, FileSystemStorage)
+        else configure_client(default_storage)
+    )
+)
+
+
+@receiver(setting_changed)
+def reset_storage(*, setting, **kwargs):
+    if setting == "STORAGES":
+        with storage._lock:
+            storage._wrapped = empty
+
+
+current_request = contextvars.ContextVar("s3file_current_request", default=None)
 
 
 def get_aws_location():
     return getattr(settings, "AWS_LOCATION", "")
+
+
+def get_storage(alias=None):
+    """Return the storage for an alias from the ``STORAGES`` setting, or the default."""
+    if alias is None:
+        return storage
+    return configure_client(storages[alias])
+
+
+def get_mock_storage(bucket_name):
+    """Return the local S3 mock storage for a bucket name."""
+    for alias in settings.STORAGES:
+        if (
+            isinstance(mock_storage := storages[alias], S3MockMixin)
+            and mock_storage.bucket.name == bucket_name
+        ):
+            return mock_storage
+    return storage
+
+
+def route_storage():
+    """
+    Return the storage alias to upload the current request's files to.
+
+    The alias is chosen by the callable in the ``S3FILE_STORAGE_ROUTER`` setting,
+    which receives the current request. ``None`` is the default storage.
+    """
+    router = getattr(settings, "S3FILE_STORAGE_ROUTER", None)
+    if router is None or (request := current_request.get()) is None:
+        return None
+    return import_string(router)(request)
+
+
+def warm_up(*aliases):
+    """
+    Create the S3 clients of the given storages and connect to their buckets.
+
+    Call this in a freshly forked worker, so the first request doesn't pay for
+    the client setup, credential lookup and TLS handshake. Connections that
+    were inherited from the parent process are discarded, since they must not
+    be shared between processes. Without aliases, the default storage is used.
+
+    django-storages keeps a connection per thread, so only the calling thread's
+    connection is warmed up.
+    """
+    for alias in aliases or [None]:
+        s3_storage = get_storage(alias)
+        reset_connections(s3_storage)
+        try:
+            s3_storage.connection.meta.client.head_bucket(Bucket=s3_storage.bucket.name)
+        except Exception:
+            logger.warning("Failed to warm up storage %r.", alias, exc_info=True)
+
+
+def get_warm_up_aliases():
+    """Return the storage aliases from the ``S3FILE_WARM_UP`` setting."""
+    aliases = getattr(settings, "S3FILE_WARM_UP", True)
+    if aliases is True:
+        return [None]
+    return list(aliases or [])
+
+
+def post_worker_init(worker):
+    """Gunicorn server hook to warm up S3File's storages in each worker."""
+    if aliases := get_warm_up_aliases():
+        warm_up(*aliases)
+
+
+def __getattr__(name):
+    if name == "local_dev":
+        return is_local_dev()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
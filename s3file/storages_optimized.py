@@ -1,6 +1,17 @@
+import posixpath
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
 from storages.backends.s3boto3 import S3Boto3Storage
 from storages.utils import clean_name
 
+from . import metrics
+from .files import S3BundleMemberFile, S3ObjectFile, head_object
+from .storages import S3MockMixin
+
+DEDUPLICATE_MODES = (None, "etag", "content")
+SOURCE_ETAG_METADATA = "s3file-source-etag"
+
 
 class S3OptimizedUploadStorage(S3Boto3Storage):
     """
@@ -10,14 +21,113 @@ class S3OptimizedUploadStorage(S3Boto3Storage):
     command when the object already is a S3 object where the faster copy command can be used.
 
     The assumption is that `content` contains a S3 object from which we can copy.
+    Files from a bundle are copied from their archive's byte range in parts.
 
     See also discussion here: https://github.com/codingjoe/django-s3file/discussions/126
+
+    The ``deduplicate`` option, which defaults to the ``S3FILE_DEDUPLICATE``
+    setting, avoids copying content that is already stored:
+
+    * ``"etag"`` skips the copy if the destination has been copied from an
+      object with the source's ETag, which is stored in the copy's metadata,
+    * ``"content"`` names files after the source's ETag, so that identical
+      uploads converge on a single object, which is only copied once.
     """
 
+    def __init__(self, **settings):
+        super().__init__(**settings)
+        if self.deduplicate not in DEDUPLICATE_MODES:
+            raise ImproperlyConfigured(
+                f"Invalid deduplicate mode {self.deduplicate!r},"
+                f" choose one of {DEDUPLICATE_MODES}."
+            )
+
+    def get_default_settings(self):
+        return {
+            **super().get_default_settings(),
+            "deduplicate": getattr(settings, "S3FILE_DEDUPLICATE", None),
+        }
+
+    @staticmethod
+    def get_etag(content):
+        """Return the ETag of an S3 file, without a request if it is known."""
+        if isinstance(content, S3ObjectFile):
+            # cached metadata must not skip the copy of a replaced object
+            content.file.validate()
+            return content.metadata.get("ETag")
+        return content.obj.e_tag
+
+    def get_content_name(self, name, etag):
+        """Return a name derived from the ETag, keeping the folder and extension."""
+        directory, basename = posixpath.split(name)
+        extension = posixpath.splitext(basename)[1]
+        return posixpath.join(directory, etag.strip('"') + extension)
+
+    def is_duplicate(self, name, etag, size):
+        """Return whether the object at the normalized name holds the same content."""
+        try:
+            metadata = head_object(self.connection.meta.client, self.bucket.name, name)
+        except FileNotFoundError:
+            return False
+        # copies in parts get a different ETag than their source
+        source_etag = metadata.get("Metadata", {}).get(SOURCE_ETAG_METADATA)
+        if source_etag is not None:
+            return source_etag == etag
+        if self.deduplicate == "content":
+            # the name is derived from the ETag
+            return metadata["ContentLength"] == size
+        return metadata.get("ETag") == etag
+
+    def copy_member(self, obj, content, params):
+        """Copy a bundle member's byte range of its archive to the object."""
+        client = obj.meta.client
+        size = content.size
+        if not size:
+            # ranges can't be empty
+            obj.put(Body=b"", **params)
+            return
+        offset = content.file.data_offset
+        chunksize = self.transfer_config.multipart_chunksize
+        upload_id = client.create_multipart_upload(
+            Bucket=obj.bucket_name, Key=obj.key, **params
+        )["UploadId"]
+        try:
+            parts = []
+            for number, start in enumerate(range(0, size, chunksize), 1):
+                end = min(start + chunksize, size)
+                response = client.upload_part_copy(
+                    Bucket=obj.bucket_name,
+                    Key=obj.key,
+                    CopySource={"Bucket": self.bucket.name, "Key": content.key},
+                    CopySourceRange=f"bytes={offset + start}-{offset + end - 1}",
+                    PartNumber=number,
+                    UploadId=upload_id,
+                )
+                parts.append({
+                    "ETag": response["CopyPartResult"]["ETag"],
+                    "PartNumber": number,
+                })
+            client.complete_multipart_upload(
+                Bucket=obj.bucket_name,
+                Key=obj.key,
+                UploadId=upload_id,
+                MultipartUpload={"Parts": parts},
+            )
+        except Exception:
+            client.abort_multipart_upload(
+                Bucket=obj.bucket_name, Key=obj.key, UploadId=upload_id
+            )
+            raise
+
     def _save(self, name, content):
         # Basically copy the implementation of _save of S3Boto3Storage
         # and replace the obj.upload_fileobj with a copy function
         cleaned_name = clean_name(name)
+        etag = None
+        if self.deduplicate:
+            etag = self.get_etag(content)
+            if etag and self.deduplicate == "content":
+                cleaned_name = self.get_content_name(cleaned_name, etag)
         name = self._normalize_name(cleaned_name)
         params = self._get_write_parameters(name, content)
 
@@ -29,16 +139,61 @@ class S3OptimizedUploadStorage(S3Boto3Storage):
             content = self._compress_content(content)
             params["ContentEncoding"] = "gzip"
 
+        if etag:
+            params["Metadata"] = {
+                **params.get("Metadata", {}),
+                SOURCE_ETAG_METADATA: etag,
+            }
+
         obj = self.bucket.Object(name)
         # content.seek(0, os.SEEK_SET)  # Disable unnecessary seek operation
         # obj.upload_fileobj(content, ExtraArgs=params)  # Disable upload function
 
-        if not hasattr(content, "obj") or not hasattr(content.obj, "key"):
+        if not isinstance(content, S3BundleMemberFile) and (
+            not hasattr(content, "obj") or not hasattr(content.obj, "key")
+        ):
             raise TypeError(
                 "The content object must be a S3 object and contain a valid key."
             )
 
         # Copy the file instead uf uploading
-        obj.copy({"Bucket": self.bucket.name, "Key": content.obj.key}, ExtraArgs=params)
+        size = getattr(content, "size", None)
+        with metrics.timer("copy", bytes=size) as labels:
+            if etag and self.is_duplicate(name, etag, size):
+                labels["bytes"] = 0
+                labels["deduplicated"] = True
+            elif isinstance(content, S3BundleMemberFile):
+                self.copy_member(obj, content, params)
+            else:
+                if etag:
+                    params["MetadataDirective"] = "REPLACE"
+                obj.copy(
+                    {"Bucket": self.bucket.name, "Key": content.obj.key},
+                    ExtraArgs=params,
+                    Config=self.transfer_config,
+                )
 
         return cleaned_name
+
+
+class S3OptimizedMockStorage(S3MockMixin, S3OptimizedUploadStorage):
+    """
+    Optimized S3 storage, that stores objects locally instead of on S3.
+
+    Like the ``S3MockStorage``, it works with the local S3 mock. Files are
+    saved with the same copy operations as on S3, e.g. to test and benchmark
+    the optimized storage without AWS credentials or network access::
+
+        STORAGES = {
+            "default": {
+                "BACKEND": "s3file.storages_optimized.S3OptimizedMockStorage",
+            },
+        }
+    """
+
+    def get_default_settings(self):
+        return {
+            **super().get_default_settings(),
+            "base_location": settings.MEDIA_ROOT,
+            "bucket_name": "test-bucket",
+        }
@@ -0,0 +1,97 @@
+"""
+Processing of uploaded files outside the request-response cycle.
+
+Post-processing like thumbnails, virus scans or metadata extraction does not
+need to block the response. Connect a receiver to the
+:data:`s3file.signals.files_resolved` signal and enqueue a task with the
+uploads::
+
+    @receiver(files_resolved)
+    def make_thumbnails(*, uploads, **kwargs):
+        tasks.enqueue("myapp.tasks.make_thumbnails", uploads)
+
+Tasks are run by the executor in the ``S3FILE_EXECUTOR`` setting, which
+defaults to a thread pool in the web server's process.
+"""
+
+import concurrent.futures
+import functools
+import logging
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import close_old_connections
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger("s3file.tasks")
+
+
+class BaseExecutor:
+    """Run tasks in the background."""
+
+    def submit(self, task, *args, **kwargs):
+        """
+        Run the task with the given arguments in the background.
+
+        The task is the dotted path of a function and the arguments are
+        JSON-serializable, so that they can be passed to a task queue.
+        """
+        raise NotImplementedError  # pragma: no cover
+
+
+class ImmediateExecutor(BaseExecutor):
+    """Run tasks right away, e.g. in tests."""
+
+    def submit(self, task, *args, **kwargs):
+        import_string(task)(*args, **kwargs)
+
+
+class ThreadPoolExecutor(BaseExecutor):
+    """
+    Run tasks in a thread pool of the web server's process.
+
+    Tasks are lost if the process exits before they finish. Use a task queue
+    for tasks that must not be lost.
+    """
+
+    max_workers = 4
+
+    def __init__(self):
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=getattr(settings, "S3FILE_EXECUTOR_MAX_WORKERS", None)
+            or self.max_workers,
+            thread_name_prefix="s3file",
+        )
+
+    def submit(self, task, *args, **kwargs):
+        return self.executor.submit(self.run, task, *args, **kwargs)
+
+    @staticmethod
+    def run(task, *args, **kwargs):
+        try:
+            import_string(task)(*args, **kwargs)
+        except Exception:
+            logger.exception("Task %s failed.", task)
+        finally:
+            # tasks may use the database outside a request
+            close_old_connections()
+
+
+@functools.cache
+def get_executor():
+    """Return the executor from the ``S3FILE_EXECUTOR`` setting."""
+    return import_string(
+        getattr(settings, "S3FILE_EXECUTOR", None) or "s3file.tasks.ThreadPoolExecutor"
+    )()
+
+
+@receiver(setting_changed)
+def reset_executor(*, setting, **kwargs):
+    if setting in ("S3FILE_EXECUTOR", "S3FILE_EXECUTOR_MAX_WORKERS"):
+        get_executor.cache_clear()
+
+
+def enqueue(task, uploads, **kwargs):
+    """Submit a task for the uploads of a ``files_resolved`` signal."""
+    return get_executor().submit(task, uploads, **kwargs)
@@ -0,0 +1,94 @@
+"""
+Real-user upload telemetry sent by ``s3file.js``.
+
+If the ``S3FILE_TELEMETRY`` setting is enabled, the browser measures each
+upload to S3 and sends all measurements of a form submission in a single
+beacon to the :class:`s3file.views.TelemetryView`. The beacon is passed to the
+sink in the ``S3FILE_TELEMETRY_SINK`` setting, which defaults to the
+:class:`MetricsSink`.
+"""
+
+import functools
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from . import metrics
+
+
+class BaseSink:
+    """Receive the upload telemetry of a form submission."""
+
+    def record(self, correlation_id, duration, uploads):
+        """
+        Record the uploads of a form submission.
+
+        The correlation ID is also submitted with the form, the duration is the
+        time in seconds from the form's submission until all uploads finished.
+        Each upload is a dictionary with the ``field`` name, the file's ``size``
+        in bytes, the ``ttfb`` (time until the first bytes were sent) and
+        ``duration`` in seconds, the HTTP ``status`` and an ``error``, if any.
+        """
+        raise NotImplementedError  # pragma: no cover
+
+
+class MetricsSink(BaseSink):
+    """
+    Record the telemetry with the ``S3FILE_METRICS_BACKEND``.
+
+    The beacon is sent by the browser and can't be trusted. To keep the number
+    of label sets bounded, uploads are only labeled with their status class,
+    e.g. ``2xx``, and the kind of error, but not the field name.
+    """
+
+    error_kinds = {"0": "network", "4xx": "rejected", "5xx": "server"}
+
+    @staticmethod
+    def get_status_class(status):
+        """Return the class of an HTTP status, or ``0`` for network errors."""
+        return f"{status // 100}xx" if 100 <= status < 600 else "0"
+
+    def get_error_kind(self, upload):
+        """Return one of a fixed set of error kinds, or ``None``."""
+        if upload["error"] is None:
+            return None
+        return self.error_kinds.get(self.get_status_class(upload["status"]), "other")
+
+    def record(self, correlation_id, duration, uploads):
+        backend = metrics.get_backend()
+        for upload in uploads:
+            labels = {
+                "bytes": upload["size"],
+                "status": self.get_status_class(upload["status"]),
+                "error": self.get_error_kind(upload),
+                "correlation_id": correlation_id,
+            }
+            backend.record("upload", upload["duration"], labels)
+            if upload["ttfb"] is not None:
+                backend.record("upload_ttfb", upload["ttfb"], labels)
+        backend.record(
+            "submission",
+            duration,
+            {
+                "files": len(uploads),
+                "bytes": sum(upload["size"] for upload in uploads),
+                "error": next(filter(None, map(self.get_error_kind, uploads)), None),
+                "correlation_id": correlation_id,
+            },
+        )
+
+
+@functools.cache
+def get_sink():
+    """Return the sink from the ``S3FILE_TELEMETRY_SINK`` setting."""
+    return import_string(
+        getattr(settings, "S3FILE_TELEMETRY_SINK", "s3file.telemetry.MetricsSink")
+    )()
+
+
+@receiver(setting_changed)
+def reset_sink(*, setting, **kwargs):
+    if setting == "S3FILE_TELEMETRY_SINK":
+        get_sink.cache_clear()
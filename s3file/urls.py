@@ -0,0 +1,10 @@
+from django.urls import path
+
+from . import views
+
+app_name = "s3file"
+
+urlpatterns = [
+    path("presign/", views.PresignView.as_view(), name="presign"),
+    path("telemetry/", views.TelemetryView.as_view(), name="telemetry"),
+]
@@ -0,0 +1,91 @@
+from django.core.exceptions import ValidationError
+from django.template.defaultfilters import filesizeformat
+from django.utils.deconstruct import deconstructible
+from django.utils.translation import gettext_lazy as _
+
+from .files import get_metadata
+
+
+@deconstructible
+class MaxSizeValidator:
+    """Validate the size of a file using its S3 object metadata."""
+
+    message = _(
+        "Ensure this file is not larger than %(limit_value)s (it is %(show_value)s)."
+    )
+    code = "max_size"
+
+    def __init__(self, limit_value, message=None, code=None):
+        self.limit_value = limit_value
+        if message is not None:
+            self.message = message
+        if code is not None:
+            self.code = code
+
+    def __call__(self, value):
+        size = get_metadata(value)["ContentLength"]
+        if size > self.limit_value:
+            raise ValidationError(
+                self.message,
+                code=self.code,
+                params={
+                    "limit_value": filesizeformat(self.limit_value),
+                    "show_value": filesizeformat(size),
+                    "value": value,
+                },
+            )
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, self.__class__)
+            and self.limit_value == other.limit_value
+            and self.message == other.message
+            and self.code == other.code
+        )
+
+
+@deconstructible
+class ContentTypeValidator:
+    """
+    Validate the content type of a file using its S3 object metadata.
+
+    Allowed types may use wildcards for the subtype, e.g. ``image/*``.
+    """
+
+    message = _(
+        "File type “%(content_type)s” is not allowed. "
+        "Allowed types are: %(allowed_types)s."
+    )
+    code = "invalid_content_type"
+
+    def __init__(self, allowed_types, message=None, code=None):
+        self.allowed_types = [allowed_type.lower() for allowed_type in allowed_types]
+        if message is not None:
+            self.message = message
+        if code is not None:
+            self.code = code
+
+    def __call__(self, value):
+        content_type = (get_metadata(value)["ContentType"] or "").lower()
+        top_type = content_type.split("/", 1)[0]
+        if (
+            content_type not in self.allowed_types
+            and f"{top_type}/*" not in self.allowed_types
+        ):
+            raise ValidationError(
+                self.message,
+                code=self.code,
+                params={
+                    "content_type": content_type,
+                    "allowed_types": ", ".join(self.allowed_types),
+                    "value": value,
+                },
+            )
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, self.__class__)
+            and set(self.allowed_types) == set(other.allowed_types)
+            and self.message == other.message
+            and self.code == other.code
+        )
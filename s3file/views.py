@@ -1,56 +1,346 @@
 import base64
+import binascii
+import datetime
 import hashlib
 import hmac
+import json
 import logging
+import math
+import uuid
+from xml.sax.saxutils import escape
 
 from django import http
 from django.conf import settings
-from django.core.files.storage import default_storage
+from django.core.files.storage import FileSystemStorage
+from django.http.multipartparser import MultiPartParser
+from django.utils.decorators import method_decorator
 from django.views import generic
+from django.views.decorators.csrf import csrf_exempt
+
+from . import telemetry
+from .storages import get_mock_storage
 
 logger = logging.getLogger("s3file")
 
 
+class PolicyError(Exception):
+    """Upload that S3 would reject, carrying the S3 error code and details."""
+
+    def __init__(self, message, code="AccessDenied", status=403, **details):
+        super().__init__(message)
+        self.message = message
+        self.code = code
+        self.status = status
+        self.details = details
+
+
 class S3MockView(generic.View):
+    """
+    Local stand-in for S3's browser-based upload endpoint.
+
+    Like S3, the view verifies the signed policy's expiration and conditions
+    before storing the upload and responds with S3's XML documents.
+    """
+
+    # form fields that are not covered by the policy's conditions
+    unsigned_fields = {"policy", "x-amz-signature", "file"}
+
     def post(self, request):
-        success_action_status = request.POST.get("success_action_status", 201)
         try:
+            for field in ["key", "policy", "x-amz-signature", "x-amz-date", "file"]:
+                if field not in request.POST and field not in request.FILES:
+                    raise PolicyError(
+                        f"Bucket POST must contain a field named '{field}'."
+                        "  If it is specified, please check the order of the fields.",
+                        code="InvalidArgument",
+                        status=400,
+                    )
             file = request.FILES["file"]
-            key = request.POST["key"]
-            date = request.POST["x-amz-date"]
-            signature = request.POST["x-amz-signature"]
-            policy = request.POST["policy"]
-        except KeyError:
-            logger.exception("bad request")
-            return http.HttpResponseBadRequest()
-
-        try:
-            signature = base64.b64decode(signature.encode())
-            policy = base64.b64decode(policy.encode())
-
-            calc_sign = hmac.new(
-                settings.SECRET_KEY.encode(), policy + date.encode(), "sha256"
-            ).digest()
-        except ValueError:
-            logger.exception("bad request")
-            return http.HttpResponseBadRequest()
+            policy = self.verify_signature(
+                request.POST["policy"],
+                request.POST["x-amz-date"],
+                request.POST["x-amz-signature"],
+            )
+            key = request.POST["key"].replace("${filename}", file.name)
+            fields = {name.lower(): value for name, value in request.POST.items()}
+            fields["key"] = key
+            self.verify_policy(policy, fields, file.size)
+        except PolicyError as e:
+            logger.warning("bad request: %s", e.message)
+            return self.error_response(e)
 
-        if not hmac.compare_digest(signature, calc_sign):
-            logger.warning("bad signature")
-            return http.HttpResponseForbidden()
-
-        key = key.replace("${filename}", file.name)
-        etag = hashlib.md5(file.read()).hexdigest()  # noqa: S324
+        bucket_name = next(
+            (
+                condition["bucket"]
+                for condition in policy["conditions"]
+                if isinstance(condition, dict) and "bucket" in condition
+            ),
+            None,
+        )
+        etag = hashlib.md5()  # noqa: S324
+        for chunk in file.chunks():
+            etag.update(chunk)
         file.seek(0)
-        key = default_storage.save(key, file)
+        key = FileSystemStorage(
+            location=get_mock_storage(bucket_name).base_location
+        ).save(key, file)
+
+        success_action_status = fields.get("success_action_status")
+        if success_action_status != "201":
+            # S3 responds with an empty 204 response, unless 200 was requested
+            return http.HttpResponse(
+                status=200 if success_action_status == "200" else 204,
+                headers={"ETag": f'"{etag.hexdigest()}"'},
+            )
         return http.HttpResponse(
             '<?xml version="1.0" encoding="UTF-8"?>'
             "<PostResponse>"
-            f"<Location>{settings.MEDIA_URL}{key}</Location>"
-            f"<Bucket>{getattr(settings, 'AWS_STORAGE_BUCKET_NAME')}</Bucket>"
-            f"<Key>{key}</Key>"
-            f'<ETag>"{etag}"</ETag>'
+            f"<Location>{escape(settings.MEDIA_URL + key)}</Location>"
+            f"<Bucket>{escape(bucket_name or '')}</Bucket>"
+            f"<Key>{escape(key)}</Key>"
+            f'<ETag>"{etag.hexdigest()}"</ETag>'
             "</PostResponse>",
-            status=success_action_status,
+            status=201,
             content_type="application/xml",
         )
+
+    @staticmethod
+    def verify_signature(policy, date, signature):
+        """Return the decoded policy document, if the signature is valid."""
+        try:
+            signature = base64.b64decode(signature.encode(), validate=True)
+            policy = base64.b64decode(policy.encode(), validate=True)
+        except (ValueError, binascii.Error) as e:
+            raise PolicyError(
+                "Invalid Policy: Invalid 'Base64' encoding.",
+                code="InvalidPolicyDocument",
+                status=400,
+            ) from e
+        calc_sign = hmac.new(
+            settings.SECRET_KEY.encode(), policy + date.encode(), "sha256"
+        ).digest()
+        if not hmac.compare_digest(signature, calc_sign):
+            raise PolicyError(
+                "The request signature we calculated does not match the signature"
+                " you provided. Check your key and signing method.",
+                code="SignatureDoesNotMatch",
+            )
+        try:
+            policy = json.loads(policy)
+            policy["expiration"], policy["conditions"]
+        except (ValueError, KeyError, TypeError) as e:
+            raise PolicyError(
+                "Invalid Policy: Invalid JSON.",
+                code="InvalidPolicyDocument",
+                status=400,
+            ) from e
+        return policy
+
+    @classmethod
+    def verify_policy(cls, policy, fields, size):
+        """Raise a PolicyError, if the form fields violate the policy."""
+        expiration = datetime.datetime.strptime(
+            policy["expiration"], "%Y-%m-%dT%H:%M:%S%z"
+        )
+        if expiration < datetime.datetime.now(tz=datetime.UTC):
+            raise PolicyError("Invalid according to Policy: Policy expired.")
+
+        signed_fields = {"bucket"}
+        for condition in policy["conditions"]:
+            if isinstance(condition, dict):
+                for name, value in condition.items():
+                    signed_fields.add(name.lower())
+                    cls.verify_condition(["eq", f"${name}", value], fields, size)
+            else:
+                if condition[0].lower() != "content-length-range":
+                    signed_fields.add(condition[1].removeprefix("$").lower())
+                cls.verify_condition(condition, fields, size)
+
+        if extra_fields := [
+            name
+            for name in fields
+            if name not in signed_fields
+            and name not in cls.unsigned_fields
+            and not name.startswith("x-ignore-")
+        ]:
+            raise PolicyError(
+                f"Invalid according to Policy: Extra input fields: {extra_fields[0]}"
+            )
+
+    @staticmethod
+    def verify_condition(condition, fields, size):
+        operator, *args = condition
+        match operator.lower(), args:
+            case "content-length-range", [min_size, max_size]:
+                if size > int(max_size):
+                    raise PolicyError(
+                        "Your proposed upload exceeds the maximum allowed size",
+                        code="EntityTooLarge",
+                        status=400,
+                        ProposedSize=size,
+                        MaxSizeAllowed=max_size,
+                    )
+                if size < int(min_size):
+                    raise PolicyError(
+                        "Your proposed upload is smaller than the minimum allowed size",
+                        code="EntityTooSmall",
+                        status=400,
+                        ProposedSize=size,
+                        MinSizeAllowed=min_size,
+                    )
+                return
+            case "eq", [name, value]:
+                name = name.removeprefix("$").lower()
+                if name == "bucket" or fields.get(name, "") == value:
+                    return
+            case "starts-with", [name, prefix]:
+                name = name.removeprefix("$").lower()
+                # each value of a comma-separated Content-Type must match
+                values = (
+                    fields.get(name, "").split(",")
+                    if name == "content-type"
+                    else [fields.get(name, "")]
+                )
+                if all(value.strip().startswith(prefix) for value in values):
+                    return
+            case _:
+                raise PolicyError(
+                    "Invalid Policy: Invalid Condition.",
+                    code="InvalidPolicyDocument",
+                    status=400,
+                )
+        raise PolicyError(
+            f"Invalid according to Policy: Policy Condition failed: {json.dumps(condition)}"
+        )
+
+    @staticmethod
+    def error_response(error):
+        details = "".join(
+            f"<{name}>{escape(str(value))}</{name}>"
+            for name, value in error.details.items()
+        )
+        return http.HttpResponse(
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            "<Error>"
+            f"<Code>{error.code}</Code>"
+            f"<Message>{escape(error.message)}</Message>"
+            f"{details}"
+            f"<RequestId>{uuid.uuid4().hex[:16].upper()}</RequestId>"
+            "</Error>",
+            status=error.status,
+            content_type="application/xml",
+        )
+
+
+class PresignView(generic.View):
+    """
+    Return a presigned POST to upload files directly to S3, e.g. from a SPA.
+
+    Clients POST a JSON object with the names of the files to upload::
+
+        {"files": [{"name": "avatar.jpg"}, {"name": "cover.jpg"}]}
+
+    The response contains the ``url`` and form ``fields`` to POST each file
+    to S3 with its ``key``, as well as the ``signature`` the middleware
+    requires to accept the uploaded keys.
+
+    Only authenticated users may upload files of up to 10 MiB by default,
+    override :meth:`has_permission` and ``max_size`` to change that.
+    """
+
+    max_files = 100
+    max_size = 10 * 2**20
+    accept = None
+
+    def has_permission(self, request):
+        """Return whether the request may upload files."""
+        return request.user.is_authenticated
+
+    def post(self, request):
+        from .forms import S3FileInputMixin
+
+        if not self.has_permission(request):
+            return http.JsonResponse({"error": "Permission denied."}, status=403)
+        try:
+            data = json.loads(request.body)
+            names = [
+                MultiPartParser.sanitize_file_name(None, str(file["name"]))
+                for file in data["files"]
+            ]
+        except (ValueError, KeyError, TypeError):
+            return http.JsonResponse({"error": "Invalid request."}, status=400)
+        if not 0 < len(names) <= self.max_files:
+            return http.JsonResponse(
+                {"error": f"Upload between 1 and {self.max_files} files."},
+                status=400,
+            )
+        if not all(names) or len(set(names)) != len(names):
+            return http.JsonResponse(
+                {"error": "File names must be unique and not empty."}, status=400
+            )
+
+        widget = S3FileInputMixin()
+        widget.max_size = self.max_size
+        upload = widget.presign(self.accept)
+        return http.JsonResponse({
+            **upload,
+            "files": [
+                {"name": name, "key": f"{widget.upload_folder}/{name}"}
+                for name in names
+            ],
+        })
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class TelemetryView(generic.View):
+    """Receive the upload telemetry beacon sent by ``s3file.js``."""
+
+    max_uploads = 1000
+
+    def post(self, request):
+        if not getattr(settings, "S3FILE_TELEMETRY", False):
+            raise http.Http404("Telemetry is disabled.")
+        try:
+            beacon = json.loads(request.body)
+            correlation_id = str(beacon["correlationId"])[:64]
+            duration = self.seconds(beacon["duration"])
+            uploads = [
+                self.clean_upload(upload)
+                for upload in beacon["uploads"][: self.max_uploads]
+            ]
+        except (ValueError, KeyError, TypeError):
+            logger.warning("bad telemetry beacon")
+            return http.HttpResponseBadRequest()
+        telemetry.get_sink().record(correlation_id, duration, uploads)
+        return http.HttpResponse(status=204)
+
+    @classmethod
+    def clean_upload(cls, upload):
+        return {
+            "field": str(upload["field"])[:255],
+            "size": cls.integer(upload["size"]),
+            "ttfb": None if upload.get("ttfb") is None else cls.seconds(upload["ttfb"]),
+            "duration": cls.seconds(upload["duration"]),
+            "status": cls.integer(upload["status"]),
+            "error": None
+            if upload.get("error") is None
+            else str(upload["error"])[:255],
+        }
+
+    @staticmethod
+    def integer(value):
+        """Return a non-negative JSON integer, e.g. a size or HTTP status."""
+        if isinstance(value, bool) or not isinstance(value, int) or value < 0:
+            raise ValueError(f"Invalid integer: {value!r}")
+        return value
+
+    @staticmethod
+    def seconds(milliseconds):
+        """Return the seconds of a duration in milliseconds measured by the browser."""
+        if (
+            isinstance(milliseconds, bool)
+            or not isinstance(milliseconds, int | float)
+            or not 0 <= milliseconds < math.inf
+        ):
+            raise ValueError(f"Invalid duration: {milliseconds!r}")
+        return milliseconds / 1000
@@ -0,0 +1,195 @@
+import { test } from "node:test"
+import assert from "node:assert/strict"
+import { readFileSync } from "fs"
+import { fileURLToPath } from "url"
+import { dirname, join } from "path"
+
+const __filename = fileURLToPath(import.meta.url)
+const __dirname = dirname(__filename)
+
+// Read the s3file-sw.js service worker
+const workerCode = readFileSync(
+  join(__dirname, "../../s3file/static/s3file/js/s3file-sw.js"),
+  "utf-8",
+)
+
+// Minimal service worker global scope
+const listeners = {}
+const clients = new Map()
+const cache = new Map()
+globalThis.self = {
+  registration: { scope: "https://example.com/static/s3file/js/" },
+  clients: { get: async (id) => clients.get(id) },
+  addEventListener: (type, listener) => {
+    listeners[type] = listener
+  },
+  skipWaiting: () => {},
+}
+globalThis.caches = {
+  open: async () => ({
+    put: async (request, response) => cache.set(request.url, await response.text()),
+    match: async (request) => new Response(cache.get(request.url)),
+    delete: async (request) => cache.delete(request.url),
+    keys: async () => [...cache.keys()].map((url) => new Request(url)),
+  }),
+}
+
+// Wrap the code to expose functions to globalThis
+eval(`
+(function() {
+  ${workerCode}
+  globalThis.parseKey = parseKey
+  globalThis.uploadFile = uploadFile
+  globalThis.jobs = jobs
+}).call(globalThis)
+`)
+
+function createClient(id) {
+  const client = { id, messages: [], postMessage: (data) => client.messages.push(data) }
+  clients.set(id, client)
+  return client
+}
+
+async function dispatchMessage(data, source) {
+  let done
+  listeners.message({ data, source, waitUntil: (promise) => (done = promise) })
+  await done
+}
+
+function mockFetch(responses) {
+  const requests = []
+  globalThis.fetch = async (url, options) => {
+    requests.push({ url, options })
+    const response = responses.shift()
+    if (response instanceof Error) {
+      throw response
+    }
+    return response
+  }
+  return requests
+}
+
+function s3Response(key) {
+  return new Response(`<PostResponse><Key>${key}</Key></PostResponse>`, { status: 201 })
+}
+
+const upload = {
+  name: "file",
+  url: "https://s3.example.com/bucket",
+  fields: [["key", "tmp/s3file/${filename}"]],
+  files: [new File(["s3file"], "s3_file.txt", { type: "text/plain" })],
+}
+
+// don't wait between retries
+globalThis.setTimeout = (callback) => callback()
+
+test("parseKey - decodes XML entities and URL encoding", () => {
+  assert.equal(
+    parseKey("<PostResponse><Key>tmp/a%20&amp;%20b.txt</Key></PostResponse>"),
+    "tmp/a & b.txt",
+  )
+})
+
+test("uploadFile - retries network and server errors", async () => {
+  const requests = mockFetch([
+    new TypeError("Failed to fetch"),
+    new Response("", { status: 503, statusText: "Slow Down" }),
+    s3Response("tmp/s3file/s3_file.txt"),
+  ])
+  const key = await uploadFile(upload, upload.files[0])
+  assert.equal(key, "tmp/s3file/s3_file.txt")
+  assert.equal(requests.length, 3)
+  const body = requests[0].options.body
+  assert.equal(body.get("key"), "tmp/s3file/${filename}")
+  assert.equal(body.get("success_action_status"), "201")
+  assert.equal(body.get("Content-Type"), "text/plain")
+})
+
+test("uploadFile - fails on rejected uploads", async () => {
+  const requests = mockFetch([
+    new Response("", { status: 403, statusText: "Forbidden" }),
+  ])
+  await assert.rejects(uploadFile(upload, upload.files[0]), /Forbidden/)
+  assert.equal(requests.length, 1)
+})
+
+test("message - returns the keys to the open page", async () => {
+  cache.clear()
+  const client = createClient("open")
+  mockFetch([s3Response("tmp/s3file/s3_file.txt")])
+  await dispatchMessage(
+    { type: "upload", id: "1", action: "/upload/", fields: [], uploads: [upload] },
+    client,
+  )
+  assert.deepEqual(
+    client.messages.map((message) => message.type),
+    ["progress", "uploaded"],
+  )
+  assert.deepEqual(client.messages[1].keys, [["file", "tmp/s3file/s3_file.txt"]])
+  assert.equal(client.messages[1].uploads[0].field, "file")
+  assert.equal(client.messages[1].uploads[0].status, 201)
+  assert.equal(cache.size, 0)
+  assert.equal(jobs.size, 0)
+})
+
+test("message - reports failed uploads to the open page", async () => {
+  cache.clear()
+  const client = createClient("failed")
+  mockFetch([new Response("", { status: 403, statusText: "Forbidden" })])
+  await dispatchMessage(
+    { type: "upload", id: "4", action: "/upload/", fields: [], uploads: [upload] },
+    client,
+  )
+  const [message] = client.messages
+  assert.equal(message.type, "error")
+  assert.equal(message.error, "Forbidden")
+  assert.equal(message.uploads[0].status, 403)
+  assert.equal(message.uploads[0].error, "Forbidden")
+})
+
+test("message - submits the form after the page has been closed", async () => {
+  cache.clear()
+  const requests = mockFetch([
+    s3Response("tmp/s3file/s3_file.txt"),
+    new Response(null, { status: 204 }),
+    new Response("", { status: 200 }),
+  ])
+  await dispatchMessage(
+    {
+      type: "upload",
+      id: "2",
+      action: "https://example.com/upload/",
+      fields: [["s3file", "file"]],
+      uploads: [upload],
+      telemetry: { url: "/s3file/telemetry/", correlationId: "abc" },
+    },
+    { id: "closed" },
+  )
+  assert.equal(requests[1].url, "/s3file/telemetry/")
+  const beacon = JSON.parse(requests[1].options.body)
+  assert.equal(beacon.correlationId, "abc")
+  assert.equal(beacon.uploads[0].status, 201)
+  assert.equal(requests[2].url, "https://example.com/upload/")
+  assert.equal(requests[2].options.body.get("file"), "tmp/s3file/s3_file.txt")
+  assert.equal(requests[2].options.body.get("s3file"), "file")
+
+  const client = createClient("return")
+  await dispatchMessage({ type: "status" }, client)
+  assert.equal(client.messages.length, 1)
+  assert.equal(client.messages[0].id, "2")
+  assert.equal(client.messages[0].status, "submitted")
+  assert.equal(client.messages[0].statusCode, 200)
+  assert.equal(cache.size, 0)
+})
+
+test("message - reports interrupted uploads", async () => {
+  cache.clear()
+  cache.set(
+    "https://example.com/static/s3file/js/s3file-status/3",
+    JSON.stringify({ id: "3", action: "/upload/", status: "uploading" }),
+  )
+  const client = createClient("interrupted")
+  await dispatchMessage({ type: "status" }, client)
+  assert.equal(client.messages[0].status, "interrupted")
+  assert.equal(cache.size, 0)
+})
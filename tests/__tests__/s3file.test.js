@@ -24,6 +24,14 @@ const wrappedCode = `
   globalThis.uploadFiles = uploadFiles
   globalThis.clickSubmit = clickSubmit
   globalThis.uploadS3Inputs = uploadS3Inputs
+  globalThis.createCorrelationId = createCorrelationId
+  globalThis.recordTelemetry = recordTelemetry
+  globalThis.sendTelemetry = sendTelemetry
+  globalThis.createBundle = createBundle
+  globalThis.canBundle = canBundle
+  globalThis.getFields = getFields
+  globalThis.receiveMessage = receiveMessage
+  globalThis.delegateUploads = delegateUploads
 
   // Expose a function to initialize forms added after module load
   globalThis.initializeForm = function(form) {
@@ -431,3 +439,285 @@ test("DOM event listener - attaches click handler to submit buttons", async () =
   const hiddenInput = form.querySelector("input[name=action][type=hidden]")
   assert.equal(hiddenInput !== null, true)
 })
+
+test("createCorrelationId - returns unique IDs", async () => {
+  const first = createCorrelationId()
+  const second = createCorrelationId()
+  assert.equal(typeof first, "string")
+  assert.notEqual(first, second)
+})
+
+test("request - records telemetry", async () => {
+  const form = document.createElement("form")
+  const fileInput = document.createElement("input")
+  fileInput.type = "file"
+  fileInput.name = "document"
+  const file = { name: "test.txt", size: 4, loaded: 0 }
+
+  form.loaded = 0
+  form.total = 4
+  fileInput.loaded = 0
+  fileInput.total = 4
+  form.telemetry = { uploads: [] }
+
+  const mockXhr = {
+    status: 201,
+    responseText: "<PostResponse><Key>file.txt</Key></PostResponse>",
+    upload: {
+      onprogress: null,
+    },
+    onload: null,
+    onerror: null,
+    open: () => {},
+    send: function () {
+      this.upload.onprogress({ loaded: 4, total: 4 })
+      this.onload()
+    },
+  }
+
+  globalThis.XMLHttpRequest = class {
+    constructor() {
+      return mockXhr
+    }
+  }
+
+  await request("POST", "http://example.com", new FormData(), fileInput, file, form)
+
+  assert.equal(form.telemetry.uploads.length, 1)
+  const [upload] = form.telemetry.uploads
+  assert.equal(upload.field, "document")
+  assert.equal(upload.size, 4)
+  assert.equal(upload.status, 201)
+  assert.equal(upload.error, null)
+  assert.equal(typeof upload.ttfb, "number")
+  assert.equal(typeof upload.duration, "number")
+})
+
+test("sendTelemetry - sends a single beacon", async () => {
+  const form = document.createElement("form")
+  const beacons = []
+  globalThis.navigator.sendBeacon = (url, data) => {
+    beacons.push({ url, data })
+    return true
+  }
+  form.telemetry = {
+    url: "/s3file/telemetry/",
+    correlationId: "abc",
+    start: globalThis.performance.now(),
+    uploads: [{ field: "document", size: 4 }],
+    sent: false,
+  }
+
+  sendTelemetry(form)
+  sendTelemetry(form)
+
+  assert.equal(beacons.length, 1)
+  assert.equal(beacons[0].url, "/s3file/telemetry/")
+  const body = JSON.parse(await beacons[0].data.text())
+  assert.equal(body.correlationId, "abc")
+  assert.deepEqual(body.uploads, [{ field: "document", size: 4 }])
+})
+
+test("sendTelemetry - does nothing without telemetry", async () => {
+  const form = document.createElement("form")
+  let called = false
+  globalThis.navigator.sendBeacon = () => {
+    called = true
+  }
+  sendTelemetry(form)
+  assert.equal(called, false)
+})
+
+test("uploadS3Inputs - adds correlation ID when telemetry is enabled", async () => {
+  const form = document.createElement("form")
+
+  const fileInput = document.createElement("input")
+  fileInput.type = "file"
+  fileInput.className = "s3file"
+  fileInput.name = "document"
+  fileInput.setAttribute("data-url", "http://example.com/upload")
+  fileInput.setAttribute("data-s3f-signature", "abc123")
+  fileInput.setAttribute("data-s3f-telemetry-url", "/s3file/telemetry/")
+  form.appendChild(fileInput)
+
+  Object.defineProperty(fileInput, "files", { value: [] })
+  globalThis.navigator.sendBeacon = () => true
+  globalThis.HTMLFormElement.prototype.submit = () => {}
+
+  uploadS3Inputs(form)
+
+  const correlationInput = form.querySelector("input[name=s3file-correlation-id]")
+  assert.notEqual(correlationInput, null)
+  assert.equal(correlationInput.value, form.telemetry.correlationId)
+  assert.equal(form.telemetry.url, "/s3file/telemetry/")
+})
+
+test("createBundle - creates an uncompressed ZIP archive", async () => {
+  const files = [
+    new File(["hello"], "a.txt", { type: "text/plain" }),
+    new File(["world!"], "b.txt", { type: "text/plain" }),
+  ]
+  const bundle = await createBundle(files)
+  const view = new DataView(await bundle.arrayBuffer())
+
+  assert.equal(bundle.name, "bundle.zip")
+  assert.equal(bundle.type, "application/zip")
+  assert.equal(view.getUint32(0, true), 0x04034b50)
+  // CRC-32 of "hello"
+  assert.equal(view.getUint32(14, true), 0x3610a686)
+  assert.equal(view.getUint32(18, true), 5)
+  const end = bundle.size - 22
+  assert.equal(view.getUint32(end, true), 0x06054b50)
+  assert.equal(view.getUint16(end + 10, true), 2)
+  assert.equal(view.getUint32(end + 16, true), 2 * 30 + 2 * 5 + 11)
+})
+
+test("canBundle - requires multiple files", async () => {
+  const fileInput = document.createElement("input")
+  assert.equal(canBundle(fileInput, [new File(["a"], "a.txt")]), false)
+  assert.equal(
+    canBundle(fileInput, [new File(["a"], "a.txt"), new File(["b"], "b.txt")]),
+    true,
+  )
+})
+
+test("canBundle - skips inputs with content type or size limits", async () => {
+  const files = [new File(["a"], "a.txt"), new File(["b"], "b.txt")]
+  const acceptInput = document.createElement("input")
+  acceptInput.accept = "text/plain"
+  assert.equal(canBundle(acceptInput, files), false)
+  const maxSizeInput = document.createElement("input")
+  maxSizeInput.setAttribute("data-s3f-max-size", "1024")
+  assert.equal(canBundle(maxSizeInput, files), false)
+})
+
+test("getFields - returns the presigned POST's fields", async () => {
+  const fileInput = document.createElement("input")
+  fileInput.setAttribute("data-fields-key", "tmp/${filename}")
+  fileInput.setAttribute("data-fields-policy", "abc")
+  fileInput.setAttribute("data-url", "http://example.com/upload")
+  assert.deepEqual(getFields(fileInput), [
+    ["key", "tmp/${filename}"],
+    ["policy", "abc"],
+  ])
+})
+
+test("delegateUploads - hands the files over to the service worker", async () => {
+  const form = document.createElement("form")
+  form.action = "http://example.com/save/"
+  const csrfInput = document.createElement("input")
+  csrfInput.type = "hidden"
+  csrfInput.name = "csrfmiddlewaretoken"
+  csrfInput.value = "token"
+  form.appendChild(csrfInput)
+  const fileInput = document.createElement("input")
+  fileInput.type = "file"
+  fileInput.className = "s3file"
+  fileInput.name = "document"
+  fileInput.setAttribute("data-url", "http://example.com/upload")
+  fileInput.setAttribute("data-fields-key", "tmp/${filename}")
+  form.appendChild(fileInput)
+  const file = new File(["s3file"], "s3_file.txt", { type: "text/plain" })
+  Object.defineProperty(fileInput, "files", { value: [file] })
+
+  const messages = []
+  await delegateUploads(form, [fileInput], {
+    postMessage: (message) => messages.push(message),
+  })
+
+  assert.equal(fileInput.name, "")
+  const [message] = messages
+  assert.equal(message.type, "upload")
+  assert.equal(message.action, "http://example.com/save/")
+  assert.deepEqual(message.fields, [["csrfmiddlewaretoken", "token"]])
+  assert.equal(message.uploads[0].name, "document")
+  assert.equal(message.uploads[0].url, "http://example.com/upload")
+  assert.deepEqual(message.uploads[0].fields, [["key", "tmp/${filename}"]])
+  assert.deepEqual(message.uploads[0].files, [file])
+
+  let progress = null
+  form.addEventListener("progress", (e) => {
+    progress = e.detail
+  })
+  receiveMessage({
+    data: {
+      type: "progress",
+      id: message.id,
+      field: "document",
+      fileName: "s3_file.txt",
+      loaded: 6,
+      total: 6,
+    },
+  })
+  assert.equal(progress.progress, 1)
+
+  let submitted = false
+  globalThis.HTMLFormElement.prototype.submit = () => {
+    submitted = true
+  }
+  receiveMessage({
+    data: { type: "uploaded", id: message.id, keys: [["document", "tmp/s3_file.txt"]] },
+  })
+  assert.equal(submitted, true)
+  const hiddenInput = form.querySelector("input[name=document][type=hidden]")
+  assert.equal(hiddenInput.value, "tmp/s3_file.txt")
+})
+
+test("receiveMessage - restores the inputs of failed background uploads", async () => {
+  const form = document.createElement("form")
+  const fileInput = document.createElement("input")
+  fileInput.type = "file"
+  fileInput.name = "document"
+  fileInput.setAttribute("data-url", "http://example.com/upload")
+  form.appendChild(fileInput)
+  Object.defineProperty(fileInput, "files", { value: [] })
+  const beacons = []
+  globalThis.navigator.sendBeacon = (url, body) => beacons.push(url)
+  form.telemetry = {
+    url: "/s3file/telemetry/",
+    correlationId: "abc",
+    start: 0,
+    uploads: [],
+    sent: false,
+  }
+
+  const messages = []
+  await delegateUploads(form, [fileInput], {
+    postMessage: (message) => messages.push(message),
+  })
+  assert.equal(fileInput.name, "")
+  assert.deepEqual(messages[0].telemetry, {
+    url: "/s3file/telemetry/",
+    correlationId: "abc",
+  })
+
+  const measurement = {
+    field: "document",
+    size: 6,
+    ttfb: null,
+    duration: 10,
+    status: 403,
+    error: "Forbidden",
+  }
+  receiveMessage({
+    data: {
+      type: "error",
+      id: messages[0].id,
+      error: "Forbidden",
+      uploads: [measurement],
+    },
+  })
+  assert.equal(fileInput.name, "document")
+  assert.equal(fileInput.validationMessage, "Forbidden")
+  assert.deepEqual(form.telemetry.uploads, [measurement])
+  assert.deepEqual(beacons, ["/s3file/telemetry/"])
+})
+
+test("receiveMessage - dispatches the status of background uploads", async () => {
+  let status = null
+  document.addEventListener("backgroundupload", (e) => {
+    status = e.detail
+  })
+  receiveMessage({ data: { type: "status", id: "1", status: "submitted" } })
+  assert.equal(status.status, "submitted")
+})
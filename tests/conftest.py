@@ -3,12 +3,13 @@ from pathlib import Path
 
 import pytest
 from django.core.files.base import ContentFile
+from django.core.files.storage import storages
 from django.utils.encoding import force_str
 from django.utils.text import slugify
 from selenium import webdriver
 from selenium.common.exceptions import WebDriverException
 
-from s3file.storages import get_aws_location
+from s3file.storages import get_aws_location, storage
 
 
 def pytest_configure(config):
@@ -28,6 +29,20 @@ def driver(request):
         b.quit()
 
 
+@pytest.fixture
+def get_object_calls(monkeypatch):
+    client = storage.connection.meta.client
+    calls = []
+    get_object = client.get_object
+
+    def _get_object(**kwargs):
+        calls.append(kwargs.get("Range"))
+        return get_object(**kwargs)
+
+    monkeypatch.setattr(client, "get_object", _get_object)
+    return calls
+
+
 @pytest.fixture
 def freeze_upload_folder(monkeypatch):
     """Freeze the upload folder which by default contains a random UUID v4."""
@@ -78,6 +93,20 @@ def yet_another_upload_file(request, freeze_upload_folder):
     return str(path.absolute())
 
 
+@pytest.fixture
+def eu_storage(settings):
+    """Add a second local S3 mock backend and route EU users to it."""
+    settings.STORAGES = {
+        **settings.STORAGES,
+        "eu": {
+            "BACKEND": "s3file.storages.S3MockStorage",
+            "OPTIONS": {"bucket_name": "eu-bucket", "location": tempfile.mkdtemp()},
+        },
+    }
+    settings.S3FILE_STORAGE_ROUTER = "tests.testapp.routers.geo_router"
+    return storages["eu"]
+
+
 @pytest.fixture
 def filemodel(request, db):
     from tests.testapp.models import FileModel
@@ -1,4 +1,7 @@
 import importlib
+import os
+import subprocess
+import sys
 
 from django import forms
 
@@ -7,14 +10,60 @@ from s3file.forms import S3FileInputMixin
 
 
 class TestS3FileConfig:
-    def test_ready(self, settings):
+    def test_ready(self):
         app = S3FileConfig("s3file", importlib.import_module("tests.testapp"))
         app.ready()
+        assert isinstance(forms.ClearableFileInput(), S3FileInputMixin)
+        app.ready()
+        assert forms.ClearableFileInput.__bases__.count(S3FileInputMixin) == 1
+
+    def test_ready__s3_storage(self, settings):
+        app = S3FileConfig("s3file", importlib.import_module("tests.testapp"))
+        settings.STORAGES = {
+            **settings.STORAGES,
+            "default": {"BACKEND": "django.core.files.storage.InMemoryStorage"},
+        }
+        app.ready()
         assert not isinstance(forms.ClearableFileInput(), S3FileInputMixin)
         settings.STORAGES = {
             **settings.STORAGES,
-            "DEFAULT": {"BACKEND": "storages.backends.s3boto3.S3Boto3Storage"},
+            "default": {"BACKEND": "storages.backends.s3.S3Storage"},
         }
-
         app.ready()
         assert isinstance(forms.ClearableFileInput(), S3FileInputMixin)
+
+
+def test_import_time():
+    """Setting up Django with S3File must not import boto3 or resolve storages."""
+    result = subprocess.run(  # noqa: S603
+        [
+            sys.executable,
+            "-X",
+            "importtime",
+            "-c",
+            "import django;"
+            "django.setup();"
+            "from django.core.files.storage import default_storage;"
+            "from s3file.storages import storage;"
+            "from django.utils.functional import empty;"
+            "import s3file.forms, s3file.middleware;"
+            "print(default_storage._wrapped is empty, storage._wrapped is empty)",
+        ],
+        env={**os.environ, "DJANGO_SETTINGS_MODULE": "tests.testapp.settings"},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert result.stdout.strip() == "True True"
+    # import time: self [us] | cumulative | imported package
+    imports = {
+        name.strip(): int(self_time.removeprefix("import time:"))
+        for line in result.stderr.splitlines()
+        if line.startswith("import time:")
+        for self_time, _, name in [line.split("|")]
+        if self_time.removeprefix("import time:").strip().isdigit()
+    }
+    assert "s3file.forms" in imports
+    # self time in microseconds, a generous budget to catch heavy imports
+    assert sum(t for name, t in imports.items() if name.startswith("s3file")) < 1e5
+    assert not {name for name in imports if name.startswith(("boto3", "botocore"))}
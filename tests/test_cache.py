@@ -0,0 +1,99 @@
+import gc
+import os
+
+import pytest
+
+from s3file import cache
+
+
+@pytest.fixture(params=[cache.MemoryCache, cache.DiskCache])
+def object_cache(request, tmp_path):
+    kwargs = {"directory": tmp_path} if request.param is cache.DiskCache else {}
+    return request.param(max_size=10, max_object_size=6, **kwargs)
+
+
+class TestCache:
+    def test_get(self, object_cache):
+        assert object_cache.get("a.txt", '"1"') is None
+        object_cache.set("a.txt", '"1"', b"abc")
+        assert object_cache.get("a.txt", '"1"') == b"abc"
+        assert object_cache.get("a.txt", '"2"') is None
+        assert object_cache.stats() == {
+            "hits": 1,
+            "misses": 2,
+            "evictions": 0,
+            "entries": 1,
+            "size": 3,
+        }
+
+    def test_set__evict(self, object_cache):
+        object_cache.set("a.txt", '"1"', b"aaaa")
+        object_cache.set("b.txt", '"1"', b"bbbb")
+        assert object_cache.get("a.txt", '"1"') == b"aaaa"
+        object_cache.set("c.txt", '"1"', b"cccc")
+        assert object_cache.get("b.txt", '"1"') is None
+        assert object_cache.get("a.txt", '"1"') == b"aaaa"
+        assert object_cache.get("c.txt", '"1"') == b"cccc"
+        assert object_cache.stats()["evictions"] == 1
+        assert object_cache.stats()["size"] == 8
+
+    def test_set__too_large(self, object_cache):
+        object_cache.set("a.txt", '"1"', b"a" * 7)
+        assert object_cache.get("a.txt", '"1"') is None
+        assert object_cache.stats()["size"] == 0
+
+
+class TestDiskCache:
+    def test_restore(self, tmp_path):
+        cache.DiskCache(max_size=100, directory=tmp_path).set("a.txt", '"1"', b"abc")
+        restored = cache.DiskCache(max_size=100, directory=tmp_path)
+        assert restored.get("a.txt", '"1"') == b"abc"
+        assert restored.stats()["size"] == 3
+
+    def test_restore__evict(self, tmp_path):
+        disk_cache = cache.DiskCache(max_size=100, directory=tmp_path)
+        for i, data in enumerate([b"aaaa", b"bbbb", b"cccc"]):
+            disk_cache.set("a.txt", f'"{i}"', data)
+            digest = cache.DiskCache.digest("a.txt", f'"{i}"')
+            os.utime(tmp_path / digest, (i, i))
+        (tmp_path / ".tmp123").write_bytes(b"partial")
+
+        restored = cache.DiskCache(max_size=8, directory=tmp_path)
+        assert restored.stats()["size"] == 8
+        assert restored.get("a.txt", '"0"') is None
+        assert restored.get("a.txt", '"2"') == b"cccc"
+        assert len(os.listdir(tmp_path)) == 3
+
+    def test_get__deleted(self, tmp_path):
+        disk_cache = cache.DiskCache(max_size=100, directory=tmp_path)
+        disk_cache.set("a.txt", '"1"', b"abc")
+        os.remove(tmp_path / cache.DiskCache.digest("a.txt", '"1"'))
+        assert disk_cache.get("a.txt", '"1"') is None
+        assert disk_cache.stats()["entries"] == 0
+        assert disk_cache.stats()["size"] == 0
+
+    def test_default_directory(self, settings, tmp_path):
+        disk_cache = cache.DiskCache()
+        directory = disk_cache.directory
+        assert os.path.isdir(directory)
+        del disk_cache
+        gc.collect()
+        assert not os.path.exists(directory)
+
+        settings.S3FILE_CACHE_DIR = str(tmp_path)
+        disk_cache = cache.DiskCache()
+        assert disk_cache.directory == str(tmp_path)
+        del disk_cache
+        gc.collect()
+        assert os.path.isdir(tmp_path)
+
+
+def test_get_cache(settings):
+    assert cache.get_cache() is None
+    settings.S3FILE_CACHE = "s3file.cache.MemoryCache"
+    settings.S3FILE_CACHE_SIZE = 1024
+    assert isinstance(cache.get_cache(), cache.MemoryCache)
+    assert cache.get_cache().max_size == 1024
+    assert cache.get_cache() is cache.get_cache()
+    settings.S3FILE_CACHE = None
+    assert cache.get_cache() is None
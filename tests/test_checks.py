@@ -12,3 +12,130 @@ def test_storage_check():
     assert ("FileSystemStorage should not be used in a production environment.") in str(
         e.value
     )
+
+
+def test_pool_check(settings, monkeypatch):
+    from storages.backends.s3 import S3Storage
+
+    from s3file import checks, storages
+
+    monkeypatch.setattr(storages, "storage", S3Storage(bucket_name="test-bucket"))
+    assert not checks.pool_check(None)
+
+    settings.S3FILE_READ_CONCURRENCY = 16
+    errors = checks.pool_check(None)
+    assert [error.id for error in errors] == ["s3file.W001"]
+    assert "smaller than S3FILE_READ_CONCURRENCY (16)" in errors[0].msg
+
+    settings.S3FILE_MAX_POOL_CONNECTIONS = 16
+    storages.configure_client(storages.storage)
+    assert not checks.pool_check(None)
+
+
+def test_optimized_storage_check(settings):
+    from s3file import checks
+
+    assert not checks.optimized_storage_check(None)
+
+    settings.STORAGES = {
+        **settings.STORAGES,
+        "default": {"BACKEND": "storages.backends.s3.S3Storage"},
+    }
+    errors = checks.optimized_storage_check(None)
+    assert [error.id for error in errors] == ["s3file.W002"]
+
+    settings.STORAGES = {
+        **settings.STORAGES,
+        "default": {"BACKEND": "s3file.storages_optimized.S3OptimizedUploadStorage"},
+    }
+    assert not checks.optimized_storage_check(None)
+
+
+def test_middleware_check(settings):
+    from s3file import checks
+
+    assert not checks.middleware_check(None)
+
+    settings.MIDDLEWARE = [
+        "s3file.middleware.S3FileMiddleware",
+        "django.middleware.security.SecurityMiddleware",
+        "django.contrib.sessions.middleware.SessionMiddleware",
+        "django.middleware.common.CommonMiddleware",
+        # only responds to GET and HEAD requests, which carry no uploads
+        "django.middleware.cache.FetchFromCacheMiddleware",
+    ]
+    errors = checks.middleware_check(None)
+    assert [error.id for error in errors] == ["s3file.W003", "s3file.W003"]
+    assert "before django.middleware.security.SecurityMiddleware" in errors[0].msg
+
+    settings.MIDDLEWARE = ["django.middleware.common.CommonMiddleware"]
+    assert not checks.middleware_check(None)
+
+
+def test_memory_check(settings, monkeypatch):
+    from storages.backends.s3 import S3Storage
+
+    from s3file import checks, storages
+
+    assert not checks.memory_check(None)
+
+    monkeypatch.setattr(storages, "storage", S3Storage(bucket_name="test-bucket"))
+    errors = checks.memory_check(None)
+    assert [error.id for error in errors] == ["s3file.W004"]
+
+    settings.S3FILE_READ_MODE = "range"
+    assert not checks.memory_check(None)
+
+    settings.S3FILE_READ_MODE = None
+    monkeypatch.setattr(storages.storage, "max_memory_size", 2**20)
+    assert not checks.memory_check(None)
+
+
+def test_expires_check(settings):
+    from s3file import checks
+
+    errors = checks.expires_check(None)
+    assert [error.id for error in errors] == ["s3file.W005"]
+    assert "expire after 1209600 seconds" in errors[0].msg
+
+    settings.S3FILE_UPLOAD_EXPIRES = 60 * 60
+    assert not checks.expires_check(None)
+
+
+def test_prefetch_check(settings):
+    from s3file import checks
+
+    assert not checks.prefetch_check(None)
+
+    settings.S3FILE_PREFETCH = 2**20
+    errors = checks.prefetch_check(None)
+    assert [error.id for error in errors] == ["s3file.W006"]
+
+    settings.S3FILE_CACHE = "s3file.cache.MemoryCache"
+    errors = checks.prefetch_check(None)
+    assert [error.msg for error in errors] == [
+        "S3FILE_PREFETCH only applies to range files.",
+        "S3FILE_CACHE only applies to range files.",
+    ]
+
+    settings.S3FILE_READ_MODE = "range"
+    assert not checks.prefetch_check(None)
+
+
+def test_resolution_cache_check(settings):
+    from s3file import checks
+
+    assert not checks.resolution_cache_check(None)
+
+    settings.S3FILE_RESOLUTION_CACHE = "default"
+    errors = checks.resolution_cache_check(None)
+    assert [error.id for error in errors] == ["s3file.W007"]
+
+    settings.S3FILE_READ_MODE = "range"
+    errors = checks.resolution_cache_check(None)
+    assert [error.id for error in errors] == ["s3file.W008"]
+
+    settings.CACHES = {
+        "default": {"BACKEND": "django.core.cache.backends.redis.RedisCache"}
+    }
+    assert not checks.resolution_cache_check(None)
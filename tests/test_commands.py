@@ -0,0 +1,116 @@
+import os
+import time
+
+import pytest
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from s3file.storages import storage
+
+
+@pytest.fixture
+def uploads():
+    old = time.time() - 2 * 24 * 60 * 60
+    names = []
+    for i in range(5):
+        name = storage.save(f"tmp/s3file/old{i}/file.txt", ContentFile(b"old"))
+        os.utime(storage.path(name), (old, old))
+        names.append(name)
+    new = storage.save("tmp/s3file/new/file.txt", ContentFile(b"new"))
+    other = storage.save("other/file.txt", ContentFile(b"other"))
+    os.utime(storage.path(other), (old, old))
+    yield names, new, other
+    for name in [*names, new, other]:
+        storage.delete(name)
+
+
+class TestPurgeS3FileUploads:
+    def test_handle(self, uploads, capsys):
+        old, new, other = uploads
+        call_command("purge_s3file_uploads")
+        assert not any(storage.exists(name) for name in old)
+        assert storage.exists(new)
+        assert storage.exists(other)
+        stdout = capsys.readouterr().out
+        assert (
+            "Deleted 5 of 6 uploads in s3://test-bucket/custom/location/tmp/s3file/"
+            in stdout
+        )
+        assert "(15 bytes, 0 errors)" in stdout
+
+    def test_handle__pagination(self, uploads, monkeypatch):
+        old, _, _ = uploads
+        client = storage.connection.meta.client
+        list_objects_v2 = client.list_objects_v2
+        calls = []
+
+        def _list_objects_v2(**kwargs):
+            calls.append(kwargs)
+            return list_objects_v2(**kwargs, MaxKeys=2)
+
+        monkeypatch.setattr(client, "list_objects_v2", _list_objects_v2)
+        call_command("purge_s3file_uploads")
+        assert len(calls) == 3
+        assert not any(storage.exists(name) for name in old)
+
+    def test_handle__batches(self, uploads, monkeypatch):
+        monkeypatch.setattr(
+            "s3file.management.commands.purge_s3file_uploads.Command.batch_size", 2
+        )
+        client = storage.connection.meta.client
+        delete_objects = client.delete_objects
+        batches = []
+
+        def _delete_objects(**kwargs):
+            batches.append(len(kwargs["Delete"]["Objects"]))
+            return delete_objects(**kwargs)
+
+        monkeypatch.setattr(client, "delete_objects", _delete_objects)
+        call_command("purge_s3file_uploads", workers=2)
+        assert sorted(batches) == [1, 2, 2]
+
+    def test_handle__dry_run(self, uploads, capsys):
+        old, new, _ = uploads
+        call_command("purge_s3file_uploads", dry_run=True)
+        assert all(storage.exists(name) for name in old)
+        stdout = capsys.readouterr().out
+        assert f"custom/location/{old[0]}" in stdout
+        assert f"custom/location/{new}" not in stdout
+        assert "Would delete 5 of 6 uploads" in stdout
+
+    def test_handle__max_age(self, uploads):
+        old, new, _ = uploads
+        call_command("purge_s3file_uploads", max_age=0)
+        assert not storage.exists(new)
+
+    def test_handle__errors(self, uploads, monkeypatch):
+        client = storage.connection.meta.client
+        monkeypatch.setattr(
+            client,
+            "delete_objects",
+            lambda **kwargs: {
+                "Errors": [
+                    {"Key": obj["Key"], "Code": "AccessDenied"}
+                    for obj in kwargs["Delete"]["Objects"]
+                ]
+            },
+        )
+        with pytest.raises(CommandError, match="Failed to delete 5 uploads."):
+            call_command("purge_s3file_uploads")
+
+    def test_handle__date(self, settings, capsys):
+        settings.S3FILE_UPLOAD_DATE_FORMAT = "%Y/%m/%d"
+        name = storage.save("tmp/s3file/2024/01/02/abc/file.txt", ContentFile(b"x"))
+        other = storage.save("tmp/s3file/2024/01/03/abc/file.txt", ContentFile(b"x"))
+        call_command("purge_s3file_uploads", "--date=2024-01-02", "--max-age=0")
+        assert not storage.exists(name)
+        assert storage.exists(other)
+        assert (
+            "Deleted 1 of 1 uploads in s3://test-bucket/custom/location/tmp/s3file/2024/01/02/"
+            in capsys.readouterr().out
+        )
+
+    def test_handle__date_without_format(self):
+        with pytest.raises(CommandError, match="S3FILE_UPLOAD_DATE_FORMAT"):
+            call_command("purge_s3file_uploads", "--date=2024-01-02")
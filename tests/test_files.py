@@ -0,0 +1,329 @@
+import io
+import zipfile
+
+import pytest
+from django.core.exceptions import SuspiciousFileOperation, TooManyFilesSent
+from django.core.files.base import ContentFile
+
+from s3file import cache
+from s3file.files import S3RangeFile, S3StreamingFile, open_bundle
+from s3file.storages import storage
+
+
+@pytest.fixture
+def large_file():
+    content = bytes(range(256)) * 1024  # 256 KiB
+    name = storage.save("tmp/s3file/large_file.bin", ContentFile(content))
+    yield f"custom/location/{name}", content
+    storage.delete(name)
+
+
+class TestS3RangeFile:
+    def test_init(self, large_file):
+        key, content = large_file
+        f = S3RangeFile(key, storage)
+        assert f.name == "large_file.bin"
+        assert f.size == len(content)
+        assert f.content_type == "application/octet-stream"
+
+    def test_init__not_found(self):
+        with pytest.raises(FileNotFoundError):
+            S3RangeFile("custom/location/tmp/s3file/does_not_exist.txt", storage)
+
+    def test_read(self, large_file):
+        key, content = large_file
+        f = S3RangeFile(key, storage)
+        assert f.read() == content
+        assert f.read() == b""
+
+    def test_read__header(self, large_file, get_object_calls):
+        key, content = large_file
+        f = S3RangeFile(key, storage)
+        assert f.read(10) == content[:10]
+        assert f.read(10) == content[10:20]
+        assert get_object_calls == ["bytes=0-65535"]
+
+    def test_seek(self, large_file, get_object_calls):
+        key, content = large_file
+        f = S3RangeFile(key, storage)
+        f.seek(-4, io.SEEK_END)
+        assert f.read() == content[-4:]
+        f.seek(100_000)
+        assert f.tell() == 100_000
+        assert f.read(100) == content[100_000:100_100]
+        f.seek(-100, io.SEEK_CUR)
+        assert f.read(100) == content[100_000:100_100]
+        assert get_object_calls == ["bytes=196608-262143", "bytes=65536-131071"]
+
+    def test_seek__invalid(self, large_file):
+        key, _ = large_file
+        f = S3RangeFile(key, storage)
+        with pytest.raises(ValueError, match="Negative seek position"):
+            f.seek(-1)
+        with pytest.raises(ValueError, match="Invalid whence"):
+            f.seek(0, 3)
+
+    def test_read__gaps(self, large_file, get_object_calls):
+        key, content = large_file
+        f = S3RangeFile(key, storage)
+        f.seek(70_000)
+        f.read(1)
+        f.seek(0)
+        assert f.read() == content
+        assert get_object_calls == [
+            "bytes=65536-131071",
+            "bytes=0-65535",
+            "bytes=131072-262143",
+        ]
+
+    def test_read__bypass_cache(self, large_file, get_object_calls, monkeypatch):
+        key, content = large_file
+        monkeypatch.setattr(S3RangeFile, "max_blocks", 2)
+        f = S3RangeFile(key, storage)
+        assert f.read() == content
+        assert get_object_calls == ["bytes=0-262143"]
+        assert not f.file.blocks
+
+    def test_read__evict(self, large_file, get_object_calls, monkeypatch):
+        key, content = large_file
+        monkeypatch.setattr(S3RangeFile, "max_blocks", 2)
+        f = S3RangeFile(key, storage)
+        for offset in [0, 70_000, 140_000, 0]:
+            f.seek(offset)
+            assert f.read(1) == content[offset : offset + 1]
+        assert list(f.file.blocks) == [2, 0]
+        assert len(get_object_calls) == 4
+
+    def test_readinto(self, large_file):
+        key, content = large_file
+        f = S3RangeFile(key, storage)
+        buffer = bytearray(8)
+        assert f.readinto(buffer) == 8
+        assert buffer == content[:8]
+
+    def test_open(self, large_file):
+        key, content = large_file
+        f = S3RangeFile(key, storage)
+        f.read(10)
+        assert f.open() is f
+        assert f.read(10) == content[:10]
+        with pytest.raises(ValueError, match="Cannot reopen file with a new mode."):
+            f.open("w")
+
+    def test_close(self, large_file):
+        key, _ = large_file
+        f = S3RangeFile(key, storage)
+        f.read(1)
+        f.close()
+        assert f.closed
+        with pytest.raises(ValueError, match="I/O operation on closed file."):
+            f.read()
+
+    def test_chunks(self, large_file, get_object_calls, monkeypatch, settings):
+        key, content = large_file
+        settings.S3FILE_READ_CONCURRENCY = 3
+        monkeypatch.setattr(S3RangeFile, "part_size", 100_000)
+        f = S3RangeFile(key, storage)
+        chunks = list(f.chunks(30_000))
+        assert b"".join(chunks) == content
+        assert max(len(chunk) for chunk in chunks) == 30_000
+        assert sorted(get_object_calls) == [
+            "bytes=0-99999",
+            "bytes=100000-199999",
+            "bytes=200000-262143",
+        ]
+        assert f.tell() == len(content)
+
+    def test_chunks__iter(self, monkeypatch):
+        content = b"line\n" * 100
+        name = storage.save("tmp/s3file/lines.txt", ContentFile(content))
+        monkeypatch.setattr(S3RangeFile, "part_size", 64)
+        f = S3RangeFile(f"custom/location/{name}", storage)
+        assert list(f) == [b"line\n"] * 100
+
+    def test_chunks__close_early(self, large_file, monkeypatch, settings):
+        key, content = large_file
+        settings.S3FILE_READ_CONCURRENCY = 2
+        monkeypatch.setattr(S3RangeFile, "part_size", 10_000)
+        f = S3RangeFile(key, storage)
+        chunks = f.chunks()
+        assert next(chunks) == content[:10_000]
+        chunks.close()
+
+    def test_chunks__sequential(self, large_file, get_object_calls, settings):
+        key, content = large_file
+        settings.S3FILE_READ_CONCURRENCY = 1
+        f = S3RangeFile(key, storage)
+        assert b"".join(f.chunks()) == content
+        assert get_object_calls == ["bytes=0-262143"]
+
+    def test_prefetch(self, large_file, get_object_calls):
+        key, content = large_file
+        f = S3RangeFile(key, storage)
+        f.prefetch(len(content))
+        f.file._prefetched.result(timeout=5)
+        assert f.read(10) == content[:10]
+        f.seek(-10, io.SEEK_END)
+        assert f.read() == content[-10:]
+        assert b"".join(f.chunks()) == content
+        assert get_object_calls == ["bytes=0-262143"]
+
+    def test_prefetch__first_block(self, large_file, get_object_calls):
+        key, content = large_file
+        f = S3RangeFile(key, storage)
+        f.prefetch(1024)
+        assert f.read(10) == content[:10]
+        assert f.read(f.block_size) == content[10 : f.block_size + 10]
+        assert get_object_calls == ["bytes=0-65535", "bytes=65536-131071"]
+
+    def test_prefetch__error(self, large_file, monkeypatch, caplog):
+        key, content = large_file
+        f = S3RangeFile(key, storage)
+        get_object = storage.connection.meta.client.get_object
+
+        def _get_object(**kwargs):
+            monkeypatch.setattr(
+                storage.connection.meta.client, "get_object", get_object
+            )
+            raise OSError("Connection reset")
+
+        monkeypatch.setattr(storage.connection.meta.client, "get_object", _get_object)
+        f.prefetch(len(content))
+        assert f.read() == content
+        assert "Failed to prefetch" in caplog.text
+
+    def test_prefetch__close(self, large_file):
+        key, content = large_file
+        f = S3RangeFile(key, storage)
+        f.prefetch(len(content))
+        f.close()
+        assert f.file._prefetched is None
+
+    def test_cache(self, large_file, get_object_calls, settings):
+        settings.S3FILE_CACHE = "s3file.cache.MemoryCache"
+        key, content = large_file
+        for _ in range(3):
+            f = S3RangeFile(key, storage)
+            assert f.read(10) == content[:10]
+            assert b"".join(f.chunks()) == content
+        assert get_object_calls == [None]
+        assert cache.get_cache().stats()["hits"] > 0
+        settings.S3FILE_CACHE = None
+
+    def test_cache__too_large(self, large_file, get_object_calls, settings):
+        settings.S3FILE_CACHE = "s3file.cache.MemoryCache"
+        settings.S3FILE_CACHE_SIZE = 1024
+        key, content = large_file
+        assert S3RangeFile(key, storage).read(10) == content[:10]
+        assert get_object_calls == ["bytes=0-65535"]
+        settings.S3FILE_CACHE = None
+
+
+class TestS3StreamingFile:
+    def test_read(self, large_file, get_object_calls):
+        key, content = large_file
+        f = S3StreamingFile(key, storage)
+        assert f.name == "large_file.bin"
+        assert f.size == len(content)
+        assert not get_object_calls
+        assert f.read(10) == content[:10]
+        assert f.read(10) == content[10:20]
+        assert f.read() == content[20:]
+        assert f.read() == b""
+        assert get_object_calls == [None]
+
+    def test_init__not_found(self):
+        with pytest.raises(FileNotFoundError):
+            S3StreamingFile("custom/location/tmp/s3file/does_not_exist.txt", storage)
+
+    def test_chunks(self, large_file, get_object_calls):
+        key, content = large_file
+        f = S3StreamingFile(key, storage)
+        chunks = list(f.chunks(100_000))
+        assert [len(chunk) for chunk in chunks] == [100_000, 100_000, 62_144]
+        assert b"".join(chunks) == content
+        assert f.multiple_chunks()
+        assert get_object_calls == [None]
+
+    def test_chunks__rewind(self, large_file, get_object_calls):
+        key, content = large_file
+        f = S3StreamingFile(key, storage)
+        f.read(10)
+        assert b"".join(f.chunks()) == content
+        assert b"".join(f.chunks()) == content
+        assert get_object_calls == [None, None, None]
+
+    def test_seek(self, large_file, get_object_calls):
+        key, content = large_file
+        f = S3StreamingFile(key, storage)
+        f.read(10)
+        assert f.seek(10) == 10
+        assert f.read(10) == content[10:20]
+        f.seek(100_000)
+        assert f.read(10) == content[100_000:100_010]
+        assert get_object_calls == [None, "bytes=100000-"]
+
+    def test_iter(self):
+        name = storage.save("tmp/s3file/lines.txt", ContentFile(b"line\n" * 100))
+        f = S3StreamingFile(f"custom/location/{name}", storage)
+        assert list(f) == [b"line\n"] * 100
+
+    def test_close(self, large_file):
+        key, _ = large_file
+        f = S3StreamingFile(key, storage)
+        f.read(1)
+        f.close()
+        assert f.closed
+        with pytest.raises(ValueError, match="I/O operation on closed file."):
+            f.read()
+
+
+@pytest.fixture
+def bundle():
+    def save(members, compression=zipfile.ZIP_STORED):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", compression) as zip_file:
+            for name, content in members.items():
+                zip_file.writestr(name, content)
+        name = storage.save("tmp/s3file/bundle.zip", ContentFile(buffer.getvalue()))
+        return f"custom/location/{name}"
+
+    return save
+
+
+class TestOpenBundle:
+    def test_open_bundle(self, bundle, get_object_calls):
+        key = bundle({
+            "a.txt": b"a" * 10,
+            "folder/b.txt": b"b" * 100_000,
+            "folder/": b"",
+        })
+        a, b = open_bundle(key, storage)
+        # the central directory is read with a single request
+        assert len(get_object_calls) == 1
+        assert (a.name, a.size, a.content_type) == ("a.txt", 10, "text/plain")
+        assert (b.name, b.size) == ("b.txt", 100_000)
+        assert a.key == b.key == key
+        assert a.obj is None
+        assert a.read() == b"a" * 10
+        assert b.read(5) == b"bbbbb"
+        b.seek(0)
+        assert b.read() == b"b" * 100_000
+        assert a.read() == b""
+        assert len(get_object_calls) == 2
+
+    def test_open_bundle__compressed(self, bundle):
+        key = bundle({"a.txt": b"a" * 10}, zipfile.ZIP_DEFLATED)
+        with pytest.raises(SuspiciousFileOperation, match="must not be compressed"):
+            open_bundle(key, storage)
+
+    def test_open_bundle__invalid(self):
+        name = storage.save("tmp/s3file/bundle.zip", ContentFile(b"not a zip"))
+        with pytest.raises(SuspiciousFileOperation, match="Invalid bundle."):
+            open_bundle(f"custom/location/{name}", storage)
+
+    def test_open_bundle__too_many_files(self, bundle, settings):
+        settings.DATA_UPLOAD_MAX_NUMBER_FILES = 2
+        key = bundle({f"{i}.txt": b"" for i in range(3)})
+        with pytest.raises(TooManyFilesSent):
+            open_bundle(key, storage)
@@ -1,18 +1,27 @@
+import datetime
+import io
 import json
 import os
+import re
 from contextlib import contextmanager
 
 import pytest
+from django import forms
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.forms import ClearableFileInput
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
 from django.utils.text import slugify
 from selenium.common.exceptions import NoSuchElementException
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.expected_conditions import staleness_of
 from selenium.webdriver.support.wait import WebDriverWait
 
-from s3file.storages import storage
+from s3file.files import S3RangeFile
+from s3file.forms import S3FileFieldMixin, S3ImageFieldMixin
+from s3file.storages import current_request, storage
+from s3file.validators import ContentTypeValidator, MaxSizeValidator
 from tests.testapp.forms import FileForm
 from tests.testapp.models import FileModel
 
@@ -92,6 +101,27 @@ class TestS3FileInput:
             == "my-class s3file"
         )
 
+    def test_build_attr__service_worker(self, freeze_upload_folder, settings):
+        assert "data-s3f-service-worker-url" not in ClearableFileInput().build_attrs({})
+        settings.S3FILE_SERVICE_WORKER = True
+        assert (
+            ClearableFileInput().build_attrs({})["data-s3f-service-worker-url"]
+            == "/static/s3file/js/s3file-sw.js"
+        )
+        settings.S3FILE_SERVICE_WORKER = "/s3file-sw.js"
+        assert (
+            ClearableFileInput().build_attrs({})["data-s3f-service-worker-url"]
+            == "/s3file-sw.js"
+        )
+
+    def test_build_attr__telemetry(self, freeze_upload_folder, settings):
+        assert "data-s3f-telemetry-url" not in ClearableFileInput().build_attrs({})
+        settings.S3FILE_TELEMETRY = True
+        assert (
+            ClearableFileInput().build_attrs({})["data-s3f-telemetry-url"]
+            == "/s3file/telemetry/"
+        )
+
     def test_get_conditions(self, freeze_upload_folder):
         conditions = ClearableFileInput().get_conditions(None)
         assert all(
@@ -130,6 +160,13 @@ class TestS3FileInput:
         assert {"Content-Type": "application/pdf"} not in widget.get_conditions(
             "application/pdf,image/*"
         )
+        assert ["starts-with", "$Content-Type", "image/"] in widget.get_conditions(
+            "image/png, image/jpeg"
+        )
+        assert ["starts-with", "$Content-Type", ""] in widget.get_conditions(
+            ".jpg,image/jpeg"
+        )
+        assert ["starts-with", "$Content-Type", ""] in widget.get_conditions("*/*")
 
     @pytest.mark.selenium
     def test_no_js_error(self, driver, live_server):
@@ -258,3 +295,151 @@ class TestS3FileInput:
     def test_upload_folder(self):
         assert "custom/location/tmp/s3file/" in ClearableFileInput().upload_folder
         assert len(os.path.basename(ClearableFileInput().upload_folder)) == 22
+
+
+class S3FileField(S3FileFieldMixin, forms.FileField):
+    pass
+
+
+class TestS3FileFieldMixin:
+    def test_init(self):
+        field = S3FileField(max_size=1024, content_types=["image/*"])
+        assert MaxSizeValidator(1024) in field.validators
+        assert ContentTypeValidator(["image/*"]) in field.validators
+        assert field.widget.attrs["accept"] == "image/*"
+        assert ["content-length-range", 0, 1024] in field.widget.get_conditions(
+            "image/*"
+        )
+        assert field.widget.build_attrs({})["data-s3f-max-size"] == 1024
+
+    def test_init__defaults(self):
+        field = S3FileField()
+        assert not field.validators
+        assert "accept" not in field.widget.attrs
+        assert field.widget.max_size is None
+        assert "data-s3f-max-size" not in field.widget.build_attrs({})
+
+    def test_clean(self, get_object_calls):
+        name = storage.save("tmp/s3file/clean.mp4", ContentFile(b"x" * 2048))
+        f = S3RangeFile(f"custom/location/{name}", storage)
+        field = S3FileField(max_size=4096, content_types=["video/mp4"])
+        assert field.clean(f) is f
+
+        field = S3FileField(max_size=1024, content_types=["image/*"])
+        with pytest.raises(ValidationError) as e:
+            field.clean(f)
+        assert {error.code for error in e.value.error_list} == {
+            "max_size",
+            "invalid_content_type",
+        }
+        assert not get_object_calls
+
+
+class S3ImageField(S3ImageFieldMixin, forms.ImageField):
+    pass
+
+
+class TestS3ImageFieldMixin:
+    def test_clean(self, get_object_calls):
+        from PIL import Image
+
+        buffer = io.BytesIO()
+        # noise doesn't compress, so the image is larger than a single block
+        Image.frombytes("RGB", (400, 400), os.urandom(400 * 400 * 3)).save(
+            buffer, "PNG"
+        )
+        name = storage.save("tmp/s3file/image.png", ContentFile(buffer.getvalue()))
+        f = S3RangeFile(f"custom/location/{name}", storage)
+        assert f.size > 4 * S3RangeFile.block_size
+
+        assert S3ImageField().clean(f) is f
+        assert f.image.format == "PNG"
+        assert f.image.size == (400, 400)
+        assert get_object_calls == [f"bytes=0-{S3RangeFile.block_size - 1}"]
+        assert f.tell() == 0
+
+    def test_clean__invalid(self):
+        name = storage.save("tmp/s3file/image.png", ContentFile(b"not an image"))
+        f = S3RangeFile(f"custom/location/{name}", storage)
+        with pytest.raises(ValidationError) as e:
+            S3ImageField().clean(f)
+        assert e.value.code == "invalid_image"
+
+    def test_clean__uploaded_file(self):
+        from PIL import Image
+
+        buffer = io.BytesIO()
+        Image.new("RGB", (1, 1)).save(buffer, "PNG")
+        f = SimpleUploadedFile("image.png", buffer.getvalue())
+        assert S3ImageField().clean(f).image.format == "PNG"
+
+
+class TestStorageRouting:
+    def test_build_attrs(self, freeze_upload_folder, eu_storage, rf):
+        request = rf.get("/", headers={"CloudFront-Viewer-Country-Region": "EU"})
+        token = current_request.set(request)
+        try:
+            widget = ClearableFileInput()
+            attrs = widget.build_attrs({})
+        finally:
+            current_request.reset(token)
+        assert widget.storage is eu_storage
+        assert widget.bucket_name == "eu-bucket"
+        assert attrs["data-s3f-signature"].startswith("eu:")
+        assert {"bucket": "eu-bucket"} in widget.get_conditions(None)
+
+    def test_build_attrs__default(self, freeze_upload_folder, eu_storage, rf):
+        token = current_request.set(rf.get("/"))
+        try:
+            widget = ClearableFileInput()
+            attrs = widget.build_attrs({})
+        finally:
+            current_request.reset(token)
+        assert widget.storage is storage
+        assert attrs["data-s3f-signature"] == (
+            "VRIPlI1LCjUh1EtplrgxQrG8gSAaIwT48mMRlwaCytI"
+        )
+
+    def test_upload(self, client, eu_storage, upload_file):
+        headers = {"CloudFront-Viewer-Country-Region": "EU"}
+        response = client.get(reverse("upload-multi"), headers=headers)
+        widget = response.context["form"]["other_file"].field.widget
+        attrs = widget.build_attrs({})
+        fields = {
+            key.removeprefix("data-fields-"): value
+            for key, value in attrs.items()
+            if key.startswith("data-fields-")
+        }
+        with open(upload_file, "rb") as f:
+            response = client.post(
+                attrs["data-url"],
+                data={**fields, "success_action_status": "201", "file": f},
+            )
+        assert response.status_code == 201
+        key = re.search(r"<Key>(.*)</Key>", response.content.decode()).group(1)
+        assert eu_storage.exists(key.removeprefix("custom/location/"))
+        assert not storage.exists(key.removeprefix("custom/location/"))
+
+        response = client.post(
+            reverse("upload-multi"),
+            data={
+                "other_file": key,
+                "other_file-s3f-signature": attrs["data-s3f-signature"],
+                "s3file": "other_file",
+            },
+            headers=headers,
+        )
+        assert response.status_code == 201
+        assert json.loads(response.content)["FILES"]["other_file"] == [
+            os.path.basename(upload_file)
+        ]
+
+
+def test_upload_folder__date_partition(settings):
+    settings.S3FILE_UPLOAD_DATE_FORMAT = "%Y/%m/%d"
+    widget = ClearableFileInput()
+    today = datetime.datetime.now(tz=datetime.UTC).strftime("%Y/%m/%d")
+    assert widget.upload_folder.startswith(f"custom/location/tmp/s3file/{today}/")
+    assert widget.get_partition(datetime.date(2024, 1, 2)) == ("2024", "01", "02")
+    settings.S3FILE_UPLOAD_DATE_FORMAT = None
+    assert widget.get_partition() == ()
@@ -0,0 +1,103 @@
+import pytest
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.forms import ClearableFileInput
+
+from s3file import layouts
+from s3file.middleware import S3FileMiddleware
+from s3file.storages import storage
+
+
+class TestKeyLayout:
+    def test_get_folder(self):
+        layout = layouts.KeyLayout()
+        assert layout.get_folder("tmp/s3file", (), "abc") == "tmp/s3file/abc"
+        assert (
+            layout.get_folder("tmp/s3file", ("2024", "01"), "abc")
+            == "tmp/s3file/2024/01/abc"
+        )
+
+    def test_get_prefixes(self):
+        layout = layouts.KeyLayout()
+        assert layout.get_prefixes("tmp/s3file") == ["tmp/s3file/"]
+        assert layout.get_prefixes("tmp/s3file", ("2024",)) == ["tmp/s3file/2024/"]
+
+
+class TestShardedKeyLayout:
+    def test_get_folder(self):
+        layout = layouts.ShardedKeyLayout(shards=16)
+        folder = layout.get_folder("tmp/s3file", ("2024",), "abc")
+        assert folder == f"tmp/s3file/{layout.get_shard('abc')}/2024/abc"
+        assert layout.get_folder("tmp/s3file", ("2024",), "abc") == folder
+
+    def test_get_shard(self):
+        layout = layouts.ShardedKeyLayout(shards=256)
+        shards = {layout.get_shard(str(i)) for i in range(5000)}
+        assert len(shards) == 256
+        assert all(len(shard) == 2 for shard in shards)
+
+    def test_get_prefixes(self):
+        layout = layouts.ShardedKeyLayout(shards=3)
+        assert layout.get_prefixes("tmp/s3file", ("2024",)) == [
+            "tmp/s3file/0/2024/",
+            "tmp/s3file/1/2024/",
+            "tmp/s3file/2/2024/",
+        ]
+
+    def test_init__invalid(self):
+        with pytest.raises(ImproperlyConfigured, match="S3FILE_KEY_SHARDS"):
+            layouts.ShardedKeyLayout(shards=-1)
+
+
+class TestGetLayout:
+    def test_default(self):
+        assert type(layouts.get_layout()) is layouts.KeyLayout
+
+    def test_setting(self, settings):
+        settings.S3FILE_KEY_LAYOUT = "s3file.layouts.ShardedKeyLayout"
+        settings.S3FILE_KEY_SHARDS = 4
+        layout = layouts.get_layout()
+        assert isinstance(layout, layouts.ShardedKeyLayout)
+        assert layout.shards == 4
+
+
+class TestSharding:
+    @pytest.fixture
+    def sharded(self, settings):
+        settings.S3FILE_KEY_LAYOUT = "s3file.layouts.ShardedKeyLayout"
+        settings.S3FILE_KEY_SHARDS = 4
+
+    def test_upload_folder(self, sharded, rf):
+        widget = ClearableFileInput()
+        *_, shard, unique_id = widget.upload_folder.split("/")
+        assert widget.upload_folder.startswith("custom/location/tmp/s3file/")
+        assert shard == layouts.get_layout().get_shard(unique_id)
+        assert widget.build_attrs({})["data-s3f-signature"] == (
+            S3FileMiddleware.sign_s3_key_prefix(widget.upload_folder)
+        )
+
+    def test_middleware(self, sharded):
+        widget = ClearableFileInput()
+        name = storage.save(
+            f"{widget.upload_folder.removeprefix('custom/location/')}/s3_file.txt",
+            ContentFile(b"s3file"),
+        )
+        (file,) = S3FileMiddleware.get_files_from_storage(
+            [f"custom/location/{name}"],
+            S3FileMiddleware.sign_s3_key_prefix(widget.upload_folder),
+        )
+        assert file.read() == b"s3file"
+        storage.delete(name)
+
+    def test_purge(self, sharded, capsys):
+        names = [
+            storage.save(f"tmp/s3file/{shard}/abc/file.txt", ContentFile(b"x"))
+            for shard in "03"
+        ]
+        call_command("purge_s3file_uploads", "--max-age=0")
+        assert not any(storage.exists(name) for name in names)
+        assert (
+            "uploads in s3://test-bucket/custom/location/tmp/s3file/0/"
+            " and 3 more prefixes" in capsys.readouterr().out
+        )
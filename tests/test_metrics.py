@@ -0,0 +1,170 @@
+import logging
+
+import pytest
+from django import forms
+from django.core.exceptions import PermissionDenied
+from django.core.files.base import ContentFile
+
+from s3file import metrics
+from s3file.middleware import S3FileMiddleware
+from s3file.storages import storage
+from s3file.storages_optimized import S3OptimizedMockStorage
+
+
+@pytest.fixture
+def registry(settings):
+    settings.S3FILE_METRICS_BACKEND = "s3file.metrics.RegistryBackend"
+    return metrics.get_backend()
+
+
+class TestTimer:
+    def test_default(self):
+        assert isinstance(metrics.get_backend(), metrics.NullBackend)
+        with metrics.timer("open", field="file") as labels:
+            labels["bytes"] = 42
+
+    def test_record(self, registry):
+        with metrics.timer("open", field="file", storage="default") as labels:
+            labels["bytes"] = 42
+        with metrics.timer("open", field="file", storage="default"):
+            pass
+        sample = registry.samples[("open", (("field", "file"), ("storage", "default")))]
+        assert sample["count"] == 2
+        assert sample["bytes"] == 42
+        assert sample["sum"] > 0
+
+    def test_record__error(self, registry):
+        with (
+            pytest.raises(ValueError, match="boom"),
+            metrics.timer("open", field="file"),
+        ):
+            raise ValueError("boom")
+        assert ("open", (("error", "ValueError"), ("field", "file"))) in (
+            registry.samples
+        )
+
+    def test_reset_backend(self, settings):
+        settings.S3FILE_METRICS_BACKEND = "s3file.metrics.LoggingBackend"
+        assert isinstance(metrics.get_backend(), metrics.LoggingBackend)
+        settings.S3FILE_METRICS_BACKEND = None
+        assert isinstance(metrics.get_backend(), metrics.NullBackend)
+
+
+class TestLoggingBackend:
+    def test_record(self, caplog):
+        with caplog.at_level(logging.INFO, logger="s3file.metrics"):
+            metrics.LoggingBackend().record(
+                "open", 0.0125, {"field": "file", "bytes": 42}
+            )
+        assert caplog.messages == ["open 12.50ms bytes=42 field=file"]
+        assert caplog.records[0].labels == {"field": "file", "bytes": 42}
+
+
+class TestRegistryBackend:
+    def test_expose(self):
+        registry = metrics.RegistryBackend()
+        registry.record("request", 0.5, {"field": "file", "files": 2, "bytes": 10})
+        registry.record("request", 0.25, {"field": "file", "files": 1, "bytes": 5})
+        registry.record("presign", 0.125, {"field": 'say "hi"', "storage": None})
+        assert registry.expose() == (
+            "# TYPE s3file_presign_seconds summary\n"
+            's3file_presign_seconds_count{field="say \\"hi\\""} 1\n'
+            's3file_presign_seconds_sum{field="say \\"hi\\""} 0.125\n'
+            "# TYPE s3file_request_seconds summary\n"
+            's3file_request_seconds_count{field="file"} 2\n'
+            's3file_request_seconds_sum{field="file"} 0.75\n'
+            's3file_request_files_total{field="file"} 3\n'
+            's3file_request_bytes_total{field="file"} 15\n'
+        )
+
+    def test_record__max_samples(self, caplog):
+        registry = metrics.RegistryBackend()
+        registry.max_samples = 2
+        for field in ["a", "b", "c", "a"]:
+            registry.record("request", 1, {"field": field})
+        assert list(registry.samples) == [
+            ("request", (("field", "a"),)),
+            ("request", (("field", "b"),)),
+        ]
+        assert registry.samples[("request", (("field", "a"),))]["count"] == 2
+        assert "dropped request sample" in caplog.text
+
+
+class TestInstrumentation:
+    def test_presign(self, registry):
+        class Form(forms.Form):
+            file = forms.FileField()
+
+        str(Form()["file"])
+        assert registry.samples[
+            ("presign", (("field", "file"), ("storage", "default")))
+        ]["count"]
+
+    def test_middleware(self, registry, freeze_upload_folder, rf):
+        storage.save("tmp/s3file/s3_file.txt", ContentFile(b"s3file"))
+        request = rf.post(
+            "/",
+            data={
+                "file": "custom/location/tmp/s3file/s3_file.txt",
+                "s3file": "file",
+                "file-s3f-signature": "VRIPlI1LCjUh1EtplrgxQrG8gSAaIwT48mMRlwaCytI",
+            },
+        )
+        S3FileMiddleware(lambda x: None)(request)
+        labels = (("field", "file"), ("storage", "default"))
+        assert registry.samples[("verify", labels)]["count"] == 1
+        assert registry.samples[("open", labels)]["bytes"] == 6
+        request_sample = registry.samples[("request", (("field", "file"),))]
+        assert request_sample["files"] == 1
+        assert request_sample["bytes"] == 6
+
+    def test_middleware__rejected(self, registry, rf):
+        for i in range(5):
+            request = rf.post(
+                "/",
+                data={
+                    f"f{i}": "custom/location/tmp/s3file/s3_file.txt",
+                    "s3file": f"f{i}",
+                    f"f{i}-s3f-signature": f"alias{i}:forged",
+                },
+            )
+            with pytest.raises(PermissionDenied):
+                S3FileMiddleware(lambda x: None)(request)
+        assert sorted(registry.samples) == [
+            ("request", (("error", "PermissionDenied"),)),
+            ("verify", (("error", "SuspiciousFileOperation"),)),
+        ]
+        assert (
+            registry.samples[("verify", (("error", "SuspiciousFileOperation"),))][
+                "count"
+            ]
+            == 5
+        )
+
+    def test_middleware__correlation_id(self, settings, freeze_upload_folder, rf):
+        settings.S3FILE_METRICS_BACKEND = "s3file.metrics.BaseBackend"
+        records = []
+        metrics.get_backend().record = lambda *args: records.append(args)
+        storage.save("tmp/s3file/s3_file.txt", ContentFile(b"s3file"))
+        request = rf.post(
+            "/",
+            data={
+                "file": "custom/location/tmp/s3file/s3_file.txt",
+                "s3file": "file",
+                "file-s3f-signature": "VRIPlI1LCjUh1EtplrgxQrG8gSAaIwT48mMRlwaCytI",
+                "s3file-correlation-id": "8f5e2c1a",
+            },
+        )
+        S3FileMiddleware(lambda x: None)(request)
+        name, _, labels = records[-1]
+        assert name == "request"
+        assert labels["correlation_id"] == "8f5e2c1a"
+
+    def test_copy(self, registry):
+        mock_storage = S3OptimizedMockStorage()
+        mock_storage.bucket.Object("custom/location/tmp/s3file/s3_file.txt").put(
+            Body=b"s3file"
+        )
+        content = mock_storage.open("tmp/s3file/s3_file.txt")
+        mock_storage._save("tmp/s3file/s3_file_copied.txt", content)
+        assert registry.samples[("copy", ())]["bytes"] == 6
@@ -1,13 +1,23 @@
+import io
+import json
 import os
 import pathlib
+import zipfile
 
 import pytest
-from django.core.exceptions import PermissionDenied, SuspiciousFileOperation
+from django.core.cache import caches
+from django.core.exceptions import (
+    ImproperlyConfigured,
+    PermissionDenied,
+    SuspiciousFileOperation,
+)
 from django.core.files.base import ContentFile
 from django.core.files.uploadedfile import SimpleUploadedFile
 
+from s3file import signals
+from s3file.files import S3RangeFile
 from s3file.middleware import S3FileMiddleware
-from s3file.storages import get_aws_location, storage
+from s3file.storages import current_request, get_aws_location, storage
 
 
 class TestS3FileMiddleware:
@@ -305,3 +315,338 @@ class TestS3FileMiddleware:
             S3FileMiddleware.sign_s3_key_prefix("test/test")
             == "a8KINhIf1IpSD5sgdXE4wEQodZorq_8CmwkqZ5V6nr4"
         )
+
+    def test_process_request__read_mode_range(self, freeze_upload_folder, rf, settings):
+        settings.S3FILE_READ_MODE = "range"
+        storage.save("tmp/s3file/s3_file.txt", ContentFile(b"s3file"))
+        request = rf.post(
+            "/",
+            data={
+                "file": "custom/location/tmp/s3file/s3_file.txt",
+                "s3file": "file",
+                "file-s3f-signature": "VRIPlI1LCjUh1EtplrgxQrG8gSAaIwT48mMRlwaCytI",
+            },
+        )
+        S3FileMiddleware(lambda x: None)(request)
+        file = request.FILES.get("file")
+        assert isinstance(file, S3RangeFile)
+        assert file.name == "s3_file.txt"
+        assert file.read() == b"s3file"
+
+    def test_process_request__resolution_cache(
+        self, freeze_upload_folder, rf, settings, monkeypatch
+    ):
+        settings.S3FILE_READ_MODE = "range"
+        settings.S3FILE_RESOLUTION_CACHE = "default"
+        caches["default"].clear()
+        name = storage.save("tmp/s3file/resolution.txt", ContentFile(b"s3file"))
+        client = storage.connection.meta.client
+        head_object = client.head_object
+        head_calls = []
+        monkeypatch.setattr(
+            client,
+            "head_object",
+            lambda **kwargs: head_calls.append(kwargs["Key"]) or head_object(**kwargs),
+        )
+        for _ in range(2):
+            request = rf.post(
+                "/",
+                data={
+                    "file": f"custom/location/{name}",
+                    "s3file": "file",
+                    "file-s3f-signature": "VRIPlI1LCjUh1EtplrgxQrG8gSAaIwT48mMRlwaCytI",
+                },
+            )
+            S3FileMiddleware(lambda x: None)(request)
+            assert request.FILES["file"].read() == b"s3file"
+        assert head_calls == [f"custom/location/{name}"]
+
+        request = rf.post(
+            "/",
+            data={
+                "file": f"custom/location/{name}",
+                "s3file": "file",
+                "file-s3f-signature": "fake",
+            },
+        )
+        with pytest.raises(PermissionDenied, match="Illegal filename!"):
+            S3FileMiddleware(lambda x: None)(request)
+
+    def test_process_request__resolution_cache_stale(
+        self, freeze_upload_folder, rf, settings, get_object_calls
+    ):
+        settings.S3FILE_READ_MODE = "range"
+        settings.S3FILE_RESOLUTION_CACHE = "default"
+        caches["default"].clear()
+        name = storage.save("tmp/s3file/stale.txt", ContentFile(b"s3file"))
+        data = {
+            "file": f"custom/location/{name}",
+            "s3file": "file",
+            "file-s3f-signature": "VRIPlI1LCjUh1EtplrgxQrG8gSAaIwT48mMRlwaCytI",
+        }
+        S3FileMiddleware(lambda x: None)(rf.post("/", data=data))
+        cache_key = S3FileMiddleware.get_resolution_cache_key(
+            pathlib.PurePosixPath(f"custom/location/{name}"),
+            data["file-s3f-signature"],
+        )
+        assert caches["default"].get(cache_key)["ContentLength"] == 6
+
+        # the object is replaced while its metadata is cached
+        storage.delete(name)
+        storage.save(name, ContentFile(b"changed s3file"))
+        request = rf.post("/", data=data)
+        S3FileMiddleware(lambda x: None)(request)
+        f = request.FILES["file"]
+        assert f.read() == b"changed s3file"
+        assert f.size == 14
+        assert get_object_calls[-1] == "bytes=0-13"
+        assert caches["default"].get(cache_key) is None
+        storage.delete(name)
+
+    def test_process_request__read_mode_unknown(
+        self, freeze_upload_folder, rf, settings
+    ):
+        settings.S3FILE_READ_MODE = "unknown"
+        request = rf.post(
+            "/",
+            data={
+                "file": "custom/location/tmp/s3file/s3_file.txt",
+                "s3file": "file",
+                "file-s3f-signature": "VRIPlI1LCjUh1EtplrgxQrG8gSAaIwT48mMRlwaCytI",
+            },
+        )
+        with pytest.raises(ImproperlyConfigured, match="Unknown S3FILE_READ_MODE"):
+            S3FileMiddleware(lambda x: None)(request)
+
+    def test_sign_s3_key_prefix__storage_alias(self):
+        assert S3FileMiddleware.sign_s3_key_prefix(
+            "test/test", "eu"
+        ) == "eu:" + S3FileMiddleware.sign_s3_key_prefix("eu:test/test")
+
+    def test_get_files_from_storage__storage_alias(
+        self, freeze_upload_folder, eu_storage
+    ):
+        eu_storage.save("tmp/s3file/eu_file.txt", ContentFile(b"eu"))
+        storage.save("tmp/s3file/eu_file.txt", ContentFile(b"default"))
+        files = S3FileMiddleware.get_files_from_storage(
+            ["custom/location/tmp/s3file/eu_file.txt"],
+            S3FileMiddleware.sign_s3_key_prefix("custom/location/tmp/s3file", "eu"),
+        )
+        assert next(files).read() == b"eu"
+
+    def test_get_files_from_storage__storage_alias_tampered(
+        self, freeze_upload_folder, eu_storage
+    ):
+        signature = S3FileMiddleware.sign_s3_key_prefix("custom/location/tmp/s3file")
+        files = S3FileMiddleware.get_files_from_storage(
+            ["custom/location/tmp/s3file/eu_file.txt"],
+            f"eu:{signature}",
+        )
+        with pytest.raises(SuspiciousFileOperation, match="Illegal signature!"):
+            next(files)
+
+    def test_process_request__current_request(self, rf):
+        def get_response(request):
+            assert current_request.get() is request
+            return "response"
+
+        request = rf.get("/")
+        assert S3FileMiddleware(get_response)(request) == "response"
+        assert current_request.get() is None
+
+    def test_process_request__json(self, freeze_upload_folder, rf):
+        storage.save("tmp/s3file/s3_file.txt", ContentFile(b"s3file"))
+        request = rf.post(
+            "/",
+            data={
+                "s3file": ["file"],
+                "file": ["custom/location/tmp/s3file/s3_file.txt"],
+                "file-s3f-signature": "VRIPlI1LCjUh1EtplrgxQrG8gSAaIwT48mMRlwaCytI",
+                "title": "Hello",
+            },
+            content_type="application/json",
+            headers={"X-S3File": "1"},
+        )
+        S3FileMiddleware(lambda x: None)(request)
+        assert request.FILES.get("file").read() == b"s3file"
+        assert json.loads(request.body)["title"] == "Hello"
+
+    @pytest.mark.parametrize(
+        "data",
+        ['{"title": "Hello"}', "[1, 2]", "not json", '{"s3file": [{"a": 1}]}'],
+    )
+    def test_process_request__json_ignored(self, rf, data):
+        request = rf.post(
+            "/", data=data, content_type="application/json", headers={"X-S3File": "1"}
+        )
+        S3FileMiddleware(lambda x: None)(request)
+        assert not request.FILES
+
+    def test_process_request__json_no_header(self, rf):
+        request = rf.post(
+            "/",
+            data={"s3file": ["file"], "file": ["custom/location/tmp/s3file/a.txt"]},
+            content_type="application/json",
+        )
+        S3FileMiddleware(lambda x: None)(request)
+        assert not request.FILES
+        assert not hasattr(request, "_body")
+
+    def test_process_request__json_too_big(self, rf, settings):
+        settings.DATA_UPLOAD_MAX_MEMORY_SIZE = 10
+        request = rf.post(
+            "/",
+            data={"s3file": ["file"], "file": ["custom/location/tmp/s3file/a.txt"]},
+            content_type="application/json",
+            headers={"X-S3File": "1"},
+        )
+        S3FileMiddleware(lambda x: None)(request)
+        assert not request.FILES
+        assert not hasattr(request, "_body")
+
+    def test_process_request__json_illegal_types(self, rf):
+        request = rf.post(
+            "/",
+            data={
+                "s3file": "file",
+                "file": [{"key": "custom/location/tmp/s3file/s3_file.txt"}],
+                "file-s3f-signature": "VRIPlI1LCjUh1EtplrgxQrG8gSAaIwT48mMRlwaCytI",
+            },
+            content_type="application/json",
+            headers={"X-S3File": "1"},
+        )
+        with pytest.raises(PermissionDenied, match="Illegal filename!"):
+            S3FileMiddleware(lambda x: None)(request)
+
+    def test_resolve_files(self, freeze_upload_folder):
+        storage.save("tmp/s3file/s3_file.txt", ContentFile(b"s3file"))
+        files = dict(
+            S3FileMiddleware.resolve_files({
+                "s3file": "file",
+                "file": "custom/location/tmp/s3file/s3_file.txt",
+                "file-s3f-signature": "VRIPlI1LCjUh1EtplrgxQrG8gSAaIwT48mMRlwaCytI",
+            })
+        )
+        assert [f.read() for f in files["file"]] == [b"s3file"]
+
+    def test_resolve_files__no_signature(self):
+        with pytest.raises(PermissionDenied, match="No signature provided."):
+            dict(
+                S3FileMiddleware.resolve_files({
+                    "s3file": ["file"],
+                    "file": ["custom/location/tmp/s3file/s3_file.txt"],
+                })
+            )
+
+    def test_process_request__files_resolved(self, freeze_upload_folder, rf):
+        storage.save("tmp/s3file/s3_file.txt", ContentFile(b"s3file"))
+        calls = []
+
+        def receiver(**kwargs):
+            calls.append(kwargs)
+
+        signals.files_resolved.connect(receiver)
+        request = rf.post(
+            "/",
+            data={
+                "file": "custom/location/tmp/s3file/s3_file.txt",
+                "s3file": "file",
+                "file-s3f-signature": "VRIPlI1LCjUh1EtplrgxQrG8gSAaIwT48mMRlwaCytI",
+            },
+        )
+        try:
+            S3FileMiddleware(lambda x: None)(request)
+        finally:
+            signals.files_resolved.disconnect(receiver)
+        (kwargs,) = calls
+        assert kwargs["sender"] is S3FileMiddleware
+        assert kwargs["request"] is request
+        assert kwargs["field_name"] == "file"
+        assert kwargs["files"] == request.FILES.getlist("file")
+        assert kwargs["uploads"] == [
+            {
+                "key": "custom/location/tmp/s3file/s3_file.txt",
+                "name": "s3_file.txt",
+                "size": 6,
+                "storage": None,
+            }
+        ]
+        json.dumps(kwargs["uploads"])
+
+    @pytest.mark.parametrize(
+        ("prefetch", "calls"), [(True, ["bytes=0-65535"]), (1024, ["bytes=0-65535"])]
+    )
+    def test_process_request__prefetch(
+        self, freeze_upload_folder, rf, settings, get_object_calls, prefetch, calls
+    ):
+        settings.S3FILE_READ_MODE = "range"
+        settings.S3FILE_PREFETCH = prefetch
+        content = b"s3file" * 20_000
+        name = storage.save("tmp/s3file/prefetch.txt", ContentFile(content))
+        request = rf.post(
+            "/",
+            data={
+                "file": f"custom/location/{name}",
+                "s3file": "file",
+                "file-s3f-signature": "VRIPlI1LCjUh1EtplrgxQrG8gSAaIwT48mMRlwaCytI",
+            },
+        )
+        S3FileMiddleware(lambda x: None)(request)
+        file = request.FILES["file"]
+        assert file.read(6) == b"s3file"
+        assert get_object_calls == calls
+
+    def test_process_request__prefetch_whole_file(
+        self, freeze_upload_folder, rf, settings, get_object_calls
+    ):
+        settings.S3FILE_READ_MODE = "range"
+        settings.S3FILE_PREFETCH = 2**20
+        content = b"s3file" * 20_000
+        name = storage.save("tmp/s3file/prefetch.txt", ContentFile(content))
+        request = rf.post(
+            "/",
+            data={
+                "file": f"custom/location/{name}",
+                "s3file": "file",
+                "file-s3f-signature": "VRIPlI1LCjUh1EtplrgxQrG8gSAaIwT48mMRlwaCytI",
+            },
+        )
+        S3FileMiddleware(lambda x: None)(request)
+        assert request.FILES["file"].read() == content
+        assert get_object_calls == [f"bytes=0-{len(content) - 1}"]
+
+    def test_process_request__bundle(self, freeze_upload_folder, rf):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w") as zip_file:
+            zip_file.writestr("a.txt", b"a")
+            zip_file.writestr("b.txt", b"bb")
+        name = storage.save("tmp/s3file/bundle.zip", ContentFile(buffer.getvalue()))
+        request = rf.post(
+            "/",
+            data={
+                "file": f"custom/location/{name}",
+                "s3file": "file",
+                "s3file-bundle": "file",
+                "file-s3f-signature": "VRIPlI1LCjUh1EtplrgxQrG8gSAaIwT48mMRlwaCytI",
+            },
+        )
+        S3FileMiddleware(lambda x: None)(request)
+        files = request.FILES.getlist("file")
+        assert [(f.name, f.read()) for f in files] == [
+            ("a.txt", b"a"),
+            ("b.txt", b"bb"),
+        ]
+
+    def test_process_request__bundle_invalid(self, freeze_upload_folder, rf):
+        name = storage.save("tmp/s3file/bundle.zip", ContentFile(b"not a zip"))
+        request = rf.post(
+            "/",
+            data={
+                "file": f"custom/location/{name}",
+                "s3file": "file",
+                "s3file-bundle": "file",
+                "file-s3f-signature": "VRIPlI1LCjUh1EtplrgxQrG8gSAaIwT48mMRlwaCytI",
+            },
+        )
+        with pytest.raises(PermissionDenied, match="Illegal filename!"):
+            S3FileMiddleware(lambda x: None)(request)
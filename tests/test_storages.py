@@ -1,76 +1,495 @@
+import hashlib
+import io
+import os
+import zipfile
+
 import pytest
+from boto3.s3.transfer import TransferConfig
+from django.core.exceptions import ImproperlyConfigured
 from django.core.files.base import ContentFile
 
-from s3file.storages_optimized import S3OptimizedUploadStorage
+from s3file import storages
+from s3file.files import S3RangeFile, open_bundle
+from s3file.storages_optimized import S3OptimizedMockStorage
 
 
-class S3OptimizedMockStorage(S3OptimizedUploadStorage):
-    created_objects = {}
+@pytest.fixture
+def optimized_storage():
+    return S3OptimizedMockStorage()
 
-    def _compress_content(self, content):
-        return content
 
-    class bucket:
-        name = "test-bucket"
+class TestStorages:
+    url = "/__s3_mock__/"
 
-        class Object:
-            def __init__(self, key):
-                self.key = key
-                self.copy_from_bucket = None
-                self.copy_from_key = None
-                S3OptimizedMockStorage.created_objects[self.key] = self
+    @pytest.fixture
+    def copies(self, optimized_storage, monkeypatch):
+        copies = []
+        client = optimized_storage.connection.meta.client
+        copy_object = client.copy_object
+        monkeypatch.setattr(
+            client,
+            "copy_object",
+            lambda **kwargs: copies.append(kwargs) or copy_object(**kwargs),
+        )
+        return copies
 
-            def copy(self, s3_object, ExtraArgs):
-                self.copy_from_bucket = s3_object["Bucket"]
-                self.copy_from_key = s3_object["Key"]
+    def test_post__save_optimized(self, optimized_storage, copies):
+        optimized_storage.bucket.Object("custom/location/tmp/s3file/s3_file.txt").put(
+            Body=b"s3file"
+        )
+        content = optimized_storage.open("tmp/s3file/s3_file.txt")
+        key = optimized_storage._save("tmp/s3file/s3_file_copied.txt", content)
 
+        assert key == "tmp/s3file/s3_file_copied.txt"
+        assert copies[0]["Key"] == "custom/location/tmp/s3file/s3_file_copied.txt"
+        assert copies[0]["CopySource"] == {
+            "Bucket": optimized_storage.bucket.name,
+            "Key": "custom/location/tmp/s3file/s3_file.txt",
+        }
+        assert optimized_storage.open(key).read() == b"s3file"
 
-class TestStorages:
-    url = "/__s3_mock__/"
+    def test_post__save_optimized_gzip(self, optimized_storage, monkeypatch):
+        optimized_storage.bucket.Object("custom/location/tmp/s3file/s3_file.css").put(
+            Body=b"body {}"
+        )
+        optimized_storage.gzip = True
+        monkeypatch.setattr(
+            optimized_storage, "_compress_content", lambda content: content
+        )
+        content = optimized_storage.open("tmp/s3file/s3_file.css")
+        key = optimized_storage._save("tmp/s3file/s3_file_copied.css", content)
 
-    def test_post__save_optimized(self):
-        storage = S3OptimizedMockStorage()
-        obj = storage.bucket.Object("tmp/s3file/s3_file.txt")
+        assert key == "tmp/s3file/s3_file_copied.css"
+        assert optimized_storage.open(key).read() == b"body {}"
 
-        class Content:
-            def __init__(self, obj):
-                self.obj = obj
+    def test_post__save_optimized_fail(self, optimized_storage):
+        with pytest.raises(TypeError) as excinfo:
+            optimized_storage._save(
+                "tmp/s3file/s3_file_copied.txt", ContentFile(b"s3file")
+            )
 
-        content = Content(obj)
-        key = storage._save("tmp/s3file/s3_file_copied.txt", content)
-        stored_object = storage.created_objects[
-            "custom/location/tmp/s3file/s3_file_copied.txt"
-        ]
+        assert "The content object must be a S3 object and contain a valid key." in str(
+            excinfo.value
+        )
+
+    def test_post__save_optimized_bundle(self, optimized_storage, monkeypatch):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w") as zip_file:
+            zip_file.writestr("s3_file.txt", b"s3file")
+            zip_file.writestr("empty.txt", b"")
+        optimized_storage.bucket.Object("custom/location/tmp/s3file/bundle.zip").put(
+            Body=buffer.getvalue()
+        )
+        optimized_storage.deduplicate = "content"
+        monkeypatch.setattr(
+            optimized_storage, "transfer_config", TransferConfig(multipart_chunksize=4)
+        )
+        part_copies = []
+        client = optimized_storage.connection.meta.client
+        upload_part_copy = client.upload_part_copy
+        monkeypatch.setattr(
+            client,
+            "upload_part_copy",
+            lambda **kwargs: part_copies.append(kwargs) or upload_part_copy(**kwargs),
+        )
+        member, empty = open_bundle(
+            "custom/location/tmp/s3file/bundle.zip", optimized_storage
+        )
+        key = optimized_storage._save("tmp/s3file/s3_file_copied.txt", member)
 
         assert key == "tmp/s3file/s3_file_copied.txt"
-        assert stored_object.copy_from_bucket == storage.bucket.name
-        assert stored_object.copy_from_key == "tmp/s3file/s3_file.txt"
-
-    def test_post__save_optimized_gzip(self):
-        storage = S3OptimizedMockStorage()
-        obj = storage.bucket.Object("tmp/s3file/s3_file.css")
-        storage.gzip = True
-
-        class Content:
-            def __init__(self, obj):
-                self.obj = obj
-
-        content = Content(obj)
-        key = storage._save("tmp/s3file/s3_file_copied.css", content)
-        stored_object = storage.created_objects[
-            "custom/location/tmp/s3file/s3_file_copied.css"
+        offset = member.file.data_offset
+        assert [kwargs["CopySourceRange"] for kwargs in part_copies] == [
+            f"bytes={offset}-{offset + 3}",
+            f"bytes={offset + 4}-{offset + 5}",
         ]
+        assert part_copies[0]["CopySource"] == {
+            "Bucket": optimized_storage.bucket.name,
+            "Key": "custom/location/tmp/s3file/bundle.zip",
+        }
+        assert optimized_storage.open(key).read() == b"s3file"
 
-        assert key == "tmp/s3file/s3_file_copied.css"
-        assert stored_object.copy_from_bucket == storage.bucket.name
-        assert stored_object.copy_from_key == "tmp/s3file/s3_file.css"
+        key = optimized_storage._save("tmp/s3file/empty.txt", empty)
+        assert len(part_copies) == 2
+        assert optimized_storage.open(key).read() == b""
 
-    def test_post__save_optimized_fail(self):
-        storage = S3OptimizedMockStorage()
+    def test_post__save_optimized_deduplicate_etag(self, optimized_storage, copies):
+        optimized_storage.deduplicate = "etag"
+        for name, body in [("a.txt", b"s3file"), ("b.txt", b"other")]:
+            optimized_storage.bucket.Object(f"custom/location/tmp/s3file/{name}").put(
+                Body=body
+            )
+        content = optimized_storage.open("tmp/s3file/a.txt")
+        assert optimized_storage._save("saved/a.txt", content) == "saved/a.txt"
+        assert optimized_storage._save("saved/a.txt", content) == "saved/a.txt"
+        assert len(copies) == 1
 
-        with pytest.raises(TypeError) as excinfo:
-            storage._save("tmp/s3file/s3_file_copied.txt", ContentFile(b"s3file"))
+        content = optimized_storage.open("tmp/s3file/b.txt")
+        assert optimized_storage._save("saved/a.txt", content) == "saved/a.txt"
+        assert len(copies) == 2
+        assert optimized_storage.open("saved/a.txt").read() == b"other"
 
-        assert "The content object must be a S3 object and contain a valid key." in str(
-            excinfo.value
+    def test_post__save_optimized_deduplicate_etag__cached(
+        self, optimized_storage, copies
+    ):
+        optimized_storage.deduplicate = "etag"
+        source = optimized_storage.bucket.Object("custom/location/tmp/s3file/c.txt")
+        source.put(Body=b"s3file")
+        content = S3RangeFile(source.key, optimized_storage)
+        assert optimized_storage._save("saved/c.txt", content) == "saved/c.txt"
+
+        # the source is replaced while its metadata is cached
+        source.put(Body=b"other")
+        content = S3RangeFile(source.key, optimized_storage, metadata=content.metadata)
+        assert optimized_storage._save("saved/c.txt", content) == "saved/c.txt"
+        assert len(copies) == 2
+        assert content.size == 5
+        assert optimized_storage.open("saved/c.txt").read() == b"other"
+
+    def test_post__save_optimized_deduplicate_etag__multipart(
+        self, optimized_storage, monkeypatch
+    ):
+        optimized_storage.deduplicate = "etag"
+        monkeypatch.setattr(
+            optimized_storage,
+            "transfer_config",
+            TransferConfig(multipart_threshold=5, multipart_chunksize=5),
+        )
+        optimized_storage.bucket.Object("custom/location/tmp/s3file/m.txt").put(
+            Body=b"s3file"
+        )
+        copies = []
+        client = optimized_storage.connection.meta.client
+        create_multipart_upload = client.create_multipart_upload
+        monkeypatch.setattr(
+            client,
+            "create_multipart_upload",
+            lambda **kwargs: copies.append(kwargs) or create_multipart_upload(**kwargs),
+        )
+        content = optimized_storage.open("tmp/s3file/m.txt")
+        assert optimized_storage._save("saved/m.txt", content) == "saved/m.txt"
+        saved = optimized_storage.bucket.Object("custom/location/saved/m.txt")
+        assert saved.e_tag != content.obj.e_tag
+        assert saved.e_tag.endswith('-2"')
+        assert optimized_storage._save("saved/m.txt", content) == "saved/m.txt"
+        assert len(copies) == 1
+
+    def test_post__save_optimized_deduplicate_content(self, optimized_storage, copies):
+        optimized_storage.deduplicate = "content"
+        files = []
+        for name in ["a.txt", "b.txt"]:
+            key = f"custom/location/tmp/s3file/{name}"
+            optimized_storage.bucket.Object(key).put(Body=b"s3file")
+            files.append(S3RangeFile(key, optimized_storage))
+
+        names = {optimized_storage._save(f"saved/{f.name}", f) for f in files}
+        assert names == {"saved/4d784364b1a95ac3b64c67b9754c584a.txt"}
+        assert len(copies) == 1
+        assert optimized_storage.open(names.pop()).read() == b"s3file"
+
+    def test_post__save_optimized_deduplicate_invalid(self):
+        with pytest.raises(ImproperlyConfigured, match="Invalid deduplicate mode"):
+            S3OptimizedMockStorage(deduplicate="sha256")
+
+    def test_post__save_optimized_deduplicate_setting(self, settings):
+        settings.S3FILE_DEDUPLICATE = "content"
+        assert S3OptimizedMockStorage().deduplicate == "content"
+
+    def test_is_s3_storage_class(self):
+        from django.core.files.storage import FileSystemStorage
+
+        assert storages.is_s3_storage_class(S3OptimizedMockStorage)
+        assert not storages.is_s3_storage_class(FileSystemStorage)
+
+
+class TestS3MockClient:
+    @pytest.fixture
+    def client(self, tmp_path):
+        return storages.S3MockClient(tmp_path)
+
+    def test_put_object(self, client):
+        response = client.put_object(Bucket="test-bucket", Key="a/b.txt", Body=b"s3")
+        assert (
+            response["ETag"]
+            == client.head_object(Bucket="test-bucket", Key="a/b.txt")["ETag"]
+        )
+        assert client.get_object(Bucket="test-bucket", Key="a/b.txt")[
+            "Body"
+        ].read() == (b"s3")
+
+    def test_get_object__if_match(self, client):
+        from botocore.exceptions import ClientError
+
+        etag = client.put_object(Bucket="test-bucket", Key="a.txt", Body=b"s3")["ETag"]
+        response = client.get_object(Bucket="test-bucket", Key="a.txt", IfMatch=etag)
+        assert response["Body"].read() == b"s3"
+        with pytest.raises(ClientError) as e:
+            client.get_object(Bucket="test-bucket", Key="a.txt", IfMatch='"stale"')
+        assert e.value.response["Error"]["Code"] == "PreconditionFailed"
+        assert e.value.response["ResponseMetadata"]["HTTPStatusCode"] == 412
+
+    def test_copy_object(self, client):
+        client.put_object(Bucket="test-bucket", Key="a.txt", Body=b"s3file")
+        response = client.copy_object(
+            Bucket="test-bucket",
+            Key="b/c.txt",
+            CopySource={"Bucket": "test-bucket", "Key": "a.txt"},
+        )
+        assert (
+            response["CopyObjectResult"]["ETag"]
+            == (client.head_object(Bucket="test-bucket", Key="a.txt")["ETag"])
+        )
+        assert client.get_object(Bucket="test-bucket", Key="b/c.txt")[
+            "Body"
+        ].read() == (b"s3file")
+
+    def test_copy_object__not_found(self, client):
+        from botocore.exceptions import ClientError
+
+        with pytest.raises(ClientError, match="CopyObject"):
+            client.copy_object(
+                Bucket="test-bucket", Key="b.txt", CopySource="test-bucket/a.txt"
+            )
+
+    def test_upload_part_copy(self, client):
+        client.put_object(Bucket="test-bucket", Key="a.txt", Body=b"0123456789")
+        upload_id = client.create_multipart_upload(Bucket="test-bucket", Key="b.txt")[
+            "UploadId"
+        ]
+        parts = [
+            {
+                "PartNumber": number,
+                "ETag": client.upload_part_copy(
+                    Bucket="test-bucket",
+                    Key="b.txt",
+                    CopySource="test-bucket/a.txt",
+                    PartNumber=number,
+                    UploadId=upload_id,
+                    CopySourceRange=copy_range,
+                )["CopyPartResult"]["ETag"],
+            }
+            for number, copy_range in [(1, "bytes=0-3"), (2, "bytes=4-9")]
+        ]
+        client.complete_multipart_upload(
+            Bucket="test-bucket",
+            Key="b.txt",
+            UploadId=upload_id,
+            MultipartUpload={"Parts": parts},
+        )
+        assert client.get_object(Bucket="test-bucket", Key="b.txt")["Body"].read() == (
+            b"0123456789"
+        )
+        assert not client._uploads
+
+    def test_upload_part_copy__no_such_upload(self, client):
+        from botocore.exceptions import ClientError
+
+        client.put_object(Bucket="test-bucket", Key="a.txt", Body=b"s3file")
+        with pytest.raises(ClientError, match="NoSuchUpload"):
+            client.upload_part_copy(
+                Bucket="test-bucket",
+                Key="b.txt",
+                CopySource="test-bucket/a.txt",
+                PartNumber=1,
+                UploadId="unknown",
+            )
+
+    @pytest.mark.parametrize(
+        ("threshold", "operation"),
+        [(1024, "upload_part_copy"), (8 * 1024 * 1024, "copy_object")],
+    )
+    def test_copy(self, client, monkeypatch, threshold, operation):
+        from boto3.s3.transfer import TransferConfig
+
+        content = os.urandom(2500)
+        client.put_object(Bucket="test-bucket", Key="a.bin", Body=content)
+        calls = []
+        method = getattr(client, operation)
+        monkeypatch.setattr(
+            client,
+            operation,
+            lambda **kwargs: calls.append(kwargs) or method(**kwargs),
+        )
+        client.copy(
+            {"Bucket": "test-bucket", "Key": "a.bin"},
+            "test-bucket",
+            "b.bin",
+            Config=TransferConfig(
+                multipart_threshold=threshold, multipart_chunksize=1024
+            ),
+        )
+        assert len(calls) == (3 if operation == "upload_part_copy" else 1)
+        assert client.get_object(Bucket="test-bucket", Key="b.bin")["Body"].read() == (
+            content
+        )
+        etag = client.head_object(Bucket="test-bucket", Key="b.bin")["ETag"]
+        if operation == "upload_part_copy":
+            digests = b"".join(
+                hashlib.md5(content[i : i + 1024]).digest()  # noqa: S324
+                for i in range(0, 2500, 1024)
+            )
+            assert etag == f'"{hashlib.md5(digests).hexdigest()}-3"'  # noqa: S324
+        else:
+            assert etag == f'"{hashlib.md5(content).hexdigest()}"'  # noqa: S324
+
+    def test_metadata(self, client):
+        client.put_object(
+            Bucket="test-bucket", Key="a.txt", Body=b"s3", Metadata={"a": "1"}
+        )
+        assert client.head_object(Bucket="test-bucket", Key="a.txt")["Metadata"] == {
+            "a": "1"
+        }
+        client.copy_object(
+            Bucket="test-bucket", Key="b.txt", CopySource="test-bucket/a.txt"
+        )
+        assert client.head_object(Bucket="test-bucket", Key="b.txt")["Metadata"] == {
+            "a": "1"
+        }
+        client.copy_object(
+            Bucket="test-bucket",
+            Key="c.txt",
+            CopySource="test-bucket/a.txt",
+            Metadata={"b": "2"},
+            MetadataDirective="REPLACE",
+        )
+        assert client.head_object(Bucket="test-bucket", Key="c.txt")["Metadata"] == {
+            "b": "2"
+        }
+        assert [
+            obj["Key"]
+            for obj in client.list_objects_v2(Bucket="test-bucket")["Contents"]
+        ] == ["a.txt", "b.txt", "c.txt"]
+
+        client.put_object(Bucket="test-bucket", Key="a.txt", Body=b"new")
+        assert client.head_object(Bucket="test-bucket", Key="a.txt")["Metadata"] == {}
+        client.delete_object(Bucket="test-bucket", Key="b.txt")
+        assert not os.path.exists(client._metadata_path("b.txt"))
+
+
+class TestS3OptimizedMockStorage:
+    def test_end_to_end(self, settings, client, freeze_upload_folder):
+        settings.STORAGES = {
+            **settings.STORAGES,
+            "default": {"BACKEND": "s3file.storages_optimized.S3OptimizedMockStorage"},
+        }
+        assert storages.is_local_dev()
+        from django.core.files.storage import default_storage
+
+        assert storages.get_mock_storage("test-bucket") is default_storage._wrapped
+
+        fields = default_storage.connection.meta.client.generate_presigned_post(
+            "test-bucket",
+            "custom/location/tmp/s3file/${filename}",
+            Conditions=[["starts-with", "$Content-Type", ""]],
+        )["fields"]
+        response = client.post(
+            "/__s3_mock__/",
+            {
+                **fields,
+                "Content-Type": "text/plain",
+                "file": ContentFile(b"s3file", name="s3_file.txt"),
+            },
         )
+        assert response.status_code == 204
+
+        from s3file.middleware import S3FileMiddleware
+
+        (uploaded_file,) = S3FileMiddleware.get_files_from_storage(
+            ["custom/location/tmp/s3file/s3_file.txt"],
+            S3FileMiddleware.sign_s3_key_prefix("custom/location/tmp/s3file"),
+        )
+        name = default_storage.save("saved/s3_file.txt", uploaded_file)
+        assert default_storage.open(name).read() == b"s3file"
+
+
+class TestConfigureClient:
+    def test_configure_client(self, settings):
+        from storages.backends.s3 import S3Storage
+
+        s3_storage = S3Storage(bucket_name="test-bucket")
+        client_config = s3_storage.client_config
+        assert storages.configure_client(s3_storage) is s3_storage
+        assert s3_storage.client_config is client_config
+
+        settings.S3FILE_MAX_POOL_CONNECTIONS = 32
+        settings.S3FILE_TCP_KEEPALIVE = True
+        storages.configure_client(s3_storage)
+        assert s3_storage.client_config.max_pool_connections == 32
+        assert s3_storage.client_config.tcp_keepalive is True
+        assert s3_storage.client_config.signature_version == "s3v4"
+
+    def test_configure_client__reset_connections(self, settings):
+        from storages.backends.s3 import S3Storage
+
+        s3_storage = S3Storage(bucket_name="test-bucket")
+        s3_storage._connections.connection = object()
+        storages.configure_client(s3_storage)
+        assert hasattr(s3_storage._connections, "connection")
+
+        settings.S3FILE_MAX_POOL_CONNECTIONS = 32
+        storages.configure_client(s3_storage)
+        assert not hasattr(s3_storage._connections, "connection")
+
+    def test_configure_client__mock(self, settings):
+        settings.S3FILE_MAX_POOL_CONNECTIONS = 32
+        assert storages.configure_client(storages.storage) is storages.storage
+
+
+class TestWarmUp:
+    def test_warm_up(self, monkeypatch):
+        calls = []
+        client = storages.storage.connection.meta.client
+        monkeypatch.setattr(client, "head_bucket", lambda **kw: calls.append(kw))
+        storages.warm_up()
+        assert calls == [{"Bucket": "test-bucket"}]
+
+    def test_warm_up__alias(self, eu_storage, monkeypatch):
+        calls = []
+        client = eu_storage.connection.meta.client
+        monkeypatch.setattr(client, "head_bucket", lambda **kw: calls.append(kw))
+        storages.warm_up("eu")
+        assert calls == [{"Bucket": "eu-bucket"}]
+
+    def test_warm_up__reset_connections(self, monkeypatch):
+        from storages.backends.s3 import S3Storage
+
+        s3_storage = S3Storage(bucket_name="test-bucket")
+        s3_storage._connections.connection = connection = object()
+        s3_storage._bucket = object()
+        monkeypatch.setattr(storages, "storage", s3_storage)
+        monkeypatch.setattr(
+            S3Storage,
+            "connection",
+            property(lambda self: getattr(self._connections, "connection", None)),
+        )
+        storages.warm_up()
+        assert getattr(s3_storage._connections, "connection", None) is not connection
+
+    def test_warm_up__error(self, monkeypatch, caplog):
+        def head_bucket(**kwargs):
+            raise OSError("Connection refused")
+
+        client = storages.storage.connection.meta.client
+        monkeypatch.setattr(client, "head_bucket", head_bucket)
+        storages.warm_up()
+        assert "Failed to warm up storage None." in caplog.text
+
+    def test_get_warm_up_aliases(self, settings):
+        assert storages.get_warm_up_aliases() == [None]
+        settings.S3FILE_WARM_UP = True
+        assert storages.get_warm_up_aliases() == [None]
+        settings.S3FILE_WARM_UP = False
+        assert storages.get_warm_up_aliases() == []
+        settings.S3FILE_WARM_UP = [None, "eu"]
+        assert storages.get_warm_up_aliases() == [None, "eu"]
+
+    def test_post_worker_init(self, settings, monkeypatch):
+        aliases = []
+        monkeypatch.setattr(storages, "warm_up", lambda *args: aliases.extend(args))
+        settings.S3FILE_WARM_UP = ["eu"]
+        storages.post_worker_init(worker=None)
+        assert aliases == ["eu"]
+
+        settings.S3FILE_WARM_UP = False
+        storages.post_worker_init(worker=None)
+        assert aliases == ["eu"]
@@ -0,0 +1,47 @@
+import logging
+
+from s3file import tasks
+
+calls = []
+
+
+def task(uploads, **kwargs):
+    calls.append((uploads, kwargs))
+
+
+def failing_task(uploads):
+    raise ValueError("boom")
+
+
+class TestThreadPoolExecutor:
+    def test_submit(self):
+        calls.clear()
+        future = tasks.ThreadPoolExecutor().submit(
+            "tests.test_tasks.task", [{"key": "a.txt"}], priority=1
+        )
+        future.result(timeout=5)
+        assert calls == [([{"key": "a.txt"}], {"priority": 1})]
+
+    def test_submit__error(self, caplog):
+        with caplog.at_level(logging.ERROR, logger="s3file.tasks"):
+            tasks.ThreadPoolExecutor().submit(
+                "tests.test_tasks.failing_task", []
+            ).result(timeout=5)
+        assert caplog.messages == ["Task tests.test_tasks.failing_task failed."]
+
+    def test_max_workers(self, settings):
+        settings.S3FILE_EXECUTOR_MAX_WORKERS = 2
+        assert tasks.ThreadPoolExecutor().executor._max_workers == 2
+
+
+class TestEnqueue:
+    def test_default(self):
+        assert isinstance(tasks.get_executor(), tasks.ThreadPoolExecutor)
+
+    def test_enqueue(self, settings):
+        settings.S3FILE_EXECUTOR = "s3file.tasks.ImmediateExecutor"
+        calls.clear()
+        tasks.enqueue("tests.test_tasks.task", [{"key": "a.txt"}])
+        assert calls == [([{"key": "a.txt"}], {})]
+        settings.S3FILE_EXECUTOR = None
+        assert isinstance(tasks.get_executor(), tasks.ThreadPoolExecutor)
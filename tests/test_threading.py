@@ -0,0 +1,99 @@
+import concurrent.futures
+import importlib
+import threading
+import time
+
+from django import forms
+from django.core.files.base import ContentFile
+from django.forms import ClearableFileInput
+from django.utils.functional import empty
+
+from s3file import storages
+from s3file.apps import S3FileConfig
+from s3file.forms import S3FileInputMixin
+from s3file.middleware import S3FileMiddleware
+from s3file.storages import storage
+
+THREADS = 16
+
+
+def run_concurrently(func, *args):
+    """Call the function from many threads at once and return all results."""
+    barrier = threading.Barrier(len(args) or THREADS)
+
+    def call(arg):
+        barrier.wait()
+        return func(arg)
+
+    with concurrent.futures.ThreadPoolExecutor(barrier.parties) as executor:
+        return list(executor.map(call, args or range(THREADS)))
+
+
+class TestThreadSafety:
+    def test_build_attrs(self):
+        widget = ClearableFileInput()
+        results = run_concurrently(lambda _: widget.build_attrs({}))
+        upload_folder = widget.upload_folder
+        for attrs in results:
+            assert attrs["data-fields-key"] == f"{upload_folder}/${{filename}}"
+            assert attrs["data-s3f-signature"] == S3FileMiddleware.sign_s3_key_prefix(
+                upload_folder
+            )
+
+    def test_build_attrs__widgets(self):
+        widgets = [ClearableFileInput() for _ in range(THREADS)]
+        results = run_concurrently(lambda widget: widget.build_attrs({}), *widgets)
+        assert len({attrs["data-fields-key"] for attrs in results}) == THREADS
+        for widget, attrs in zip(widgets, results):
+            assert attrs["data-s3f-signature"] == S3FileMiddleware.sign_s3_key_prefix(
+                widget.upload_folder
+            )
+
+    def test_middleware(self, freeze_upload_folder, rf):
+        requests = []
+        for i in range(THREADS):
+            name = storage.save(
+                f"tmp/s3file/thread_{i}.txt", ContentFile(f"thread {i}".encode())
+            )
+            requests.append(
+                rf.post(
+                    "/",
+                    data={
+                        "file": f"custom/location/{name}",
+                        "s3file": "file",
+                        "file-s3f-signature": (
+                            "VRIPlI1LCjUh1EtplrgxQrG8gSAaIwT48mMRlwaCytI"
+                        ),
+                    },
+                )
+            )
+
+        def process(request):
+            S3FileMiddleware(lambda x: None)(request)
+            return request.FILES["file"].read()
+
+        assert run_concurrently(process, *requests) == [
+            f"thread {i}".encode() for i in range(THREADS)
+        ]
+
+    def test_storage(self, monkeypatch):
+        calls = []
+
+        def setup():
+            calls.append(True)
+            time.sleep(0.01)
+            return object()
+
+        monkeypatch.setitem(storage.__dict__, "_setupfunc", setup)
+        monkeypatch.setitem(storage.__dict__, "_wrapped", empty)
+        try:
+            results = run_concurrently(lambda _: storage.__class__)
+            assert calls == [True]
+            assert set(results) == {object}
+        finally:
+            storages.reset_storage(setting="STORAGES")
+
+    def test_ready(self):
+        app = S3FileConfig("s3file", importlib.import_module("tests.testapp"))
+        run_concurrently(lambda _: app.ready())
+        assert forms.ClearableFileInput.__bases__.count(S3FileInputMixin) == 1
@@ -0,0 +1,82 @@
+import pytest
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+
+from s3file.files import S3RangeFile, get_metadata
+from s3file.storages import storage
+from s3file.validators import ContentTypeValidator, MaxSizeValidator
+
+
+@pytest.fixture
+def s3_file(get_object_calls):
+    name = storage.save("tmp/s3file/video.mp4", ContentFile(b"x" * 2048))
+    return S3RangeFile(f"custom/location/{name}", storage)
+
+
+def test_get_metadata__s3_file(s3_file, get_object_calls):
+    metadata = get_metadata(s3_file)
+    assert metadata["ContentLength"] == 2048
+    assert metadata["ContentType"] == "video/mp4"
+    assert not get_object_calls
+
+
+def test_get_metadata__uploaded_file():
+    f = SimpleUploadedFile("video.mp4", b"data", content_type="video/mp4")
+    assert get_metadata(f) == {"ContentLength": 4, "ContentType": "video/mp4"}
+
+
+def test_get_metadata__storage_file():
+    name = storage.save("tmp/s3file/image.png", ContentFile(b"data"))
+    with storage.open(name) as f:
+        assert get_metadata(f) == {"ContentLength": 4, "ContentType": "image/png"}
+
+
+def test_get_metadata__field_file(filemodel):
+    assert get_metadata(filemodel.file) == {
+        "ContentLength": len("test_get_metadata__field_file"),
+        "ContentType": "text/plain",
+    }
+
+
+class TestMaxSizeValidator:
+    def test_call(self, s3_file, get_object_calls):
+        MaxSizeValidator(2048)(s3_file)
+        with pytest.raises(ValidationError) as e:
+            MaxSizeValidator(1024)(s3_file)
+        assert e.value.code == "max_size"
+        assert e.value.messages == [
+            "Ensure this file is not larger than 1.0\xa0KB (it is 2.0\xa0KB)."
+        ]
+        assert not get_object_calls
+
+    def test_eq(self):
+        assert MaxSizeValidator(1024) == MaxSizeValidator(1024)
+        assert MaxSizeValidator(1024) != MaxSizeValidator(2048)
+        assert MaxSizeValidator(1024) != MaxSizeValidator(1024, code="too_big")
+
+
+class TestContentTypeValidator:
+    def test_call(self, s3_file, get_object_calls):
+        ContentTypeValidator(["video/mp4"])(s3_file)
+        ContentTypeValidator(["image/png", "video/*"])(s3_file)
+        with pytest.raises(ValidationError) as e:
+            ContentTypeValidator(["image/*", "video/webm"])(s3_file)
+        assert e.value.code == "invalid_content_type"
+        assert e.value.messages == [
+            "File type “video/mp4” is not allowed."
+            " Allowed types are: image/*, video/webm."
+        ]
+        assert not get_object_calls
+
+    def test_call__unknown(self):
+        f = SimpleUploadedFile("file", b"data", content_type=None)
+        with pytest.raises(ValidationError):
+            ContentTypeValidator(["image/*"])(f)
+
+    def test_eq(self):
+        assert ContentTypeValidator(["image/*", "video/mp4"]) == ContentTypeValidator([
+            "video/mp4",
+            "IMAGE/*",
+        ])
+        assert ContentTypeValidator(["image/*"]) != ContentTypeValidator(["video/*"])
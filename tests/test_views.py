@@ -1,77 +1,438 @@
 import base64
+import datetime
+import hashlib
 import hmac
 import http
+import json
+import types
 
-from s3file import views
+import pytest
+from django.contrib.auth.models import AnonymousUser
+from django.core.files.uploadedfile import SimpleUploadedFile, TemporaryUploadedFile
+
+from s3file import metrics, telemetry, views
+from s3file.middleware import S3FileMiddleware
+from s3file.storages import storage
 
 
 class TestS3MockView:
     url = "/__s3_mock__/"
 
-    policy = (
-        "eyJDb25kaXRpb25zIjogW3siYnVja2V0IjogInRlc3QtYnVja2V0In0sIFsic3RhcnRz"
-        "LXdpdGgiLCAiJGtleSIsICJ0bXAvczNmaWxlLzNlUWhwOTZYU1dldFFwZ1VVQmZzWHci"
-        "XSwgeyJzdWNjZXNzX2FjdGlvbl9zdGF0dXMiOiAiMjAxIn0sIFsic3RhcnRzLXdpdGgi"
-        "LCAiJENvbnRlbnQtVHlwZSIsICIiXV0sICJFeHBpcmVzSW4iOiAxMjA5NjAwfQ=="
-    )
-    date = "20190616T184210Z"
+    def get_fields(self, conditions=None, expires_in=600):
+        return storage.connection.meta.client.generate_presigned_post(
+            "test-bucket",
+            "tmp/s3file/3eQhp96XSWetQpgUUBfsXw/${filename}",
+            Conditions=[
+                {"bucket": "test-bucket"},
+                ["starts-with", "$key", "tmp/s3file/3eQhp96XSWetQpgUUBfsXw"],
+                {"success_action_status": "201"},
+                ["starts-with", "$Content-Type", ""],
+                *(conditions or []),
+            ],
+            ExpiresIn=expires_in,
+        )["fields"]
+
+    def post(self, client, fields=None, content=b"s3file", **data):
+        return client.post(
+            self.url,
+            data={
+                **(self.get_fields() if fields is None else fields),
+                "success_action_status": "201",
+                "Content-Type": "text/plain",
+                **data,
+                "file": SimpleUploadedFile("s3_file.txt", content),
+            },
+        )
 
     def test_post__bad_request(self, rf):
         request = rf.post(self.url, data={})
         response = views.S3MockView.as_view()(request)
         assert response.status_code == http.HTTPStatus.BAD_REQUEST
+        assert b"<Code>InvalidArgument</Code>" in response.content
+        assert b"must contain a field named 'key'" in response.content
 
-    def test_post__created(self, client, upload_file):
-        with open(upload_file) as fp:
-            response = client.post(
-                self.url,
-                data={
-                    "x-amz-signature": "T1Mb71D45h1u2SBoUHOMBNFCI2AgrKAg1UzKdUHUHig=",
-                    "x-amz-algorithm": "AWS4-HMAC-SHA256",
-                    "x-amz-date": self.date,
-                    "x-amz-credential": "testaccessid",
-                    "policy": self.policy,
-                    "key": "tmp/s3file/3eQhp96XSWetQpgUUBfsXw/${filename}",
-                    "success_action_status": "201",
-                    "file": fp,
-                },
-            )
+    def test_post__created(self, client):
+        response = self.post(client)
+        assert response.status_code == http.HTTPStatus.CREATED
+        assert response["Content-Type"] == "application/xml"
+        content = response.content.decode()
+        assert "<Bucket>test-bucket</Bucket>" in content
+        assert "<Key>tmp/s3file/3eQhp96XSWetQpgUUBfsXw/s3_file" in content
+        assert f'<ETag>"{hashlib.md5(b"s3file").hexdigest()}"</ETag>' in content  # noqa: S324
+
+    def test_post__no_content(self, client):
+        fields = storage.connection.meta.client.generate_presigned_post(
+            "test-bucket", "tmp/s3file/3eQhp96XSWetQpgUUBfsXw/${filename}"
+        )["fields"]
+        response = client.post(
+            self.url,
+            data={**fields, "file": SimpleUploadedFile("s3_file.txt", b"s3file")},
+        )
+        assert response.status_code == http.HTTPStatus.NO_CONTENT
+        assert response["ETag"] == f'"{hashlib.md5(b"s3file").hexdigest()}"'  # noqa: S324
+
+    def test_post__chunks(self, rf, settings, monkeypatch):
+        settings.FILE_UPLOAD_MAX_MEMORY_SIZE = 0
+        request = rf.post(
+            self.url,
+            data={
+                **self.get_fields(),
+                "success_action_status": "201",
+                "file": SimpleUploadedFile("s3_file.txt", b"s3file"),
+            },
+        )
+
+        def read(self, size=-1):
+            assert size > 0, "The upload must not be read at once."
+            return self.file.read(size)
+
+        monkeypatch.setattr(TemporaryUploadedFile, "read", read)
+        response = views.S3MockView.as_view()(request)
+        request.FILES["file"].close()
         assert response.status_code == http.HTTPStatus.CREATED
 
-    def test_post__bad_signature(self, client, upload_file):
+    def test_post__bad_signature(self, client):
+        fields = self.get_fields()
         bad_signature = base64.b64encode(
-            hmac.new(b"eve", (self.policy + self.date).encode(), "sha256").digest()
+            hmac.new(
+                b"eve", (fields["policy"] + fields["x-amz-date"]).encode(), "sha256"
+            ).digest()
         ).decode()
-        with open(upload_file) as fp:
-            response = client.post(
-                self.url,
-                data={
-                    "x-amz-signature": bad_signature,
-                    "x-amz-algorithm": "AWS4-HMAC-SHA256",
-                    "x-amz-date": self.date,
-                    "x-amz-credential": "testaccessid",
-                    "policy": self.policy,
-                    "key": "tmp/s3file/3eQhp96XSWetQpgUUBfsXw/${filename}",
-                    "success_action_status": "201",
-                    "file": fp,
-                },
-            )
+        response = self.post(
+            client, fields={**fields, "x-amz-signature": bad_signature}
+        )
+        assert response.status_code == http.HTTPStatus.FORBIDDEN
+        assert b"<Code>SignatureDoesNotMatch</Code>" in response.content
+
+    def test_post__not_a_signature(self, client):
+        response = self.post(
+            client, fields={**self.get_fields(), "x-amz-signature": "eve"}
+        )
+        assert response.status_code == http.HTTPStatus.BAD_REQUEST
+        assert b"<Code>InvalidPolicyDocument</Code>" in response.content
+
+    def test_post__expired(self, client):
+        response = self.post(client, fields=self.get_fields(expires_in=-1))
+        assert response.status_code == http.HTTPStatus.FORBIDDEN
+        assert b"<Code>AccessDenied</Code>" in response.content
+        assert b"Invalid according to Policy: Policy expired." in response.content
+
+    def test_post__key(self, client):
+        response = self.post(client, key="tmp/s3file/other/${filename}")
         assert response.status_code == http.HTTPStatus.FORBIDDEN
+        assert (
+            b'Policy Condition failed: ["starts-with", "$key", '
+            b'"tmp/s3file/3eQhp96XSWetQpgUUBfsXw"]' in response.content
+        )
+
+    @pytest.mark.parametrize(
+        ("condition", "content_type", "status"),
+        [
+            ({"Content-Type": "image/png"}, "image/png", http.HTTPStatus.CREATED),
+            ({"Content-Type": "image/png"}, "text/plain", http.HTTPStatus.FORBIDDEN),
+            (["starts-with", "$Content-Type", "image/"], "image/png", 201),
+            (["starts-with", "$Content-Type", "image/"], "text/plain", 403),
+            (["eq", "$Content-Type", "image/png"], "image/png", 201),
+        ],
+    )
+    def test_post__content_type(self, client, condition, content_type, status):
+        response = self.post(
+            client,
+            fields=self.get_fields(conditions=[condition]),
+            **{"Content-Type": content_type},
+        )
+        assert response.status_code == status
+
+    @pytest.mark.parametrize(
+        ("size", "status", "code"),
+        [
+            (5, http.HTTPStatus.BAD_REQUEST, b"EntityTooSmall"),
+            (10, http.HTTPStatus.CREATED, None),
+            (20, http.HTTPStatus.CREATED, None),
+            (21, http.HTTPStatus.BAD_REQUEST, b"EntityTooLarge"),
+        ],
+    )
+    def test_post__content_length_range(self, client, size, status, code):
+        response = self.post(
+            client,
+            fields=self.get_fields(conditions=[["content-length-range", 10, 20]]),
+            content=b"x" * size,
+        )
+        assert response.status_code == status
+        if code:
+            assert b"<Code>" + code + b"</Code>" in response.content
+            assert f"<ProposedSize>{size}</ProposedSize>".encode() in response.content
+
+    def test_post__extra_input_fields(self, client):
+        response = self.post(client, acl="public-read")
+        assert response.status_code == http.HTTPStatus.FORBIDDEN
+        assert b"Extra input fields: acl" in response.content
+
+        response = self.post(client, **{"x-ignore-acl": "public-read"})
+        assert response.status_code == http.HTTPStatus.CREATED
+
+    def test_post__invalid_condition(self, client):
+        response = self.post(
+            client, fields=self.get_fields(conditions=[["ends-with", "$key", "txt"]])
+        )
+        assert response.status_code == http.HTTPStatus.BAD_REQUEST
+        assert b"Invalid Policy: Invalid Condition." in response.content
+
+    def test_generate_presigned_post(self):
+        fields = self.get_fields()
+        policy = json.loads(base64.b64decode(fields["policy"]))
+        expiration = datetime.datetime.strptime(
+            policy["expiration"], "%Y-%m-%dT%H:%M:%S%z"
+        )
+        assert expiration > datetime.datetime.now(tz=datetime.UTC)
+        assert [
+            "starts-with",
+            "$key",
+            "tmp/s3file/3eQhp96XSWetQpgUUBfsXw/",
+        ] in policy["conditions"]
+        assert {"x-amz-date": fields["x-amz-date"]} in policy["conditions"]
+
+
+class TestTelemetryView:
+    url = "/s3file/telemetry/"
+
+    @pytest.fixture
+    def beacon(self):
+        return {
+            "correlationId": "8f5e2c1a",
+            "duration": 1500,
+            "uploads": [
+                {
+                    "field": "file",
+                    "size": 1024,
+                    "ttfb": 50,
+                    "duration": 1000,
+                    "status": 201,
+                    "error": None,
+                },
+                {
+                    "field": "file",
+                    "size": 2048,
+                    "ttfb": None,
+                    "duration": 250,
+                    "status": 403,
+                    "error": "Forbidden",
+                },
+            ],
+        }
+
+    @pytest.fixture
+    def registry(self, settings):
+        settings.S3FILE_TELEMETRY = True
+        settings.S3FILE_METRICS_BACKEND = "s3file.metrics.RegistryBackend"
+        return metrics.get_backend()
+
+    def test_post(self, client, beacon, registry):
+        response = client.post(self.url, beacon, content_type="application/json")
+        assert response.status_code == http.HTTPStatus.NO_CONTENT
+        assert registry.samples[("upload", (("status", "2xx"),))] == {
+            "count": 1,
+            "sum": 1.0,
+            "files": 0,
+            "bytes": 1024,
+        }
+        assert registry.samples[("upload_ttfb", (("status", "2xx"),))][
+            "sum"
+        ] == pytest.approx(0.05)
+        assert (
+            "upload",
+            (("error", "rejected"), ("status", "4xx")),
+        ) in registry.samples
+        assert registry.samples[("submission", (("error", "rejected"),))] == {
+            "count": 1,
+            "sum": 1.5,
+            "files": 2,
+            "bytes": 3072,
+        }
+
+    def test_post__label_cardinality(self, client, registry):
+        beacon = {
+            "correlationId": "8f5e2c1a",
+            "duration": 1500,
+            "uploads": [
+                {
+                    "field": f"field-{i}",
+                    "size": 1,
+                    "ttfb": None,
+                    "duration": 1,
+                    "status": status,
+                    "error": f"error-{i}",
+                }
+                for i, status in enumerate([0, 302, 403, 503, 999] * 100)
+            ],
+        }
+        client.post(self.url, beacon, content_type="application/json")
+        assert sorted(registry.samples) == [
+            ("submission", (("error", "network"),)),
+            ("upload", (("error", "network"), ("status", "0"))),
+            ("upload", (("error", "other"), ("status", "3xx"))),
+            ("upload", (("error", "rejected"), ("status", "4xx"))),
+            ("upload", (("error", "server"), ("status", "5xx"))),
+        ]
+
+    def test_post__disabled(self, client, beacon):
+        response = client.post(self.url, beacon, content_type="application/json")
+        assert response.status_code == http.HTTPStatus.NOT_FOUND
+
+    @pytest.mark.parametrize(
+        "data",
+        [
+            "not json",
+            {},
+            {"correlationId": "1", "duration": 1, "uploads": {}},
+            {"correlationId": "1", "duration": -1, "uploads": []},
+            {"correlationId": "1", "duration": True, "uploads": []},
+            {"correlationId": "1", "duration": 1, "uploads": [{"size": 1}]},
+            {
+                "correlationId": "1",
+                "duration": 1,
+                "uploads": [{"field": "f", "size": -1, "duration": 1, "status": 201}],
+            },
+            {
+                "correlationId": "1",
+                "duration": 1,
+                "uploads": [
+                    {"field": "f", "size": 1, "duration": 1, "status": float("inf")}
+                ],
+            },
+            {
+                "correlationId": "1",
+                "duration": 1,
+                "uploads": [{"field": "f", "size": 1, "duration": 1, "status": 201.5}],
+            },
+            {
+                "correlationId": "1",
+                "duration": 1,
+                "uploads": [{"field": "f", "size": 1, "duration": 1, "status": "201"}],
+            },
+            {
+                "correlationId": "1",
+                "duration": 1,
+                "uploads": [{"field": "f", "size": 1, "duration": 1, "status": True}],
+            },
+        ],
+    )
+    def test_post__bad_request(self, client, registry, data):
+        response = client.post(self.url, data, content_type="application/json")
+        assert response.status_code == http.HTTPStatus.BAD_REQUEST
+        assert not registry.samples
+
+    def test_post__sink(self, client, beacon, settings, monkeypatch):
+        settings.S3FILE_TELEMETRY = True
+        settings.S3FILE_TELEMETRY_SINK = "s3file.telemetry.BaseSink"
+        calls = []
+        monkeypatch.setattr(
+            telemetry.BaseSink, "record", lambda self, *args: calls.append(args)
+        )
+        client.post(self.url, beacon, content_type="application/json")
+        correlation_id, duration, uploads = calls[0]
+        assert correlation_id == "8f5e2c1a"
+        assert duration == 1.5
+        assert uploads[1] == {
+            "field": "file",
+            "size": 2048,
+            "ttfb": None,
+            "duration": 0.25,
+            "status": 403,
+            "error": "Forbidden",
+        }
+
+
+class TestPresignView:
+    url = "/s3file/presign/"
+
+    @pytest.fixture(autouse=True)
+    def permission(self, monkeypatch):
+        monkeypatch.setattr(
+            views.PresignView, "has_permission", lambda self, request: True
+        )
+
+    def test_post(self, client, rf):
+        response = client.post(
+            self.url,
+            {"files": [{"name": "avatar.jpg"}, {"name": "../cover.jpg"}]},
+            content_type="application/json",
+        )
+        assert response.status_code == http.HTTPStatus.OK
+        data = response.json()
+        assert data["url"] == "/__s3_mock__/"
+        assert {"policy", "x-amz-signature", "key"} <= data["fields"].keys()
+        assert [file["name"] for file in data["files"]] == ["avatar.jpg", "cover.jpg"]
 
-    def test_post__not_a_signature(self, client, upload_file):
-        bad_signature = "eve"
-        with open(upload_file) as fp:
-            response = client.post(
-                self.url,
-                data={
-                    "x-amz-signature": bad_signature,
-                    "x-amz-algorithm": "AWS4-HMAC-SHA256",
-                    "x-amz-date": self.date,
-                    "x-amz-credential": "testaccessid",
-                    "policy": self.policy,
-                    "key": "tmp/s3file/3eQhp96XSWetQpgUUBfsXw/${filename}",
+        # upload the files like a mobile client and submit the keys as JSON
+        keys = []
+        for file in data["files"]:
+            upload = client.post(
+                data["url"],
+                {
+                    **data["fields"],
+                    "key": file["key"],
                     "success_action_status": "201",
-                    "file": fp,
+                    "file": SimpleUploadedFile(file["name"], b"s3file"),
                 },
             )
+            assert upload.status_code == http.HTTPStatus.CREATED
+            keys.append(file["key"])
+        request = rf.post(
+            "/",
+            {"s3file": ["file"], "file": keys, "file-s3f-signature": data["signature"]},
+            content_type="application/json",
+            headers={"X-S3File": "1"},
+        )
+        S3FileMiddleware(lambda r: None)(request)
+        assert [f.name for f in request.FILES.getlist("file")] == [
+            "avatar.jpg",
+            "cover.jpg",
+        ]
+
+    def test_post__max_size(self, client, monkeypatch):
+        response = client.post(
+            self.url, {"files": [{"name": "a.txt"}]}, content_type="application/json"
+        )
+        policy = json.loads(base64.b64decode(response.json()["fields"]["policy"]))
+        assert ["content-length-range", 0, 10 * 2**20] in policy["conditions"]
+
+        monkeypatch.setattr(views.PresignView, "max_size", 1024)
+        response = client.post(
+            self.url, {"files": [{"name": "a.txt"}]}, content_type="application/json"
+        )
+        policy = json.loads(base64.b64decode(response.json()["fields"]["policy"]))
+        assert ["content-length-range", 0, 1024] in policy["conditions"]
+
+    def test_post__permission_denied(self, client, monkeypatch):
+        monkeypatch.undo()
+        response = client.post(
+            self.url, {"files": [{"name": "a.txt"}]}, content_type="application/json"
+        )
+        assert response.status_code == http.HTTPStatus.FORBIDDEN
+        assert response.json() == {"error": "Permission denied."}
+
+    def test_has_permission(self, rf, monkeypatch):
+        monkeypatch.undo()
+        request = rf.post(self.url)
+        request.user = AnonymousUser()
+        assert not views.PresignView().has_permission(request)
+        request.user = types.SimpleNamespace(is_authenticated=True)
+        assert views.PresignView().has_permission(request)
+
+    @pytest.mark.parametrize(
+        "data",
+        [
+            "not json",
+            {},
+            {"files": ["a.txt"]},
+            {"files": []},
+            {"files": [{"name": f"{i}.txt"} for i in range(101)]},
+            {"files": [{"name": "a.txt"}, {"name": "a.txt"}]},
+            {"files": [{"name": ""}]},
+        ],
+    )
+    def test_post__bad_request(self, client, data):
+        response = client.post(self.url, data, content_type="application/json")
         assert response.status_code == http.HTTPStatus.BAD_REQUEST
+        assert "error" in response.json()
@@ -0,0 +1,5 @@
+def geo_router(request):
+    """Route uploads to a bucket close to the user's region."""
+    if request.headers.get("CloudFront-Viewer-Country-Region") == "EU":
+        return "eu"
+    return None
@@ -18,4 +18,5 @@ urlpatterns = [
         ]),
     ),
     path("multi/", views.MultiExampleFormView.as_view(), name="upload-multi"),
+    path("s3file/", include("s3file.urls")),
 ]